@@ -13,6 +13,7 @@ sys.path.append(str(project_root))
 from datetime import timedelta
 import pendulum  # Provides enhanced date and time manipulation
 from airflow.operators.dummy_operator import DummyOperator  # For placeholder start and end tasks
+from airflow.operators.python import PythonOperator  # For the table cache cleanup task
 from airflow.utils.task_group import TaskGroup  # Helps group related tasks logically
 # Import custom task groups from external modules
 from taskgroup.ingestion_group import (dependent_ingestion_group, independent_ingestion_group)
@@ -21,6 +22,7 @@ from taskgroup.table_group import (create_database_schema, create_table_group, l
                                    load_fact_group, load_transformation_group)
 from taskgroup.transformation_group import transformation_group
 from taskgroup.data_quality import (initialize_expectation_suites, dimension_check_group, fact_check_group)
+from transformations.table_cache import cleanup_table_cache
 
 # Define default arguments for the DAG such as retries, owner, and email notifications
 default_args = {
@@ -49,6 +51,8 @@ with DAG(
     # Define start and end tasks using DummyOperator as placeholders
     start_operator = DummyOperator(task_id='Start_execution')
     end_operator = DummyOperator(task_id='Stop_execution')
+    # Remove the tables spilled by this run, also when the run failed
+    cleanup_cache = PythonOperator(task_id='Cleanup_table_cache', python_callable=cleanup_table_cache, trigger_rule='all_done')
 
     # Create tasks for schema creation, data quality checks, and data ingestion
     create_schema = create_database_schema(dag, schema=database_schema)  # Create the database schema
@@ -72,4 +76,4 @@ with DAG(
     create_schema >> create_table >> \
     load_dimension >> dimension_checks >> \
     load_fact >> fact_checks \
-    >> load_transformation >> end_operator
+    >> load_transformation >> end_operator >> cleanup_cache
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from ingestion.artist_genre_bridge import build_artist_genre_bridge
+
+
+def synthetic_tables(artists, genres=2000, seed=42):
+    """
+    Builds an artists table with 0 to 5 genres per artist, drawn from a skewed genre pool as on
+    Spotify, and the matching genres table. A few genres are left out of the genres table.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"genre {i}" for i in range(genres)], dtype=object)
+    weights = 1 / np.arange(1, genres + 1)
+    weights /= weights.sum()
+
+    counts = rng.integers(0, 6, size=artists)
+    pool = rng.choice(names, size=counts.sum(), p=weights)
+    artist_genres = np.split(pool, np.cumsum(counts)[:-1])
+
+    artists_df = pd.DataFrame({'artist_id': [f"artist{i}" for i in range(artists)], 'genres': artist_genres})
+    genres_df = pd.DataFrame({'genre_id': np.arange(1, genres - 9), 'genre': names[:genres - 10]})
+    return artists_df, genres_df
+
+
+def legacy_bridge(artists_df, genres_df):
+    # The loop ArtistGenreBridge used before the vectorized build
+    bridge = []
+    for _, row in artists_df.iterrows():
+        for genre in row['genres']:
+            bridge.append({'artist_id': row['artist_id'], 'genre': genre})
+    artists_genre_df = pd.DataFrame(bridge)
+    bridge_df = artists_genre_df.merge(genres_df, how="inner", on="genre")
+    bridge_df = bridge_df[['artist_id', 'genre_id']]
+    bridge_df.drop_duplicates(inplace=True)
+    bridge_df = bridge_df.dropna()
+    bridge_df.reset_index(drop=True, inplace=True)
+    return bridge_df
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def run_benchmark(sizes, legacy_limit):
+    print(f"{'artists':>10}{'bridge rows':>13}{'loop s':>10}{'vectorized s':>14}{'speedup':>10}")
+    for size in sizes:
+        artists_df, genres_df = synthetic_tables(size)
+        vectorized_seconds, bridge_df = timed(lambda: build_artist_genre_bridge(artists_df, genres_df))
+
+        if size > legacy_limit:
+            print(f"{size:>10}{len(bridge_df):>13}{'skipped':>10}{vectorized_seconds:>14.3f}{'':>10}")
+            continue
+
+        legacy_seconds, legacy_df = timed(lambda: legacy_bridge(artists_df, genres_df))
+        # Same pairs, the vectorized bridge keeps them in artist order
+        pd.testing.assert_frame_equal(
+            legacy_df.sort_values(['artist_id', 'genre_id'], ignore_index=True),
+            bridge_df.sort_values(['artist_id', 'genre_id'], ignore_index=True),
+        )
+        print(f"{size:>10}{len(bridge_df):>13}{legacy_seconds:>10.3f}{vectorized_seconds:>14.3f}"
+              f"{legacy_seconds / vectorized_seconds:>9.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Artist-genre bridge: iterrows loop vs vectorized explode and categorical codes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=1_000_000, help="Largest size the slow loop is run for")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.legacy_limit)
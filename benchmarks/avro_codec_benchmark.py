@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import avro.io
+from avro.io import DatumReader, DatumWriter
+from avro.schema import parse
+
+from common_utility_functions.avro_codec import AvroCodec, read_container, write_container
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schemas')
+
+
+def random_datum(schema, rng):
+    """
+    Builds a random Python object that is valid for the given Avro schema.
+    Arrays and maps get a few entries so nested records are exercised.
+    """
+    schema_type = schema.type
+    if schema_type == 'null':
+        return None
+    if schema_type == 'boolean':
+        return rng.random() < 0.5
+    if schema_type == 'string':
+        return ''.join(rng.choice(string.ascii_letters) for _ in range(rng.randint(5, 30)))
+    if schema_type == 'bytes':
+        return os.urandom(rng.randint(1, 16))
+    if schema_type in ('int', 'long'):
+        return rng.randint(0, 2_000_000)
+    if schema_type in ('float', 'double'):
+        return float(rng.randint(0, 1000))
+    if schema_type == 'fixed':
+        return os.urandom(schema.size)
+    if schema_type == 'enum':
+        return rng.choice(schema.symbols)
+    if schema_type == 'array':
+        return [random_datum(schema.items, rng) for _ in range(rng.randint(1, 3))]
+    if schema_type == 'map':
+        return {f"key{i}": random_datum(schema.values, rng) for i in range(rng.randint(1, 3))}
+    if schema_type == 'union':
+        return random_datum(rng.choice(schema.schemas), rng)
+    if schema_type in ('record', 'error'):
+        return {field.name: random_datum(field.type, rng) for field in schema.fields}
+    raise ValueError(f"Unsupported schema type: {schema_type}")
+
+
+def legacy_encode(datum, schema):
+    # The serializer path used by SpotifyKafkaProducer before the codec was introduced
+    writer = DatumWriter(schema)
+    bytes_writer = io.BytesIO()
+    encoder = avro.io.BinaryEncoder(bytes_writer)
+    writer.write(datum, encoder)
+    return bytes_writer.getvalue()
+
+
+def legacy_decode(avro_bytes, schema):
+    # The deserializer path used by BaseKafkaConsumer before the codec was introduced
+    reader = DatumReader(schema)
+    bytes_reader = io.BytesIO(avro_bytes)
+    decoder = avro.io.BinaryDecoder(bytes_reader)
+    return reader.read(decoder)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def run_benchmark(records_per_schema=2000, seed=42):
+    rng = random.Random(seed)
+    print(f"{'schema':<24}{'bytes':>8}{'legacy enc':>12}{'codec enc':>12}{'speedup':>9}"
+          f"{'legacy dec':>12}{'codec dec':>12}{'speedup':>9}")
+
+    for schema_file in sorted(f for f in os.listdir(SCHEMA_DIR) if f.endswith('.avsc')):
+        with open(os.path.join(SCHEMA_DIR, schema_file), 'rb') as f:
+            schema = parse(f.read())
+        codec = AvroCodec(schema)
+        data = [random_datum(schema, rng) for _ in range(records_per_schema)]
+
+        legacy_enc, legacy_bytes = timed(lambda: [legacy_encode(d, schema) for d in data])
+        codec_enc, codec_bytes = timed(lambda: codec.encode_many(data))
+        assert legacy_bytes == codec_bytes, f"Encoded bytes differ for {schema_file}"
+
+        legacy_dec, legacy_data = timed(lambda: [legacy_decode(b, schema) for b in legacy_bytes])
+        codec_dec, codec_data = timed(lambda: codec.decode_many(codec_bytes))
+        assert legacy_data == codec_data, f"Decoded records differ for {schema_file}"
+
+        avg_size = sum(len(b) for b in codec_bytes) // len(codec_bytes)
+        print(f"{schema_file:<24}{avg_size:>8}{legacy_enc:>11.3f}s{codec_enc:>11.3f}s{legacy_enc / codec_enc:>8.1f}x"
+              f"{legacy_dec:>11.3f}s{codec_dec:>11.3f}s{legacy_dec / codec_dec:>8.1f}x")
+
+
+def run_container_benchmark(records_per_batch=500, seed=42):
+    # Raw zone objects: a JSON document per batch versus an Avro container file per batch
+    rng = random.Random(seed)
+    print(f"\n{'schema':<24}{'json size':>12}{'avro size':>12}{'ratio':>7}{'json read':>12}{'avro read':>12}{'speedup':>9}")
+
+    for schema_file in sorted(f for f in os.listdir(SCHEMA_DIR) if f.endswith('.avsc')):
+        with open(os.path.join(SCHEMA_DIR, schema_file), 'rb') as f:
+            schema = parse(f.read())
+        data = [random_datum(schema, rng) for _ in range(records_per_batch)]
+        if any(isinstance(v, bytes) for d in data for v in (d.values() if isinstance(d, dict) else [])):
+            continue  # JSON cannot hold bytes fields
+
+        json_object = json.dumps(data).encode('utf-8')
+        avro_object = write_container(schema, AvroCodec(schema).encode_many(data))
+        read_container(avro_object)  # Compile the reader codec outside of the timing, as for every later object
+
+        json_read, json_data = timed(lambda: json.loads(json_object))
+        avro_read, avro_data = timed(lambda: read_container(avro_object))
+        assert json_data == avro_data, f"Container records differ for {schema_file}"
+
+        print(f"{schema_file:<24}{len(json_object):>12}{len(avro_object):>12}{len(json_object) / len(avro_object):>6.1f}x"
+              f"{json_read:>11.3f}s{avro_read:>11.3f}s{json_read / avro_read:>8.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+    run_container_benchmark()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from ingestion.get_recent_plays import RetrieveRecentPlays
+from ingestion.streaming import CHUNK_SIZE, iter_column_chunks
+from ingestion.utils import TOPIC_CONFIG
+
+
+def random_play(rng, i):
+    # A recently played item with the fields the recent plays table reads, plus some it ignores
+    artist = {'id': f"artist{rng.randrange(500)}", 'name': f"Artist {i}", 'uri': 'spotify:artist:x', 'type': 'artist'}
+    return {
+        'played_at': f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z",
+        'context': None,
+        'track': {
+            'id': f"track{i}",
+            'name': f"Track {i}",
+            'uri': f"spotify:track:{i}",
+            'duration_ms': rng.randrange(60_000, 400_000),
+            'popularity': rng.randrange(100),
+            'explicit': rng.random() < 0.2,
+            'artists': [artist, dict(artist, id=f"artist{rng.randrange(500)}")],
+            'album': {'id': f"album{rng.randrange(2000)}", 'name': f"Album {i}", 'release_date': '2020-01-01'},
+        },
+    }
+
+
+def legacy_frame(results):
+    # The hand-written loop used by RetrieveRecentPlays before the declarative spec
+    tracks = []
+    for result in results:
+        for count, item in enumerate(result["items"]):
+            track = item['track']
+            tracks.append({
+                'recents_id': count+1,
+                'track_id': track['id'],
+                'track_name': track['name'],
+                'track_uri': track['uri'],
+                'artist_name': track['artists'][0]['name'],
+                'artist_id': track['artists'][0]['id'],
+                'album_name': track['album']['name'],
+                'album_id': track['album']['id'],
+                'played_at': item['played_at'],
+                'duration_ms': track['duration_ms'],
+                'popularity': track['popularity']
+            })
+    return pd.DataFrame(tracks)
+
+
+def spec_frame(retriever, results, chunk_size):
+    # The compiled spec filling column buffers chunk by chunk, as `ingest_stream` does
+    records = (pair for result in results for pair in enumerate(result["items"], 1))
+    columns = list(retriever.spec)
+    return pd.concat([pd.DataFrame(buffers, columns=columns) for buffers in iter_column_chunks(records, retriever.spec, chunk_size)],
+                     ignore_index=True)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(rows=200_000, page_size=50, chunk_size=CHUNK_SIZE, repeat=3, seed=42):
+    rng = random.Random(seed)
+    results = [{'items': [random_play(rng, page * page_size + i) for i in range(page_size)]}
+               for page in range(rows // page_size)]
+    retriever = RetrieveRecentPlays('benchmark', TOPIC_CONFIG["recent_plays"]["topic"], "raw", "processed")
+
+    legacy_seconds, legacy = timed(lambda: legacy_frame(results), repeat)
+    spec_seconds, compiled = timed(lambda: spec_frame(retriever, results, chunk_size), repeat)
+    pd.testing.assert_frame_equal(legacy, compiled[legacy.columns])
+
+    print(f"recent plays, {len(legacy)} rows, {len(legacy.columns)} columns (best of {repeat})")
+    print(f"{'hand-written loop':<20}{legacy_seconds:>8.3f}s{len(legacy) / legacy_seconds:>12.0f} rows/s")
+    print(f"{'compiled spec':<20}{spec_seconds:>8.3f}s{len(legacy) / spec_seconds:>12.0f} rows/s"
+          f"  ({legacy_seconds / spec_seconds:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flattening raw records with the hand-written loops vs compiled field-path specs")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.rows, chunk_size=args.chunk_size, repeat=args.repeat)
@@ -0,0 +1,172 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'producers'))
+
+# Keep the artist cache and the play watermarks of the benchmark away from the real ones
+BENCHMARK_DIR = tempfile.mkdtemp(prefix='producer_fleet_benchmark_')
+os.environ['ARTIST_CACHE_PATH'] = os.path.join(BENCHMARK_DIR, 'artist_cache.sqlite')
+os.environ['PLAY_WATERMARK_PATH'] = os.path.join(BENCHMARK_DIR, 'play_watermarks.sqlite')
+
+from avro_codec_benchmark import random_datum
+from base_producer import ProducerSession
+from producer_fleet import run_fleet
+from utils import TOPIC_CONFIG
+
+RecordMetadata = namedtuple('RecordMetadata', 'topic partition offset')
+
+
+class MockSpotify:
+    """
+    Stands in for the Spotify client. Responses are built from the topic schemas so they serialize
+    like real ones, and every call sleeps for `latency` seconds to simulate the network round trip.
+    Artists come from a fixed pool, so users share artists as they do in practice.
+    """
+
+    def __init__(self, user_id, latency, saved_tracks=150, artist_pool=300, seed=0):
+        self.rng = random.Random(f"{seed}-{user_id}")
+        self.latency = latency
+        self.saved_tracks = saved_tracks
+        self.artist_pool = artist_pool
+
+    def _call(self):
+        time.sleep(self.latency)
+
+    def _page(self, topic_key, items, offset=0, limit=50, total=None):
+        page = random_datum(TOPIC_CONFIG[topic_key]['schema'], self.rng)
+        page.update(items=items, offset=offset, limit=limit, total=total if total is not None else len(items))
+        page['next'] = 'https://api.spotify.com/next' if total is not None and offset + len(items) < total else None
+        return page
+
+    def _item(self, topic_key):
+        items_field = next(field for field in TOPIC_CONFIG[topic_key]['schema'].fields if field.name == 'items')
+        return random_datum(items_field.type.items, self.rng)
+
+    def _artist_id(self):
+        return f"artist{self.rng.randrange(self.artist_pool)}"
+
+    def current_user_saved_tracks(self, limit=50, offset=0):
+        self._call()
+        items = []
+        for _ in range(max(0, min(limit, self.saved_tracks - offset))):
+            item = self._item('liked_songs')
+            item['track']['artists'][0]['id'] = self._artist_id()
+            items.append(item)
+        return self._page('liked_songs', items, offset, limit, self.saved_tracks)
+
+    def current_user_followed_artists(self, limit=20, after=None):
+        self._call()
+        result = random_datum(TOPIC_CONFIG['following_artists']['schema'], self.rng)
+        position = int(after or 0) + 1
+        result['artists']['cursors']['after'] = str(position)
+        result['artists']['next'] = 'https://api.spotify.com/next' if position < 20 else None
+        return result
+
+    def current_user_recently_played(self, limit=50, after=None, before=None):
+        self._call()
+        if after is not None:
+            return {'items': []}  # Nothing new since the previous run
+        items = []
+        for i in range(limit):
+            item = self._item('recent_plays')
+            item['played_at'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(1_700_000_000 - i * 240))
+            items.append(item)
+        result = random_datum(TOPIC_CONFIG['recent_plays']['schema'], self.rng)
+        result.update(items=items, limit=limit)
+        return result
+
+    def _single_item_pages(self, topic_key, limit, offset, total):
+        self._call()
+        items = [self._item(topic_key) for _ in range(max(0, min(limit, total - offset)))]
+        return self._page(topic_key, items, offset, limit, total)
+
+    def current_user_playlists(self, limit=50, offset=0):
+        return self._single_item_pages('saved_playlists', limit, offset, 10)
+
+    def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        return self._single_item_pages('top_artists', limit, offset, 20)
+
+    def current_user_top_tracks(self, limit=20, offset=0, time_range='medium_term'):
+        return self._single_item_pages('top_songs', limit, offset, 20)
+
+    def artist_related_artists(self, artist_id):
+        self._call()
+        return {'artists': [{
+            'id': self._artist_id(),
+            'name': f"Artist {i}",
+            'followers': {'total': self.rng.randrange(1_000_000)},
+            'genres': ['pop', 'rock'][:self.rng.randint(0, 2)],
+            'popularity': self.rng.randrange(100),
+            'images': [{'url': 'https://i.scdn.co/image/x'}],
+            'type': 'artist',
+            'uri': f"spotify:artist:{i}",
+        } for i in range(20)]}
+
+    def artist_albums(self, artist_id, album_type=None, limit=20):
+        self._call()
+        items = [random_datum(TOPIC_CONFIG['artist_albums']['schema'], self.rng) for _ in range(limit)]
+        return {'items': items, 'next': None}
+
+
+class MockKafkaProducer:
+    """
+    Stands in for KafkaProducer, acknowledging every send immediately.
+    """
+
+    def __init__(self):
+        self.offset = 0
+
+    def send(self, topic, key=None, value=None):
+        self.offset += 1
+        metadata = RecordMetadata(topic, 0, self.offset)
+        return namedtuple('Future', 'get')(lambda timeout=None: metadata)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockSession(ProducerSession):
+    LATENCY = 0.02
+
+    def __init__(self):
+        super().__init__(
+            producer=MockKafkaProducer(),
+            spotify_factory=lambda user_id: MockSpotify(user_id, MockSession.LATENCY),
+        )
+
+
+def run_benchmark(users, workers, user_concurrency, latency):
+    MockSession.LATENCY = latency
+    roster = [f"user{i}" for i in range(users)]
+
+    # The producers log every record, keep the benchmark output readable
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        result = run_fleet(roster, workers=workers, user_concurrency=user_concurrency, session_factory=MockSession)
+    finally:
+        sys.stdout = stdout
+
+    print(f"{result['users']} users on {result['workers']} workers in {result['seconds']}s "
+          f"(simulated Spotify latency {latency * 1000:.0f} ms)")
+    print(f"{result['users_per_hour']} users/hour, "
+          f"{result['users_per_hour'] // max(result['workers'], 1)} users/hour per worker process (one worker per core by default)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Producer fleet throughput against a mocked Spotify API")
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--user-concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds per simulated Spotify call")
+    args = parser.parse_args()
+    run_benchmark(args.users, args.workers, args.user_concurrency, args.latency)
@@ -0,0 +1,591 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+from avro.io import AvroTypeException
+from avro.schema import parse
+
+# Bounds used by avro's own validator for int and long values
+INT_MIN_VALUE = -(1 << 31)
+INT_MAX_VALUE = (1 << 31) - 1
+LONG_MIN_VALUE = -(1 << 63)
+LONG_MAX_VALUE = (1 << 63) - 1
+
+STRUCT_FLOAT = struct.Struct('<f')   # little-endian float
+STRUCT_DOUBLE = struct.Struct('<d')  # little-endian double
+
+# Object container files, see https://avro.apache.org/docs/1.10.2/spec.html#Object+Container+Files
+CONTAINER_MAGIC = b'Obj\x01'
+CONTAINER_CODECS = ('null', 'deflate')
+
+
+class _SchemaMismatch(Exception):
+    """
+    Raised internally while encoding when a datum does not match its schema.
+    It is converted to an AvroTypeException for the top-level datum so callers see
+    the same exception type the avro DatumWriter raises.
+    """
+
+
+def _write_long(out, datum):
+    """
+    Appends an int/long to the buffer using Avro's variable-length zig-zag coding.
+    """
+    datum = (datum << 1) ^ (datum >> 63)
+    while datum & ~0x7F:
+        out.append((datum & 0x7F) | 0x80)
+        datum >>= 7
+    out.append(datum)
+
+
+def _read_long(buf, pos):
+    """
+    Reads a zig-zag encoded int/long from the buffer.
+
+    Returns:
+        tuple: The decoded value and the position right after it.
+    """
+    b = buf[pos]
+    pos += 1
+    n = b & 0x7F
+    shift = 7
+    while b & 0x80:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+
+class AvroCodec:
+    """
+    AvroCodec compiles an Avro schema once into a tree of specialised encode and decode
+    functions, so the per-record cost is only the work of walking the datum itself.
+
+    The wire format is identical to the one produced by avro's DatumWriter/DatumReader,
+    including union branch resolution, so codec output can be read by the plain avro
+    library and vice versa. Encoding reuses a per-thread output buffer, which keeps the
+    codec safe to share between the producer's worker threads.
+    """
+
+    def __init__(self, schema):
+        """
+        Compiles the encoder and decoder for the given schema.
+
+        Args:
+            schema (avro.schema.Schema): The parsed Avro schema to compile.
+        """
+        self.schema = schema
+        self._encoders = {}  # Compiled encoders of named types, by full name
+        self._decoders = {}  # Compiled decoders of named types, by full name
+        self._validators = {}  # Compiled validators of named types, by full name
+        self._encode = self._compile_encoder(schema)
+        self._decode = self._compile_decoder(schema)
+        self._local = threading.local()  # Holds one reusable output buffer per thread
+
+    def _buffer(self):
+        """
+        Returns the calling thread's output buffer, emptied and ready to be written to.
+        """
+        out = getattr(self._local, 'out', None)
+        if out is None:
+            out = self._local.out = bytearray()
+        else:
+            del out[:]
+        return out
+
+    def encode(self, datum):
+        """
+        Serializes a Python object into Avro binary format.
+
+        Args:
+            datum (dict): The data to be serialized.
+
+        Returns:
+            bytes: The serialized data in Avro format.
+
+        Raises:
+            AvroTypeException: If the datum does not match the schema.
+        """
+        out = self._buffer()
+        try:
+            self._encode(out, datum)
+        except (_SchemaMismatch, TypeError, AttributeError, struct.error):
+            raise AvroTypeException(self.schema, datum)
+        return bytes(out)
+
+    def encode_many(self, data):
+        """
+        Serializes a batch of Python objects, reusing the same buffer for each of them.
+
+        Args:
+            data (iterable): The objects to be serialized.
+
+        Returns:
+            list: The serialized records in the same order as the input.
+        """
+        out = self._buffer()
+        encode = self._encode
+        encoded = []
+        for datum in data:
+            del out[:]
+            try:
+                encode(out, datum)
+            except (_SchemaMismatch, TypeError, AttributeError, struct.error):
+                raise AvroTypeException(self.schema, datum)
+            encoded.append(bytes(out))
+        return encoded
+
+    def decode(self, avro_bytes):
+        """
+        Deserializes an Avro-encoded record.
+
+        Args:
+            avro_bytes (bytes): The Avro-encoded record.
+
+        Returns:
+            dict: The deserialized record.
+        """
+        return self._decode(memoryview(avro_bytes), 0)[0]
+
+    def decode_many(self, records):
+        """
+        Deserializes a batch of Avro-encoded records.
+
+        Args:
+            records (iterable): The Avro-encoded records.
+
+        Returns:
+            list: The deserialized records in the same order as the input.
+        """
+        decode = self._decode
+        return [decode(memoryview(avro_bytes), 0)[0] for avro_bytes in records]
+
+    # ------------------------------------------------------------------
+    # Validators, used to resolve union branches the same way avro does.
+    # ------------------------------------------------------------------
+
+    def _compile_validator(self, schema):
+        schema_type = schema.type
+
+        if schema_type == 'null':
+            return lambda d: d is None
+        if schema_type == 'boolean':
+            return lambda d: isinstance(d, bool)
+        if schema_type == 'string':
+            return lambda d: isinstance(d, str)
+        if schema_type == 'bytes':
+            return lambda d: isinstance(d, bytes)
+        if schema_type == 'int':
+            return lambda d: isinstance(d, int) and INT_MIN_VALUE <= d <= INT_MAX_VALUE
+        if schema_type == 'long':
+            return lambda d: isinstance(d, int) and LONG_MIN_VALUE <= d <= LONG_MAX_VALUE
+        if schema_type in ('float', 'double'):
+            return lambda d: isinstance(d, (int, float))
+        if schema_type == 'fixed':
+            size = schema.size
+            return lambda d: isinstance(d, bytes) and len(d) == size
+        if schema_type == 'enum':
+            symbols = frozenset(schema.symbols)
+            return lambda d: d in symbols
+        if schema_type == 'array':
+            items = self._compile_validator(schema.items)
+            return lambda d: isinstance(d, list) and all(items(item) for item in d)
+        if schema_type == 'map':
+            values = self._compile_validator(schema.values)
+            return lambda d: (isinstance(d, dict) and all(isinstance(key, str) for key in d)
+                              and all(values(value) for value in d.values()))
+        if schema_type in ('union', 'error_union'):
+            branches = [self._compile_validator(branch) for branch in schema.schemas]
+            return lambda d: any(branch(d) for branch in branches)
+        if schema_type in ('record', 'error', 'request'):
+            name = schema.fullname
+            if name in self._validators:
+                # Reuse the compiled named type, deferring the lookup while it is still being compiled
+                return self._validators[name] or (lambda d: self._validators[name](d))
+            self._validators[name] = None  # Placeholder for recursive references
+            names = frozenset(field.name for field in schema.fields)
+            fields = [(field.name, self._compile_validator(field.type)) for field in schema.fields]
+
+            def validate_record(d):
+                return (isinstance(d, dict)
+                        and all(check(d.get(field_name)) for field_name, check in fields)
+                        and names.issuperset(d.keys()))
+
+            self._validators[name] = validate_record
+            return validate_record
+
+        raise AvroTypeException(schema, None)
+
+    # ------------------------------------------------------------------
+    # Encoders
+    # ------------------------------------------------------------------
+
+    def _compile_encoder(self, schema):
+        schema_type = schema.type
+
+        if schema_type == 'null':
+            def encode_null(out, d):
+                if d is not None:
+                    raise _SchemaMismatch()
+            return encode_null
+
+        if schema_type == 'boolean':
+            def encode_boolean(out, d):
+                if not isinstance(d, bool):
+                    raise _SchemaMismatch()
+                out.append(1 if d else 0)
+            return encode_boolean
+
+        if schema_type == 'string':
+            def encode_string(out, d):
+                if not isinstance(d, str):
+                    raise _SchemaMismatch()
+                raw = d.encode('utf-8')
+                _write_long(out, len(raw))
+                out += raw
+            return encode_string
+
+        if schema_type == 'bytes':
+            def encode_bytes(out, d):
+                if not isinstance(d, bytes):
+                    raise _SchemaMismatch()
+                _write_long(out, len(d))
+                out += d
+            return encode_bytes
+
+        if schema_type in ('int', 'long'):
+            low, high = (INT_MIN_VALUE, INT_MAX_VALUE) if schema_type == 'int' \
+                else (LONG_MIN_VALUE, LONG_MAX_VALUE)
+
+            def encode_long(out, d):
+                if not isinstance(d, int) or not low <= d <= high:
+                    raise _SchemaMismatch()
+                _write_long(out, d)
+            return encode_long
+
+        if schema_type in ('float', 'double'):
+            pack = (STRUCT_FLOAT if schema_type == 'float' else STRUCT_DOUBLE).pack
+
+            def encode_float(out, d):
+                if not isinstance(d, (int, float)):
+                    raise _SchemaMismatch()
+                out += pack(d)
+            return encode_float
+
+        if schema_type == 'fixed':
+            size = schema.size
+
+            def encode_fixed(out, d):
+                if not isinstance(d, bytes) or len(d) != size:
+                    raise _SchemaMismatch()
+                out += d
+            return encode_fixed
+
+        if schema_type == 'enum':
+            index = {symbol: i for i, symbol in enumerate(schema.symbols)}
+
+            def encode_enum(out, d):
+                if d not in index:
+                    raise _SchemaMismatch()
+                _write_long(out, index[d])
+            return encode_enum
+
+        if schema_type == 'array':
+            encode_item = self._compile_encoder(schema.items)
+
+            def encode_array(out, d):
+                if not isinstance(d, list):
+                    raise _SchemaMismatch()
+                if d:
+                    _write_long(out, len(d))
+                    for item in d:
+                        encode_item(out, item)
+                out.append(0)
+            return encode_array
+
+        if schema_type == 'map':
+            encode_value = self._compile_encoder(schema.values)
+
+            def encode_map(out, d):
+                if not isinstance(d, dict):
+                    raise _SchemaMismatch()
+                if d:
+                    _write_long(out, len(d))
+                    for key, value in d.items():
+                        if not isinstance(key, str):
+                            raise _SchemaMismatch()
+                        raw = key.encode('utf-8')
+                        _write_long(out, len(raw))
+                        out += raw
+                        encode_value(out, value)
+                out.append(0)
+            return encode_map
+
+        if schema_type in ('union', 'error_union'):
+            # avro picks the last branch the datum validates against, keep that behaviour
+            branches = [(i, self._compile_validator(branch), self._compile_encoder(branch))
+                        for i, branch in enumerate(schema.schemas)][::-1]
+
+            def encode_union(out, d):
+                for i, validate, encode_branch in branches:
+                    if validate(d):
+                        _write_long(out, i)
+                        encode_branch(out, d)
+                        return
+                raise _SchemaMismatch()
+            return encode_union
+
+        if schema_type in ('record', 'error', 'request'):
+            name = schema.fullname
+            if name in self._encoders:
+                # Reuse the compiled named type, deferring the lookup while it is still being compiled
+                return self._encoders[name] or (lambda out, d: self._encoders[name](out, d))
+            self._encoders[name] = None  # Placeholder for recursive references
+            names = frozenset(field.name for field in schema.fields)
+            fields = [(field.name, self._compile_encoder(field.type)) for field in schema.fields]
+
+            def encode_record(out, d):
+                if not isinstance(d, dict) or not names.issuperset(d.keys()):
+                    raise _SchemaMismatch()
+                get = d.get
+                for field_name, encode_field in fields:
+                    encode_field(out, get(field_name))
+
+            self._encoders[name] = encode_record
+            return encode_record
+
+        raise AvroTypeException(schema, None)
+
+    # ------------------------------------------------------------------
+    # Decoders, each returns the decoded value and the next read position.
+    # ------------------------------------------------------------------
+
+    def _compile_decoder(self, schema):
+        schema_type = schema.type
+
+        if schema_type == 'null':
+            return lambda buf, pos: (None, pos)
+
+        if schema_type == 'boolean':
+            return lambda buf, pos: (buf[pos] == 1, pos + 1)
+
+        if schema_type == 'string':
+            def decode_string(buf, pos):
+                size, pos = _read_long(buf, pos)
+                end = pos + size
+                return str(buf[pos:end], 'utf-8'), end
+            return decode_string
+
+        if schema_type == 'bytes':
+            def decode_bytes(buf, pos):
+                size, pos = _read_long(buf, pos)
+                end = pos + size
+                return bytes(buf[pos:end]), end
+            return decode_bytes
+
+        if schema_type in ('int', 'long'):
+            return _read_long
+
+        if schema_type in ('float', 'double'):
+            unpack_from = (STRUCT_FLOAT if schema_type == 'float' else STRUCT_DOUBLE).unpack_from
+            size = 4 if schema_type == 'float' else 8
+            return lambda buf, pos: (unpack_from(buf, pos)[0], pos + size)
+
+        if schema_type == 'fixed':
+            size = schema.size
+            return lambda buf, pos: (bytes(buf[pos:pos + size]), pos + size)
+
+        if schema_type == 'enum':
+            symbols = list(schema.symbols)
+
+            def decode_enum(buf, pos):
+                index, pos = _read_long(buf, pos)
+                return symbols[index], pos
+            return decode_enum
+
+        if schema_type == 'array':
+            decode_item = self._compile_decoder(schema.items)
+
+            def decode_array(buf, pos):
+                items = []
+                count, pos = _read_long(buf, pos)
+                while count:
+                    if count < 0:
+                        count = -count
+                        _, pos = _read_long(buf, pos)  # Skip the block size
+                    for _ in range(count):
+                        item, pos = decode_item(buf, pos)
+                        items.append(item)
+                    count, pos = _read_long(buf, pos)
+                return items, pos
+            return decode_array
+
+        if schema_type == 'map':
+            decode_value = self._compile_decoder(schema.values)
+
+            def decode_map(buf, pos):
+                result = {}
+                count, pos = _read_long(buf, pos)
+                while count:
+                    if count < 0:
+                        count = -count
+                        _, pos = _read_long(buf, pos)  # Skip the block size
+                    for _ in range(count):
+                        size, pos = _read_long(buf, pos)
+                        key = str(buf[pos:pos + size], 'utf-8')
+                        result[key], pos = decode_value(buf, pos + size)
+                    count, pos = _read_long(buf, pos)
+                return result, pos
+            return decode_map
+
+        if schema_type in ('union', 'error_union'):
+            branches = [self._compile_decoder(branch) for branch in schema.schemas]
+
+            def decode_union(buf, pos):
+                index, pos = _read_long(buf, pos)
+                return branches[index](buf, pos)
+            return decode_union
+
+        if schema_type in ('record', 'error', 'request'):
+            name = schema.fullname
+            if name in self._decoders:
+                # Reuse the compiled named type, deferring the lookup while it is still being compiled
+                return self._decoders[name] or (lambda buf, pos: self._decoders[name](buf, pos))
+            self._decoders[name] = None  # Placeholder for recursive references
+            fields = [(field.name, self._compile_decoder(field.type)) for field in schema.fields]
+
+            def decode_record(buf, pos):
+                record = {}
+                for field_name, decode_field in fields:
+                    record[field_name], pos = decode_field(buf, pos)
+                return record, pos
+
+            self._decoders[name] = decode_record
+            return decode_record
+
+        raise AvroTypeException(schema, None)
+
+
+def build_topic_codecs(topic_config):
+    """
+    Compiles one AvroCodec per topic key of a TOPIC_CONFIG mapping.
+    Entries without a schema (for example processed-only topics) are skipped.
+
+    Args:
+        topic_config (dict): The TOPIC_CONFIG mapping of topic keys to topic name and schema.
+
+    Returns:
+        dict: A mapping of topic key to its compiled AvroCodec.
+    """
+    return {key: AvroCodec(config['schema'])
+            for key, config in topic_config.items() if config.get('schema') is not None}
+
+
+def _write_bytes(out, value):
+    _write_long(out, len(value))
+    out += value
+
+
+def _read_bytes(buf, pos):
+    size, pos = _read_long(buf, pos)
+    return bytes(buf[pos:pos + size]), pos + size
+
+
+def write_container(schema, records, codec='deflate'):
+    """
+    Builds an Avro object container file from records that are already Avro-encoded with `schema`,
+    such as the values of Kafka messages, so they are stored without being decoded and re-encoded.
+    All records go into a single block.
+
+    Args:
+        schema (avro.schema.Schema): The schema the records are encoded with, embedded in the file header.
+        records (list): The Avro-encoded records.
+        codec (str): Block compression, 'deflate' or 'null'.
+
+    Returns:
+        bytes: The container file.
+    """
+    if codec not in CONTAINER_CODECS:
+        raise ValueError(f"Unsupported container codec: {codec}")
+    sync_marker = os.urandom(16)
+
+    out = bytearray(CONTAINER_MAGIC)
+    # File metadata is a map of string to bytes, written as a single map block
+    metadata = {'avro.schema': str(schema).encode('utf-8'), 'avro.codec': codec.encode('utf-8')}
+    _write_long(out, len(metadata))
+    for key, value in metadata.items():
+        _write_bytes(out, key.encode('utf-8'))
+        _write_bytes(out, value)
+    _write_long(out, 0)
+    out += sync_marker
+
+    if records:
+        block = b''.join(records)
+        if codec == 'deflate':
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)  # Raw deflate, no zlib header
+            block = compressor.compress(block) + compressor.flush()
+        _write_long(out, len(records))
+        _write_bytes(out, block)
+        out += sync_marker
+    return bytes(out)
+
+
+_container_codecs = {}  # Compiled codecs of the schemas found in container headers, by schema JSON
+_container_codecs_lock = threading.Lock()
+
+
+def read_container(data):
+    """
+    Decodes every record of an Avro object container file with a codec compiled from the schema in
+    its header. Codecs are compiled once per distinct schema and reused for later files.
+
+    Args:
+        data (bytes): The container file.
+
+    Returns:
+        list: The decoded records.
+    """
+    buf = memoryview(data)
+    if bytes(buf[:4]) != CONTAINER_MAGIC:
+        raise ValueError("Not an Avro object container file")
+
+    metadata, pos = {}, 4
+    while True:
+        count, pos = _read_long(buf, pos)
+        if count == 0:
+            break
+        if count < 0:
+            count = -count
+            _, pos = _read_long(buf, pos)  # Block size in bytes, not needed
+        for _ in range(count):
+            key, pos = _read_bytes(buf, pos)
+            metadata[key.decode('utf-8')], pos = _read_bytes(buf, pos)
+    sync_marker, pos = bytes(buf[pos:pos + 16]), pos + 16
+
+    codec = metadata.get('avro.codec', b'null').decode('utf-8')
+    if codec not in CONTAINER_CODECS:
+        raise ValueError(f"Unsupported container codec: {codec}")
+    schema_json = metadata['avro.schema'].decode('utf-8')
+    with _container_codecs_lock:
+        avro_codec = _container_codecs.get(schema_json)
+        if avro_codec is None:
+            avro_codec = _container_codecs[schema_json] = AvroCodec(parse(schema_json))
+    decode = avro_codec._decode
+
+    records = []
+    while pos < len(buf):
+        count, pos = _read_long(buf, pos)
+        block, pos = _read_bytes(buf, pos)
+        if bytes(buf[pos:pos + 16]) != sync_marker:
+            raise ValueError("Corrupt Avro container file: sync marker mismatch")
+        pos += 16
+        if codec == 'deflate':
+            block = zlib.decompress(block, -15)
+        block_buf, block_pos = memoryview(block), 0
+        for _ in range(count):
+            record, block_pos = decode(block_buf, block_pos)
+            records.append(record)
+    return records
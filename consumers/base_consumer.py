@@ -1,14 +1,14 @@
-from utils import TOPIC_CONFIG, TOPIC_TO_KEY
+from utils import TOPIC_CODECS, TOPIC_CONFIG, TOPIC_TO_KEY
+from common_utility_functions.avro_codec import write_container
 import json
 import io,os
 import time
 from collections import defaultdict
 import s3fs
 from minio.error import S3Error
+from kafka.structs import OffsetAndMetadata
 import minio
-import avro.schema
-from avro.io import DatumReader
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,43 +20,89 @@ class BaseKafkaConsumer:
     """
     BaseKafkaConsumer is a generic Kafka consumer class designed to consume messages from a specific topic, 
     deserialize the Avro-encoded messages, batch them by user, and upload these batches to MinIO storage.
+
+    A user's batch is uploaded as one object once it holds `BATCH_SIZE` records or `MAX_BATCH_BYTES`
+    encoded bytes, or once its oldest record has waited `MAX_BATCH_TIME` seconds. Offsets are committed
+    manually and only up to the oldest record that is not yet uploaded, so no record is lost if the
+    consumer stops between a poll and an upload.
+
+    Uploads run on a worker pool with at most `MAX_INFLIGHT_UPLOADS` writes in flight, so a slow
+    MinIO write does not stall polling. Since offsets of in-flight and failed uploads are held back,
+    a partition's offset only moves past a batch once it and every earlier batch have been uploaded.
     """
 
     # Class-level constants for batch size and time interval for batch processing
-    BATCH_SIZE = 1  # Number of messages to batch before uploading to storage
-    MAX_BATCH_TIME = 100  # Maximum time to wait before forcing a batch upload
+    BATCH_SIZE = 500  # Number of messages to batch before uploading to storage
+    MAX_BATCH_BYTES = 8 * 1024 * 1024  # Encoded size of the messages to batch before uploading to storage
+    MAX_BATCH_TIME = 100  # Maximum time in seconds to wait before forcing a batch upload
     CONTAINER = "raw" # Cannot capitalize bucket names in Minio
+    # Format of the raw objects: 'json' documents, or 'avro' object container files that keep the
+    # Avro-encoded Kafka values as they are and compress them with deflate
+    RAW_FORMAT = os.getenv('RAW_FORMAT', 'json')
+    MAX_POOL_CONNECTIONS = 10  # HTTP connections kept open to MinIO
+    MAX_INFLIGHT_UPLOADS = 4  # Uploads running concurrently, polling blocks once this many are in flight
+    METRICS_INTERVAL = 30  # Seconds between two metrics reports
 
-    def __init__(self, topic):
+    def __init__(self, topic, upload_executor=None):
         """
         Initializes the Kafka consumer with a specific topic and consumer group ID.
 
         Args:
             topic (str): The Kafka topic to subscribe to.
-            consumer_group_id (str): The consumer group ID for managing Kafka offsets.
+            upload_executor (ThreadPoolExecutor): A worker pool shared with the handlers of other topics.
+                When omitted the consumer creates its own pool and shuts it down in `shutdown()`.
         """
         self.topic = topic  # Topic to subscribe to
         self.user_batches = defaultdict(list)  # Store batches of messages by user
         self.active_users = set()  # Track active users to manage batches
+        self.batch_bytes = defaultdict(int)  # Encoded size of each user's pending batch
+        self.batch_started = {}  # Time the oldest message of each user's pending batch arrived
+        self.batch_offsets = defaultdict(dict)  # First and last offset per partition of each user's pending batch
+        self.consumed_offsets = {}  # Next offset to read per partition, i.e. everything before it has been seen
+        self.committed_offsets = {}  # Offsets last committed to Kafka per partition
+
+        # One S3 filesystem (MinIO uses S3 protocol) for the lifetime of the consumer, its HTTP connections are pooled and reused
+        self.fs = s3fs.S3FileSystem(
+            endpoint_url=f"http://localhost:9000",  # MinIO endpoint
+            key="minioadmin",  # Access key
+            secret="minioadmin",  # Secret key
+            config_kwargs={'max_pool_connections': BaseKafkaConsumer.MAX_POOL_CONNECTIONS}
+        )
+        self.verified_buckets = set()  # Buckets known to exist, checked once instead of on every upload
 
-    def avro_deserializer(self, avro_bytes, schema):
+        # Upload pipeline
+        self.owns_upload_executor = upload_executor is None
+        self.upload_executor = upload_executor or ThreadPoolExecutor(max_workers=BaseKafkaConsumer.MAX_INFLIGHT_UPLOADS)
+        self.inflight_uploads = {}  # Future of each running upload -> the batch it uploads
+        self.failed_uploads = []  # Batches whose upload failed, retried after the next poll
+        self.uploaded_batches = 0
+        self.last_metrics_report = time.monotonic()
+
+    def avro_deserializer(self, records, topic_key):
         """
-        Deserializes Avro-encoded messages.
+        Deserializes a batch of Avro-encoded messages using the precompiled codec of the topic.
 
         Args:
-            avro_bytes (bytes): The Avro-encoded message.
-            schema (avro.schema.Schema): The Avro schema for decoding.
+            records (list): The Avro-encoded messages.
+            topic_key (str): The key of the topic in `TOPIC_CONFIG` whose schema is used for decoding.
 
         Returns:
-            dict: The deserialized message as a Python dictionary.
+            list: The deserialized messages as Python dictionaries.
         """
+        codec = TOPIC_CODECS[topic_key]
         try:
-            reader = DatumReader(schema)  # Create an Avro DatumReader for schema
-            bytes_reader = io.BytesIO(avro_bytes)  # Read bytes into a BytesIO buffer
-            decoder = avro.io.BinaryDecoder(bytes_reader)  # Create a BinaryDecoder from the buffer
-            return reader.read(decoder)  # Deserialize and return the message
+            return codec.decode_many(records)  # Decode the whole batch with the schema compiled once per topic
         except Exception as e :
             print(f"schema mismatch:  {e}")
+            # Fall back to decoding one by one so a single bad record does not drop the batch
+            decoded = []
+            for avro_bytes in records:
+                try:
+                    decoded.append(codec.decode(avro_bytes))
+                except Exception as e:
+                    print(f"schema mismatch:  {e}")
+                    decoded.append(None)
+            return decoded
 
     def ensure_bucket_exists(self, client, bucket_name):
         if not client.bucket_exists(bucket_name):
@@ -66,6 +112,20 @@ class BaseKafkaConsumer:
             print(f"Bucket '{bucket_name}' already exists")
 
 
+    def ensure_container_exists(self, bucket_name):
+        """
+        Creates the bucket if it does not exist. Each bucket is checked only once per consumer.
+
+        Args:
+            bucket_name (str): The bucket to check.
+        """
+        if bucket_name in self.verified_buckets:
+            return
+        if not self.fs.exists(bucket_name):
+            self.fs.mkdir(bucket_name)
+            print(f"Bucket '{bucket_name}' created.")
+        self.verified_buckets.add(bucket_name)
+
     def minio(self, user, topic, data, offset):
         """
         Uploads batched data to MinIO (an S3-compatible object storage).
@@ -73,93 +133,319 @@ class BaseKafkaConsumer:
         Args:
             user (str): The user associated with the data batch.
             topic (str): The Kafka topic name.
-            data (list): The batch of messages to upload.
+            data (list): The batch of messages to upload, Avro-encoded if `RAW_FORMAT` is 'avro'.
             offset (int): The offset of the last message in the batch.
+
+        Returns:
+            bool: True if the batch was uploaded.
         """
+        topic_key = TOPIC_TO_KEY[topic]
         topic = topic.replace("_", "-")
         try:
+            if self.RAW_FORMAT == 'avro':
+                # Store the batch as one Avro container file with the topic schema in its header
+                obj, extension = write_container(TOPIC_CONFIG[topic_key]['schema'], data), 'avro'
+            else:
+                # Convert data to JSON format
+                obj, extension = json.dumps(data).encode("utf-8"), 'json'
+
+            # Make sure the bucket exists, once per consumer. Topic and user prefixes need no creation
+            # in object storage, they exist as soon as an object is written under them.
+            self.ensure_container_exists(BaseKafkaConsumer.CONTAINER)
 
-            # Set up S3 filesystem (MinIO uses S3 protocol)
-            fs = s3fs.S3FileSystem(
-                endpoint_url=f"http://localhost:9000",  # MinIO endpoint
-                key="minioadmin",  # Access key
-                secret="minioadmin"  # Secret key
-            )
-
-            # Convert data to JSON format
-            obj = json.dumps(data)
-
-            # Check if the bucket exists, create it if it doesn't
-            if not fs.exists(BaseKafkaConsumer.CONTAINER):
-                print("In container section\n")
-                fs.mkdir(BaseKafkaConsumer.CONTAINER)
-                print(f"Bucket '{BaseKafkaConsumer.CONTAINER}' created.")
-
-            # Check if the topic subfolder exists, create it if it doesn't
-            topic_path = f"{BaseKafkaConsumer.CONTAINER}/{topic}"
-            if not fs.exists(topic_path):
-                print("In topic section")
-                fs.mkdir(topic_path)
-                print(f"Topic folder '{topic}' created.")
-
-            # Check if the user subfolder exists, create it if it doesn't
-            user_path = f"{topic_path}/{user}"
-            if not fs.exists(user_path):
-                fs.mkdir(user_path)
-                print(f"Subfolder '{user}' created in bucket '{topic}'.")
-
-            # Write the data to MinIO
-            with fs.open(f"{user_path}/{offset}.json", 'w') as f:
-                f.write(obj)
+            # Write the data to MinIO in a single PUT
+            self.fs.pipe_file(f"{BaseKafkaConsumer.CONTAINER}/{topic}/{user}/{offset}.{extension}", obj)
 
             print(f"{offset} is successfully uploaded as object {topic}/{offset} to bucket {user}")
+            return True
         except S3Error as e:
             print(f"Error occurred: {e}")
         except Exception as e:
             print(f"Error in MinIO function: {e}")
+        return False
 
-    def upload_user_batch(self, user, offset):
+    def upload_user_batch(self, user):
         """
-        Uploads a batch of messages for a specific user to MinIO storage and clears the batch.
+        Hands the pending batch of a specific user to the upload pool and starts a new batch for the user.
+        The object is named after the offset of the last message in the batch.
 
         Args:
             user (str): The user whose batch is being uploaded.
-            offset (int): The offset of the last message in the batch.
         """
-        self.minio(user, self.topic, self.user_batches[user], offset)  # Upload the batch to MinIO
-        self.user_batches[user] = []  # Clear the batch after uploading
+        offsets = self.batch_offsets.pop(user)
+        batch = {
+            'user': user,
+            'data': self.user_batches.pop(user),
+            'offsets': offsets,  # First and last offset per partition, holds back commits until uploaded
+            'offset': max(last for _, last in offsets.values()),
+        }
+        self.batch_bytes.pop(user, None)
+        self.batch_started.pop(user, None)
+        self.active_users.discard(user)
+        self.submit_upload(batch)
+
+    def submit_upload(self, batch):
+        """
+        Submits a batch to the upload pool, first waiting for a free slot if `MAX_INFLIGHT_UPLOADS` are running.
+
+        Args:
+            batch (dict): The batch to upload, as built by `upload_user_batch`.
+        """
+        while len(self.inflight_uploads) >= self.MAX_INFLIGHT_UPLOADS:
+            self.collect_uploads(block=True)
+        future = self.upload_executor.submit(self.minio, batch['user'], self.topic, batch['data'], batch['offset'])
+        self.inflight_uploads[future] = batch
+
+    def collect_uploads(self, block=False):
+        """
+        Removes finished uploads from the in-flight set. Failed uploads are kept for a retry, so their
+        offsets stay uncommitted.
+
+        Args:
+            block (bool): Wait until at least one upload finishes.
+        """
+        if block and self.inflight_uploads:
+            done, _ = wait(self.inflight_uploads, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in self.inflight_uploads if future.done()]
+
+        for future in done:
+            batch = self.inflight_uploads.pop(future)
+            try:
+                uploaded = future.result()
+            except Exception as e:
+                print(f"Error in MinIO function: {e}")
+                uploaded = False
+            if uploaded:
+                self.uploaded_batches += 1
+            else:
+                print(f"Upload of {self.topic}/{batch['user']}/{batch['offset']} failed, retrying after the next poll")
+                self.failed_uploads.append(batch)
+
+    def retry_failed_uploads(self):
+        """
+        Submits every failed upload again.
+        """
+        failed, self.failed_uploads = self.failed_uploads, []
+        for batch in failed:
+            self.submit_upload(batch)
+
+    def wait_for_uploads(self):
+        """
+        Blocks until every in-flight upload has finished.
+        """
+        while self.inflight_uploads:
+            self.collect_uploads(block=True)
+
+    def batch_is_full(self, user):
+        """
+        Checks whether a user's batch has reached the record-count or byte-size threshold.
+        """
+        return (len(self.user_batches[user]) >= self.BATCH_SIZE
+                or self.batch_bytes[user] >= self.MAX_BATCH_BYTES)
+
+    def flush_expired_batches(self):
+        """
+        Uploads every batch whose oldest message has waited longer than `MAX_BATCH_TIME`.
+        Called after every poll so that quiet users are still uploaded in time.
+        """
+        now = time.monotonic()
+        for user in [u for u, started in self.batch_started.items() if now - started >= self.MAX_BATCH_TIME]:
+            print(f"Upload data to {self.topic}/{user} after {self.MAX_BATCH_TIME}s")
+            self.upload_user_batch(user)
+
+    def flush_all_batches(self):
+        """
+        Uploads every pending batch regardless of its size or age, e.g. on shutdown.
+        """
+        for user in list(self.active_users):
+            print(f"Upload data to {self.topic}/{user}")
+            self.upload_user_batch(user)
+
+    def commit_offsets(self, consumer):
+        """
+        Commits, per partition, the offset of the oldest message that has not been uploaded yet,
+        whether it is still batched, being uploaded or waiting for a retry,
+        or the next offset to read if every message of the partition has been uploaded.
+        Nothing is sent to Kafka if no committable offset has moved.
+
+        Args:
+            consumer (KafkaConsumer): The consumer whose group offsets are committed.
+        """
+        # Hold back every partition at the first offset of any batch that is pending, uploading or failed
+        unfinished = list(self.batch_offsets.values())
+        unfinished += [batch['offsets'] for batch in self.inflight_uploads.values()]
+        unfinished += [batch['offsets'] for batch in self.failed_uploads]
+
+        safe_offsets = dict(self.consumed_offsets)
+        for offsets in unfinished:
+            for partition, (first, _) in offsets.items():
+                if partition in safe_offsets:  # Partitions released in a rebalance are no longer committed here
+                    safe_offsets[partition] = min(safe_offsets[partition], first)
+
+        to_commit = {
+            partition: OffsetAndMetadata(offset, None)
+            for partition, offset in safe_offsets.items()
+            if self.committed_offsets.get(partition) != offset
+        }
+        if not to_commit:
+            return
+        try:
+            consumer.commit(offsets=to_commit)
+            self.committed_offsets.update((partition, meta.offset) for partition, meta in to_commit.items())
+        except Exception as e:
+            print(f"Failed to commit offsets: {e}")
+
+    def metrics(self, consumer):
+        """
+        Returns a snapshot of the consumer metrics.
+
+        Args:
+            consumer (KafkaConsumer): The consumer whose lag is reported.
+
+        Returns:
+            dict: Messages not yet read (lag) in total, messages waiting in batches, uploads in flight,
+                  failed uploads waiting for a retry and uploads completed so far.
+        """
+        lag = 0
+        for partition, offset in self.consumed_offsets.items():
+            highwater = consumer.highwater(partition)  # Latest end offset seen in fetch responses, no extra request
+            if highwater is not None:
+                lag += max(highwater - offset, 0)
+        return {
+            'lag': lag,
+            'batched_messages': sum(len(batch) for batch in self.user_batches.values()),
+            'inflight_uploads': len(self.inflight_uploads),
+            'failed_uploads': len(self.failed_uploads),
+            'uploaded_batches': self.uploaded_batches,
+        }
+
+    def report_metrics(self, consumer):
+        """
+        Prints the consumer metrics every `METRICS_INTERVAL` seconds.
+        """
+        now = time.monotonic()
+        if now - self.last_metrics_report >= self.METRICS_INTERVAL:
+            self.last_metrics_report = now
+            print(f"Consumer metrics for {self.topic}: {self.metrics(consumer)}")
 
     def process_message(self, message):
         """
-        Processes a Kafka message by deserializing it, batching it by user, and uploading the batch if the size threshold is reached.
+        Processes Kafka messages by deserializing them, batching them by user, and uploading a batch once it is full.
+
+        Args:
+            message (dict): The Kafka messages polled from the consumer, keyed by topic partition.
+        """
+        for partition, records in message.items():
+            # Deserialize all Avro-encoded messages of the partition in one batch
+            decoded = self.avro_deserializer([record.value for record in records], TOPIC_TO_KEY[self.topic])
+
+            # Iterate over each ConsumerRecord in the list
+            for record, data in zip(records, decoded):
+                self.consumed_offsets[partition] = record.offset + 1
+                if data is None:
+                    print(f"Skipping undecodable message at offset {record.offset}")
+                    continue
+
+                # Extract user identifier and offset from the record
+                user, offset = record.key.decode("utf-8"), record.offset
+
+                # Append the message to the user's batch, Avro container files take the encoded value as is
+                if user not in self.active_users:
+                    self.active_users.add(user)
+                    self.batch_started[user] = time.monotonic()
+                self.user_batches[user].append(record.value if self.RAW_FORMAT == 'avro' else data)
+                self.batch_bytes[user] += len(record.value)
+                first, _ = self.batch_offsets[user].get(partition, (offset, offset))
+                self.batch_offsets[user][partition] = (first, offset)
+
+                # Check if the batch has reached the size thresholds
+                if self.batch_is_full(user):
+                    print(f"Upload data to {self.topic}/{user}")
+                    # Upload the batch and reset
+                    self.upload_user_batch(user)
+
+    def after_poll(self, consumer):
+        """
+        Housekeeping run after every poll: uploads batches that waited too long, retries failed uploads,
+        commits what has been uploaded so far and reports metrics.
+
+        Args:
+            consumer (KafkaConsumer): The consumer the messages were polled from.
+        """
+        self.flush_expired_batches()
+        self.collect_uploads()
+        self.retry_failed_uploads()
+        self.commit_offsets(consumer)
+        self.report_metrics(consumer)
+
+    def drain(self, consumer):
+        """
+        Uploads every pending batch, waits for the uploads to finish and commits their offsets.
+
+        Args:
+            consumer (KafkaConsumer): The consumer whose group offsets are committed.
+        """
+        self.flush_all_batches()
+        self.wait_for_uploads()
+        self.retry_failed_uploads()  # One last attempt, batches that still fail stay uncommitted
+        self.wait_for_uploads()
+        self.commit_offsets(consumer)
+
+    def release_partitions(self, consumer, partitions):
+        """
+        Drains the consumer before partitions are handed to another group member in a rebalance,
+        and forgets the offsets of the released partitions. Uploads of the released partitions that
+        still failed are dropped, the new owner reads those messages again from the committed offset.
 
         Args:
-            message (dict): The Kafka messages polled from the consumer.
+            consumer (KafkaConsumer): The consumer whose group offsets are committed.
+            partitions (list): The revoked TopicPartitions.
         """
-        # Get the list of ConsumerRecords from the Kafka message for the subscribed topic partition
-        records = list(message.values())[0]  # Extract multiple records
-        # print(f"records: {records}\n")
-        # Iterate over each ConsumerRecord in the list
-        for record in records:
-            # print(f"record: {record}")
-            # Extract topic key, user identifier, and offset from the record
-            topic_key, user, offset = TOPIC_TO_KEY[record.topic], record.key.decode("utf-8"), record.offset
+        self.drain(consumer)
+        revoked = set(partitions)
+        for partition in revoked:
+            self.consumed_offsets.pop(partition, None)
+            self.committed_offsets.pop(partition, None)
 
-            # Deserialize the Avro-encoded message
-            data = self.avro_deserializer(record.value, TOPIC_CONFIG[topic_key]['schema'])
+        # A batch can hold messages of several partitions: it is only dropped once none of its partitions
+        # is still assigned, otherwise it keeps holding back the commits of the partitions that stay
+        self.failed_uploads = [batch for batch in self.failed_uploads if self.forget_partitions(batch, revoked)]
+        for future, batch in list(self.inflight_uploads.items()):
+            if not self.forget_partitions(batch, revoked):
+                del self.inflight_uploads[future]
 
-            # Append the deserialized data to the user's batch
-            self.user_batches[user].append(data)
+    @staticmethod
+    def forget_partitions(batch, partitions):
+        """
+        Removes partitions from the offsets a batch holds back.
+
+        Args:
+            batch (dict): The batch, as built by `upload_user_batch`.
+            partitions (set): The TopicPartitions to remove.
 
-            # Check if the batch size has reached the threshold
-            if len(self.user_batches[user]) >= BaseKafkaConsumer.BATCH_SIZE:
-                print(f"Upload data to {self.topic}/{user}")
-                # Upload the batch and reset
-                self.upload_user_batch(user, offset)
+        Returns:
+            bool: Whether the batch still holds back any partition.
+        """
+        batch['offsets'] = {partition: offsets for partition, offsets in batch['offsets'].items() if partition not in partitions}
+        return bool(batch['offsets'])
+
+    def shutdown(self, consumer):
+        """
+        Drains the consumer and stops its own upload pool. The Kafka consumer itself is left open.
+
+        Args:
+            consumer (KafkaConsumer): The consumer whose group offsets are committed.
+        """
+        self.drain(consumer)
+        if self.owns_upload_executor:
+            self.upload_executor.shutdown()
+        print(f"Consumer metrics for {self.topic}: {self.metrics(consumer)}")
 
     def consume(self, consumer):
         """
-        Continuously consumes messages from the Kafka topic, processes them, and commits offsets after processing.
+        Continuously consumes messages from the Kafka topic, processes them, and commits the offsets
+        of uploaded messages. Pending batches are uploaded and committed before the consumer closes.
         """
         try:
             while True:
@@ -171,13 +457,15 @@ class BaseKafkaConsumer:
                     print(f"Received message")
                     # Process the received message batch
                     self.process_message(message)
-                    # Commit the offset after processing messages
-                    consumer.commit()
                 else:
                     print("No messages received.")
 
+                # Upload batches that waited too long, retry failed uploads and commit what has been uploaded so far
+                self.after_poll(consumer)
+
         except KeyboardInterrupt as e:
             print(f"Stopping consumer for topic: {self.topic}")
         finally:
-            # Close the consumer gracefully
+            # Upload whatever is still pending and commit it before closing the consumer gracefully
+            self.shutdown(consumer)
             consumer.close()
@@ -11,6 +11,7 @@ class LikedSongsConsumer(BaseKafkaConsumer):
         self.consumer = KafkaConsumer(
             bootstrap_servers = LikedSongsConsumer.KAFKA_BOOTSTRAP_SERVERS,
             auto_offset_reset = 'earliest',  # Start reading from the earliest message available
+            enable_auto_commit = False,  # Offsets are committed by BaseKafkaConsumer once a batch is uploaded
             group_id = group_id,  # Assign consumer to a group for offset management
         )
         # Subscribe to the specified topic
@@ -0,0 +1,189 @@
+import os
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from kafka import KafkaAdminClient, KafkaConsumer, ConsumerRebalanceListener
+from kafka.structs import OffsetAndMetadata
+from base_consumer import BaseKafkaConsumer
+from utils import TOPIC_CONFIG
+
+
+class PartitionReleaseListener(ConsumerRebalanceListener):
+    """
+    Uploads and commits everything consumed from partitions before they move to another group member,
+    so the new owner starts right after the last stored message.
+    """
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def on_partitions_revoked(self, revoked):
+        by_topic = defaultdict(list)
+        for partition in revoked:
+            by_topic[partition.topic].append(partition)
+        for topic, partitions in by_topic.items():
+            self.runtime.handlers[topic].release_partitions(self.runtime.consumer, partitions)
+
+    def on_partitions_assigned(self, assigned):
+        print(f"Assigned partitions: {sorted((p.topic, p.partition) for p in assigned)}")
+
+
+class MultiTopicConsumer:
+    """
+    MultiTopicConsumer reads every topic of `TOPIC_CONFIG` through a single Kafka consumer and dispatches
+    the polled records by topic to per-topic BaseKafkaConsumer handlers, which batch and upload them.
+
+    All handlers share the Kafka connection and one upload pool, so a process holds one set of connections
+    however many topics there are. Several processes started with the same group ID split the partitions
+    of all topics between them.
+    """
+
+    KAFKA_BOOTSTRAP_SERVERS = ['localhost:9093']
+    GROUP_ID = 'spotify_consumer_group'
+
+    def __init__(self, group_id=GROUP_ID, topics=None):
+        """
+        Args:
+            group_id (str): The consumer group ID for managing Kafka offsets.
+            topics (list): Topic names to consume, by default every topic of `TOPIC_CONFIG`.
+        """
+        topics = topics or [config['topic'] for config in TOPIC_CONFIG.values()]
+
+        # Uploads of all topics run on one pool, each handler still keeps its own in-flight bound
+        self.upload_executor = ThreadPoolExecutor(max_workers=BaseKafkaConsumer.MAX_INFLIGHT_UPLOADS * 2)
+        self.handlers = {topic: BaseKafkaConsumer(topic, upload_executor=self.upload_executor) for topic in topics}
+
+        self.consumer = KafkaConsumer(
+            bootstrap_servers = MultiTopicConsumer.KAFKA_BOOTSTRAP_SERVERS,
+            auto_offset_reset = 'earliest',  # Start reading from the earliest message available
+            enable_auto_commit = False,  # Offsets are committed by the handlers once a batch is uploaded
+            group_id = group_id,  # Assign consumer to a group for offset management
+        )
+        # Subscribe to every topic, draining revoked partitions before a rebalance completes
+        self.consumer.subscribe(topics, listener=PartitionReleaseListener(self))
+
+    def dispatch(self, message):
+        """
+        Hands the polled records of each topic to the handler of that topic.
+
+        Args:
+            message (dict): The Kafka messages polled from the consumer, keyed by topic partition.
+        """
+        by_topic = defaultdict(dict)
+        for partition, records in message.items():
+            by_topic[partition.topic][partition] = records
+        for topic, partitions in by_topic.items():
+            self.handlers[topic].process_message(partitions)
+
+    def consume(self):
+        """
+        Continuously polls all topics, dispatches the records and lets every handler upload and commit.
+        Pending batches of all topics are uploaded and committed before the consumer closes.
+        """
+        try:
+            while True:
+                # Poll for messages with a timeout of 3000ms (3 seconds)
+                message = self.consumer.poll(timeout_ms=3000)
+                if message:
+                    self.dispatch(message)
+
+                for handler in self.handlers.values():
+                    handler.after_poll(self.consumer)
+
+        except KeyboardInterrupt as e:
+            print(f"Stopping consumer for topics: {', '.join(self.handlers)}")
+        finally:
+            # Upload whatever is still pending and commit it before closing the consumer gracefully
+            for handler in self.handlers.values():
+                handler.shutdown(self.consumer)
+            self.upload_executor.shutdown()
+            self.consumer.close()
+
+
+# Group each topic was read by before all topics moved to the shared group, e.g. 'liked_songs_group'
+LEGACY_GROUP_IDS = {config['topic']: f"{key}_group" for key, config in TOPIC_CONFIG.items()}
+
+
+def seed_group_offsets(group_id=MultiTopicConsumer.GROUP_ID, legacy_group_ids=LEGACY_GROUP_IDS):
+    """
+    Copies the offsets committed by the per-topic groups to the shared group. A new group starts at the
+    earliest retained message, so without this the first start of the shared group would read every
+    topic from the beginning and store all messages the per-topic groups already stored once more.
+
+    Only topics the shared group has not committed any offset for are seeded, so later starts and
+    topics the shared group already reads keep their own offsets.
+
+    Args:
+        group_id (str): The consumer group ID shared by the consumer processes.
+        legacy_group_ids (dict): Topic name -> the group ID that read the topic before.
+
+    Returns:
+        dict: The seeded offsets, TopicPartition -> OffsetAndMetadata.
+    """
+    admin = KafkaAdminClient(bootstrap_servers=MultiTopicConsumer.KAFKA_BOOTSTRAP_SERVERS)
+    try:
+        started_topics = {partition.topic for partition in admin.list_consumer_group_offsets(group_id)}
+        offsets = {}
+        for topic, legacy_group_id in legacy_group_ids.items():
+            if topic in started_topics:
+                continue
+            for partition, committed in admin.list_consumer_group_offsets(legacy_group_id).items():
+                # -1 means the old group never committed the partition, it starts at the earliest message anyway
+                if partition.topic == topic and committed.offset >= 0:
+                    offsets[partition] = OffsetAndMetadata(committed.offset, committed.metadata)
+    finally:
+        admin.close()
+
+    if offsets:
+        # A consumer without subscription commits for the group without joining it
+        consumer = KafkaConsumer(
+            bootstrap_servers = MultiTopicConsumer.KAFKA_BOOTSTRAP_SERVERS,
+            enable_auto_commit = False,
+            group_id = group_id,
+        )
+        try:
+            consumer.assign(list(offsets))
+            consumer.commit(offsets)
+        finally:
+            consumer.close()
+        print(f"Seeded group {group_id} with the offsets of {len(offsets)} partitions from the per-topic groups")
+    return offsets
+
+
+def run_multi_topic_consumer(group_id=MultiTopicConsumer.GROUP_ID):
+    MultiTopicConsumer(group_id).consume()
+
+
+def run_multi_topic_consumers(processes=None, group_id=MultiTopicConsumer.GROUP_ID):
+    """
+    Starts the given number of consumer processes in one group. Kafka assigns each process a share of
+    the partitions of all topics, so more processes only help while there are partitions to spread.
+    Topics the group has not read yet continue from the offsets of their per-topic group, see
+    `seed_group_offsets`.
+
+    Args:
+        processes (int): Number of consumer processes, by default `CONSUMER_PROCESSES` from the environment or 1.
+        group_id (str): The consumer group ID shared by the processes.
+    """
+    processes = processes or int(os.getenv('CONSUMER_PROCESSES', 1))
+    # Seed once before any process joins, the group must have no members to accept the commit
+    seed_group_offsets(group_id)
+    if processes == 1:
+        run_multi_topic_consumer(group_id)
+        return
+
+    workers = [multiprocessing.Process(target=run_multi_topic_consumer, args=(group_id,)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Every worker gets the interrupt too and drains its own batches
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    run_multi_topic_consumers()
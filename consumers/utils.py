@@ -1,7 +1,9 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join('..', 'utils')))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from avro.schema import parse
+from common_utility_functions.avro_codec import build_topic_codecs
 
 scope = "user-library-read \
          user-follow-read \
@@ -73,4 +75,7 @@ TOPIC_CONFIG = {
 }
 
 # Create reverse mapping for easy lookup by topic name
-TOPIC_TO_KEY = {v['topic']: k for k, v in TOPIC_CONFIG.items()}
\ No newline at end of file
+TOPIC_TO_KEY = {v['topic']: k for k, v in TOPIC_CONFIG.items()}
+
+# Compile every topic schema once into a reusable Avro encoder/decoder
+TOPIC_CODECS = build_topic_codecs(TOPIC_CONFIG)
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import necessary modules for data validation, retrieval, and file upload operations.
 from data_checks.validate_expectations import validate_expectations
+from ingestion.genre_dictionary import GenreDictionary
 from ingestion.retrieve_objects import MinioRetriever, MinioUploader
 import pandas as pd
 from ingestion.utils import TOPIC_CONFIG
@@ -23,6 +24,7 @@ class CreateGenresTable:
     """
 
     TOPIC = 'spotify_genres_table'  # Kafka topic name for the genres data.
+    GENRES = GenreDictionary()  # Global genre IDs, shared by every user.
 
     def __init__(self, user, topic, raw, processed) -> None:
         """
@@ -51,24 +53,24 @@ class CreateGenresTable:
 
     def create_genre_table(self):
         """
-        Creates the genre table by extracting unique genres from the raw data.
+        Creates the genre table of the user by extracting unique genres from the raw data. Genres get
+        their IDs from the global genre dictionary, so IDs are the same in every run and for every user.
         Validates the result using Great Expectations and uploads it to MinIO.
         """
         try:
             unique_genres = set()  # Set to store unique genres.
 
-            # Retrieve raw genre data from MinIO.
-            results = self.retriver.retrieve_object()
-
-            # Extract genres from the raw data.
-            for result in results:
+            # Extract genres from the raw data, streamed from MinIO.
+            for result in self.retriver.iter_records():
                 genres = result['genres']
                 for genre in genres:
                     unique_genres.add(genre)
 
-            # Create a DataFrame from the unique genres.
-            df_dict = dict(zip(range(1, len(unique_genres) + 1), unique_genres))
-            df = pd.DataFrame(df_dict.items(), columns=['genre_id', 'genre'])
+            # Look up the global IDs of the genres, genres seen for the first time are appended to the dictionary.
+            genre_ids = self.GENRES.ids_for(unique_genres)
+
+            # Create a DataFrame from the unique genres, in ID order.
+            df = pd.DataFrame(sorted((genre_id, genre) for genre, genre_id in genre_ids.items()), columns=['genre_id', 'genre'])
 
             # Convert the DataFrame to the correct data types and reset the index.
             df = df.astype(self.dtype_dict)
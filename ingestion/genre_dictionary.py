@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Default location of the genre dictionary, shared by the ingestion tasks of every user on the host
+DEFAULT_GENRE_DICTIONARY_PATH = os.getenv(
+    'GENRE_DICTIONARY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'genre_dictionary.sqlite')
+)
+
+
+class GenreDictionary:
+    """
+    GenreDictionary assigns every genre name a global `genre_id` that never changes. IDs are handed out
+    once, in increasing order, the first time any user's data contains the genre; later runs only append
+    genres that are new. The same genre thus has the same ID in every run and for every user.
+
+    Looked up IDs are kept in an in-memory hash map. Assigned IDs never change, so the map never goes
+    stale and only genres missing from it reach the database.
+    """
+
+    def __init__(self, path=DEFAULT_GENRE_DICTIONARY_PATH):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self.index = {}  # genre -> genre_id, filled as genres are looked up
+        self._lock = threading.Lock()
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # Ingestion tasks of several users may add genres at once
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS genres ("
+                "genre_id INTEGER PRIMARY KEY AUTOINCREMENT, genre TEXT NOT NULL UNIQUE, added_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def ids_for(self, genres):
+        """
+        Looks up the IDs of genres, assigning IDs to the genres that have none yet.
+
+        Args:
+            genres (iterable): Genre names, duplicates are fine.
+
+        Returns:
+            dict: Genre name -> genre_id for every given genre.
+        """
+        genres = set(genres)
+        with self._lock:
+            missing = sorted(genres.difference(self.index))
+        if missing:
+            conn = self._connection()
+            # New genres get consecutive IDs in name order. Genres another task added meanwhile keep their ID.
+            conn.executemany(
+                "INSERT OR IGNORE INTO genres (genre, added_at) VALUES (?, ?)",
+                [(genre, time.time()) for genre in missing]
+            )
+            conn.commit()
+
+            found = {}
+            for start in range(0, len(missing), 500):  # Stay below SQLite's bound parameter limit
+                batch = missing[start:start + 500]
+                found.update(conn.execute(
+                    f"SELECT genre, genre_id FROM genres WHERE genre IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall())
+            with self._lock:
+                self.index.update(found)
+
+        with self._lock:
+            return {genre: self.index[genre] for genre in genres}
+
+    def all_genres(self):
+        """
+        Returns:
+            list: (genre_id, genre) of every genre in the dictionary, in ID order.
+        """
+        return self._connection().execute("SELECT genre_id, genre FROM genres ORDER BY genre_id").fetchall()
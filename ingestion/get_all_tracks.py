@@ -6,10 +6,10 @@ sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import necessary modules for data validation, retrieval, and file upload operations.
-from data_checks.validate_expectations import validate_expectations
 import pandas as pd
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever, MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 
 class RetrieveAllTracks:
@@ -52,52 +52,68 @@ class RetrieveAllTracks:
             'ingested_on': str
         }
 
-    def get_all_tracks(self):
+        # Where each column is found in a saved track item, compiled once into a fast extractor.
+        self.spec = {
+            'track_id': ('track', 'id'),
+            'track_name': ('track', 'name'),
+            'duration_ms': ('track', 'duration_ms'),
+            'track_popularity': ('track', 'popularity'),
+            'track_uri': ('track', 'uri'),
+            'album_name': ('track', 'album', 'name'),
+            'artist_name': ('track', 'artists', 0, 'name')
+        }
+
+    def iter_tracks(self, results):
+        """
+        Yields the saved track items of the raw 'liked_songs' pages. Raw records are streamed from
+        MinIO, so only one page is held in memory at a time.
+
+        Args:
+            results (iterable): The raw 'liked_songs' pages.
+
+        Yields:
+            dict: One saved track item.
         """
-        Retrieves and processes the track data from the 'liked_songs' data.
-        Validates the result using Great Expectations and uploads it to MinIO.
+        # Each raw record is a page that can hold several saved tracks.
+        for result in results:
+            yield from (item for item in result["items"] if item['track'])
+
+    def prepare(self, df_tracks):
+        """
+        Adds the ingestion timestamp to a chunk of tracks and converts it to the correct data types.
+        """
+        df_tracks['ingested_on'] = self.ingested_on  # Add ingestion timestamp.
+        return df_tracks.astype(self.dtype_dict)
+
+    def get_all_tracks(self, full_refresh=False):
         """
-        tracks = []  # List to store track data.
+        Retrieves and processes the track data of new 'liked_songs' raw objects chunk by chunk.
+        Validates every chunk using Great Expectations and merges it into the table in MinIO.
 
+        Args:
+            full_refresh (bool): Read every raw object and rebuild the table instead.
+        """
         try:
-            # Retrieve raw track data from MinIO.
-            results = self.retriver.retrieve_object()
-
-            # Iterate through the raw data and extract track information.
-            for result in results:
-                item = result["items"]
-                track = item[0]['track']  # Extract the track details.
-                tracks.append({
-                    'track_id': track['id'],
-                    'track_name': track['name'],
-                    'duration_ms': track['duration_ms'],
-                    'track_popularity': track['popularity'],
-                    'track_uri': track['uri'],
-                    'album_name': track['album']['name'],
-                    'artist_name': track['artists'][0]['name']
-                })
-
-            # Convert the list of tracks into a DataFrame.
-            df_tracks = pd.DataFrame(tracks)
-            df_tracks['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add ingestion timestamp.
-
-            # Convert the DataFrame to the correct data types.
-            df_tracks = df_tracks.astype(self.dtype_dict)
-            df_tracks.drop_duplicates(subset='track_id', inplace=True)  # Remove duplicate tracks.
-            df_tracks = df_tracks.reset_index(drop=True)  # Reset index.
-
-            # Run Great Expectations data quality checks.
-            validate_expectations(df_tracks, self.expectations_suite_name)
-
-            # Upload the processed track DataFrame to MinIO.
-            self.uploader.upload_files(data=df_tracks)
-            print(f"Successfully uploaded to '{self.processed}' container!!")
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk.
+
+            # Stream the tracks, removing tracks that are already stored.
+            rows = ingest_raw(
+                self.retriver,
+                self.uploader,
+                spec=self.spec,
+                flatten=self.iter_tracks,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['track_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")
 
         except Exception as e:
             # Handle any exceptions that occur during data processing or upload.
             print(f"Encountered an exception here!!: {e}")
 
-def run_retrieve_all_tracks():
+def run_retrieve_all_tracks(full_refresh=False):
     """
     Runs the process to retrieve and upload all tracks data for a specific user.
     """
@@ -105,8 +121,8 @@ def run_retrieve_all_tracks():
                            TOPIC_CONFIG["liked_songs"]["topic"], \
                            "raw", \
                            "processed")
-    ob.get_all_tracks()
+    ob.get_all_tracks(full_refresh)
 
 if __name__ == "__main__":
     # Entry point for running the all tracks retrieval process.
-    run_retrieve_all_tracks()
+    run_retrieve_all_tracks('--full-refresh' in sys.argv)
@@ -6,9 +6,9 @@ sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import necessary modules and functions
-from data_checks.validate_expectations import validate_expectations
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever, MinioUploader
+from ingestion.streaming import ingest_raw
 import pandas as pd
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
@@ -42,6 +42,17 @@ class RetrieveArtistAlbums(MinioRetriever, MinioUploader):
             'ingested_on': str
         }
 
+        # Where each column is found in a raw album record, compiled once into a fast extractor
+        self.spec = {
+            'album_id': ('id',),
+            'album_name': ('name',),
+            'album_type': ('album_type',),
+            'total_tracks': ('total_tracks',),
+            'release_date': ('release_date',),
+            'artist_id': ('artists', 0, 'id'),
+            'artist_name': ('artists', 0, 'name')
+        }
+
     # Check if the 'ingested_on' column is valid: non-null, non-empty, and of type string
     def check_ingested_on(self, df):
         ingested_on_values = df['ingested_on'].tolist()
@@ -73,55 +84,44 @@ class RetrieveArtistAlbums(MinioRetriever, MinioUploader):
         # Return True only if all checks pass
         return all_strings and no_empty_strings and no_null_values
 
-    # Main function to retrieve, process, validate, and upload artist album data
-    def get_user_artist_albums(self):
+    # Type a chunk of artist albums
+    def prepare(self, df_artists):
+        # Parse release_date and add the ingestion timestamp
+        df_artists['release_date'] = pd.to_datetime(df_artists['release_date'], format='mixed')
+        df_artists['ingested_on'] = self.ingested_on
+
+        # Convert DataFrame columns to the expected data types
+        return df_artists.astype(self.dtype_dict)
 
-        artists = []
+    # Main function to retrieve, process, validate, and upload artist album data
+    def get_user_artist_albums(self, full_refresh=False):
         try:
-            # Retrieve data from MinIO
-            results = self.retriever.retrieve_object()
-            # Process each result and extract relevant fields
-            for result in results:
-                artists.append({
-                    'album_id': result['id'],
-                    'album_name': result['name'],
-                    'album_type': result['album_type'],
-                    'total_tracks': result['total_tracks'],
-                    'release_date': result['release_date'],
-                    'artist_id': result['artists'][0]['id'],
-                    'artist_name': result['artists'][0]['name']
-                })
-
-            # Convert the list of artist albums to a DataFrame
-            df_artists = pd.DataFrame(artists)
-            # Parse release_date and add the current ingestion timestamp
-            df_artists['release_date'] = pd.to_datetime(df_artists['release_date'], format='mixed')
-            df_artists['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")
-            
-            # Convert DataFrame columns to the expected data types
-            df_artists = df_artists.astype(self.dtype_dict)
-            # Drop duplicate records based on 'album_id' and 'artist_id'
-            df_artists.drop_duplicates(['album_id', 'artist_id'], inplace=True)
-            df_artists = df_artists.reset_index(drop=True)
-
-            # Validate data using the Great Expectations suite
-            validate_expectations(df_artists, self.expectations_suite_name)
-
-            # Upload the processed and validated DataFrame back to MinIO
-            self.uploader.upload_files(data=df_artists)
-            print(f"Successfully uploaded to '{self.processed}' container!!")
-        
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
+
+            # Stream the albums of new raw objects chunk by chunk, dropping 'album_id' and 'artist_id' pairs that
+            # are already stored, validating with the Great Expectations suite and merging into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['album_id', 'artist_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")
+
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")
 
 # Function to run the artist album retrieval process
-def run_get_user_artist_albums():
+def run_get_user_artist_albums(full_refresh=False):
     ob = RetrieveArtistAlbums(os.getenv('USER_NAME'), \
                                 TOPIC_CONFIG["artist_albums"]["topic"], \
                                 "raw", \
                                 "processed")
-    ob.get_user_artist_albums()
+    ob.get_user_artist_albums(full_refresh)
 
 # Execute the function if the script is run directly
 if __name__ == "__main__":
-    run_get_user_artist_albums()
\ No newline at end of file
+    run_get_user_artist_albums('--full-refresh' in sys.argv)
\ No newline at end of file
@@ -4,11 +4,11 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 from datetime import datetime
 import pandas as pd
 from ingestion.utils import TOPIC_CONFIG
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,50 +32,58 @@ class RetrieveFollowingArtists():
             'ingested_on': str
         }
 
+        # Where each column is found in a (follow_id, artist) pair, compiled once into a fast extractor
+        self.spec = {
+            'follow_id': (0,),
+            'artist_id': (1, 'id')
+        }
+
+    # Yield every followed artist with a follow_id, records are streamed so only one page is held at a time
+    def iter_followed_artists(self, results):
+        for count, result in enumerate(results):
+            for item in result['artists']['items']:
+                yield count+1, item
+
+    # Type a chunk of followed artists
+    def prepare(self, df_following_artist):
+        # Add the ingestion timestamp
+        df_following_artist['ingested_on'] = self.ingested_on
+
+        # Convert DataFrame columns to the expected data types
+        return df_following_artist.astype(self.dtype_dict)
+
     # Function to retrieve, process, validate, and upload followed artist data
-    def get_user_followed_artists(self):
+    def get_user_followed_artists(self, full_refresh=False):
 
         try:
-            artists = []
-            # Retrieve data from MinIO
-            results = self.retriever.retrieve_object()
-            # Process each result to extract artist ID and create a follow_id
-            for count, result in enumerate(results):
-                for item in result['artists']['items']:
-                    artists.append({
-                        'follow_id': count+1,
-                        'artist_id': item['id']
-                    })
-            
-            # Convert the list of followed artists to a DataFrame
-            df_following_artist = pd.DataFrame(artists)
-            # Add the current ingestion timestamp
-            df_following_artist['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")
-            
-            # Convert DataFrame columns to the expected data types
-            df_following_artist = df_following_artist.astype(self.dtype_dict)
-            # Drop duplicate records based on 'artist_id'
-            df_following_artist.drop_duplicates(subset=['artist_id'], inplace=True)
-            df_following_artist = df_following_artist.reset_index(drop=True)
-            
-            # Validate data using the Great Expectations suite
-            validate_expectations(df_following_artist, self.expectations_suite_name)
-
-            # Upload the processed and validated DataFrame back to MinIO
-            self.uploader.upload_files(data=df_following_artist)
-            print(f"Successfully uploaded to '{self.processed}' container!!")
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
+
+            # Stream the followed artists of new raw objects chunk by chunk, dropping 'artist_id' entries that are
+            # already stored, validating with the Great Expectations suite and merging into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                flatten=self.iter_followed_artists,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['artist_id']],
+                sequence_columns={'follow_id': 1},
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")
         
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")
 
 # Function to run the followed artist retrieval process
-def run_retrieve_following_artists():
+def run_retrieve_following_artists(full_refresh=False):
     ob = RetrieveFollowingArtists(os.getenv('USER_NAME'), \
                                 TOPIC_CONFIG["following_artists"]["topic"], \
                                 "raw", \
                                 "processed")
-    ob.get_user_followed_artists()
+    ob.get_user_followed_artists(full_refresh)
 
 # Execute the function if the script is run directly
 if __name__ == "__main__":
-    run_retrieve_following_artists()
\ No newline at end of file
+    run_retrieve_following_artists('--full-refresh' in sys.argv)
\ No newline at end of file
@@ -6,10 +6,10 @@ from airflow.utils.log.logging_mixin import LoggingMixin
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 import pandas as pd
 import pytz
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 
 from dotenv import load_dotenv
@@ -35,54 +35,60 @@ class RetrieveLikedSongs(LoggingMixin):
             'ingested_on': str  # Ingestion timestamp
         }
 
-    # Method to retrieve, process, validate, and upload liked songs data
-    def get_user_liked_songs(self):
-        try:
-            tracks = []  # Initialize list to store track information
-            results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
+        # Where each column is found in a (like_id, saved track) pair, compiled once into a fast extractor
+        self.spec = {
+            'like_id': (0,),  # Unique ID of each liked song
+            'artist_id': (1, 'track', 'artists', 0, 'id'),  # The artist ID
+            'album_id': (1, 'track', 'album', 'id'),  # The album ID
+            'track_id': (1, 'track', 'id'),  # The track ID
+            'added_at': (1, 'added_at')  # When the song was liked
+        }
 
-            # Process each track from the raw data
-            for count, result in enumerate(results):
-                item = result["items"]
-                track = item[0]['track']
-                tracks.append({
-                    'like_id': count,  # Assign a unique ID to each liked song
-                    'artist_id': track['artists'][0]['id'],  # Get the artist ID
-                    'album_id': track['album']['id'],  # Get the album ID
-                    'track_id': track['id'],  # Get the track ID
-                    'added_at': item[0]['added_at']  # When the song was liked
-                })
+    # Yields every saved track of the raw pages together with its like_id
+    def iter_liked_songs(self, results):
+        # Every raw record is a page of saved tracks, records are streamed so only one is held at a time
+        items = (item for result in results for item in result["items"] if item['track'])
+        return enumerate(items)
 
-            # Convert the list of liked songs into a DataFrame for further processing
-            df_tracks = pd.DataFrame(tracks)
-            df_tracks['added_at'] = pd.to_datetime(df_tracks['added_at']).dt.tz_convert(pytz.UTC)  # Convert added_at to UTC timezone
-            df_tracks['time_id'] = df_tracks['added_at'].apply(lambda val: val.strftime('%Y%m%d%H%M%S'))  # Format the timestamp
-            df_tracks['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add ingestion timestamp
+    # Types a chunk of liked songs
+    def prepare(self, df_tracks):
+        df_tracks['added_at'] = pd.to_datetime(df_tracks['added_at']).dt.tz_convert(pytz.UTC)  # Convert added_at to UTC timezone
+        df_tracks['time_id'] = df_tracks['added_at'].apply(lambda val: val.strftime('%Y%m%d%H%M%S'))  # Format the timestamp
+        df_tracks['ingested_on'] = self.ingested_on  # Add ingestion timestamp
 
-            # Convert the DataFrame to the expected data types
-            df_tracks = df_tracks.astype(self.dtype_dict)
-            # Remove duplicate track entries based on 'track_id' and 'time_id'
-            df_tracks.drop_duplicates(subset=['track_id'], inplace=True)
-            df_tracks.drop_duplicates(subset=['time_id'], inplace=True)
-            df_tracks = df_tracks.reset_index(drop=True)  # Reset index after deduplication
+        # Convert the DataFrame to the expected data types
+        return df_tracks.astype(self.dtype_dict)
 
-            # Validate the data using Great Expectations suite
-            validate_expectations(df_tracks, self.expectations_suite_name)
+    # Method to retrieve, process, validate, and upload liked songs data
+    def get_user_liked_songs(self, full_refresh=False):
+        try:
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
 
-            # Upload the validated data to MinIO
-            self.uploader.upload_files(data=df_tracks)
-            print(f"Successfully uploaded to '{self.processed}' container!!")
+            # Stream the liked songs of new raw objects chunk by chunk: type, remove 'track_id' and 'time_id'
+            # entries that are already stored, validate with the Great Expectations suite and merge into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                flatten=self.iter_liked_songs,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['track_id'], ['time_id']],
+                sequence_columns={'like_id': 0},
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")
 
 # Function to initialize and run the liked songs retrieval process
-def run_retrieve_liked_songs():
+def run_retrieve_liked_songs(full_refresh=False):
     ob = RetrieveLikedSongs(os.getenv('USER_NAME'), \
                             TOPIC_CONFIG["liked_songs"]["topic"], \
                             "raw", \
                             "processed")
-    ob.get_user_liked_songs()
+    ob.get_user_liked_songs(full_refresh)
 
 if __name__ == "__main__":
-    run_retrieve_liked_songs()
+    run_retrieve_liked_songs('--full-refresh' in sys.argv)
@@ -4,11 +4,11 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 from datetime import datetime
 import pandas as pd
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
 
@@ -38,57 +38,63 @@ class RetrieveRecentPlays():
             'ingested_on': str  # Ingestion timestamp
         }
 
-    # Method to retrieve, process, validate, and upload recent plays data
-    def get_user_recent_plays(self):
-        try:
-            tracks = []  # Initialize list to store track information
-            results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
+        # Where each column is found in a (recents_id, play) pair, compiled once into a fast extractor
+        self.spec = {
+            'recents_id': (0,),  # Position of the play in its page
+            'track_id': (1, 'track', 'id'),  # The track ID
+            'track_name': (1, 'track', 'name'),  # The track name
+            'track_uri': (1, 'track', 'uri'),  # The track URI
+            'artist_name': (1, 'track', 'artists', 0, 'name'),  # The artist name
+            'artist_id': (1, 'track', 'artists', 0, 'id'),  # The artist ID
+            'album_name': (1, 'track', 'album', 'name'),  # The album name
+            'album_id': (1, 'track', 'album', 'id'),  # The album ID
+            'played_at': (1, 'played_at'),  # When the track was played
+            'duration_ms': (1, 'track', 'duration_ms'),  # Track duration in milliseconds
+            'popularity': (1, 'track', 'popularity')  # Popularity score of the track
+        }
 
-            # Process each recent play from the raw data
-            for result in results:
-                for count, item in enumerate(result["items"]):
-                    track = item['track']
-                    tracks.append({
-                        'recents_id': count+1,  # Assign a unique ID to each recent play
-                        'track_id': track['id'],  # Get the track ID
-                        'track_name': track['name'],  # Get the track name
-                        'track_uri': track['uri'],  # Get the track URI
-                        'artist_name': track['artists'][0]['name'],  # Get the artist name
-                        'artist_id': track['artists'][0]['id'],  # Get the artist ID
-                        'album_name': track['album']['name'],  # Get the album name
-                        'album_id': track['album']['id'],  # Get the album ID
-                        'played_at': item['played_at'],  # Get the timestamp when the track was played
-                        'duration_ms': track['duration_ms'],  # Track duration in milliseconds
-                        'popularity': track['popularity']  # Popularity score of the track
-                    })
+    # Yields every play of the raw pages together with its recents_id
+    def iter_recent_plays(self, results):
+        # Records are streamed from MinIO, so only one page is held at a time
+        for result in results:
+            yield from enumerate(result["items"], 1)
 
-            # Convert the list of recent plays into a DataFrame for further processing
-            df_recent_plays = pd.DataFrame(tracks)
-            df_recent_plays['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add ingestion timestamp
+    # Types a chunk of recent plays
+    def prepare(self, df_recent_plays):
+        df_recent_plays['ingested_on'] = self.ingested_on  # Add ingestion timestamp
 
-            # Convert the DataFrame to the expected data types
-            df_recent_plays = df_recent_plays.astype(self.dtype_dict)
-            # Remove duplicate play entries based on 'played_at'
-            df_recent_plays.drop_duplicates(['played_at'], inplace=True)
-            df_recent_plays = df_recent_plays.reset_index(drop=True)  # Reset index after deduplication
+        # Convert the DataFrame to the expected data types
+        return df_recent_plays.astype(self.dtype_dict)
 
-            # Validate the data using Great Expectations suite
-            validate_expectations(df_recent_plays, self.expectations_suite_name)
+    # Method to retrieve, process, validate, and upload recent plays data
+    def get_user_recent_plays(self, full_refresh=False):
+        try:
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
 
-            # Upload the validated data to MinIO
-            self.uploader.upload_files(data=df_recent_plays)
-            print(f"Successfully uploaded to '{self.processed}' container!!")
+            # Stream the recent plays of new raw objects chunk by chunk: type, remove 'played_at' entries that
+            # are already stored, validate with the Great Expectations suite and merge into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                flatten=self.iter_recent_plays,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['played_at']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")
 
 # Function to initialize and run the recent plays retrieval process
-def run_retrieve_recent_plays():
+def run_retrieve_recent_plays(full_refresh=False):
     ob = RetrieveRecentPlays(os.getenv('USER_NAME'), \
                             TOPIC_CONFIG["recent_plays"]["topic"], \
                             "raw", \
                             "processed")
-    ob.get_user_recent_plays()
+    ob.get_user_recent_plays(full_refresh)
 
 if __name__ == "__main__":
-    run_retrieve_recent_plays()
+    run_retrieve_recent_plays('--full-refresh' in sys.argv)
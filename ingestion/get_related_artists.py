@@ -4,9 +4,9 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever, MinioUploader
+from ingestion.streaming import ingest_raw
 import pandas as pd
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
@@ -32,48 +32,50 @@ class RetrieveRelatedArtists():
             'ingested_on': str  # Timestamp for when the data was ingested
         }
 
-    # Method to retrieve, process, validate, and upload related artists data
-    def get_artist_related_artists(self):
-        all_artists = []  # Initialize a list to store artist information
-        results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
-
-        try:
-            # Process each artist's data from the retrieved results
-            for result in results:
-                all_artists.append({
-                    'artist_id': result['id'],  # Extract artist ID
-                    'artist_name': result['name'],  # Extract artist name
-                    'artist_popularity': result['popularity'],  # Extract artist popularity
-                    'artist_followers': result['followers'],  # Extract number of followers
-                    'genres': result['genres']  # Extract genres
-                })
+        # Where each column is found in a raw artist record, compiled once into a fast extractor
+        self.spec = {
+            'artist_id': ('id',),  # Artist ID
+            'artist_name': ('name',),  # Artist name
+            'artist_popularity': ('popularity',),  # Artist popularity
+            'artist_followers': ('followers',),  # Number of followers
+            'genres': ('genres',)  # Genres
+        }
 
-            # Convert the list of artists into a DataFrame for further processing
-            df_artists = pd.DataFrame(all_artists)
-            df_artists['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add ingestion timestamp
+    # Types a chunk of related artists
+    def prepare(self, df_artists):
+        df_artists['ingested_on'] = self.ingested_on  # Add ingestion timestamp
 
-            # Convert the DataFrame to the expected data types as defined in dtype_dict
-            df_artists = df_artists.astype(self.dtype_dict)
-            df_artists.drop_duplicates(['artist_id'], inplace=True)  # Remove duplicate artist entries
-            df_artists = df_artists.reset_index(drop=True)  # Reset index after deduplication
+        # Convert the DataFrame to the expected data types as defined in dtype_dict
+        return df_artists.astype(self.dtype_dict)
 
-            # Validate the DataFrame using Great Expectations for data quality checks
-            validate_expectations(df_artists, self.expectations_suite_name)
+    # Method to retrieve, process, validate, and upload related artists data
+    def get_artist_related_artists(self, full_refresh=False):
+        try:
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
 
-            # Upload the validated data back to MinIO
-            self.uploader.upload_files(data=df_artists)
-            print(f"Successfully uploaded to '{self.processed}' container!!")  # Confirmation message
+            # Stream the artists of new raw objects chunk by chunk: type, remove artists that are already stored,
+            # validate with Great Expectations and merge into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['artist_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")  # Confirmation message
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")  # Error handling for exceptions encountered
 
 # Function to initialize and run the related artists retrieval process
-def run_get_artist_related_artists():
+def run_get_artist_related_artists(full_refresh=False):
     ob = RetrieveRelatedArtists(os.getenv('USER_NAME'), \
                                 TOPIC_CONFIG["related_artists"]["topic"], \
                                 "raw", \
                                 "processed")  # Create an instance of RetrieveRelatedArtists
-    ob.get_artist_related_artists()  # Call the method to get related artists
+    ob.get_artist_related_artists(full_refresh)  # Call the method to get related artists
 
 if __name__ == "__main__":
-    run_get_artist_related_artists()  # Execute the function if the script is run directly
+    run_get_artist_related_artists('--full-refresh' in sys.argv)  # Execute the function if the script is run directly
@@ -4,10 +4,10 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 import pandas as pd
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
 load_dotenv()
@@ -35,53 +35,55 @@ class RetrieveSavedPlaylist():
             'ingested_on': str  # Timestamp for when the data was ingested
         }
 
-    # Method to retrieve, process, validate, and upload saved playlist data
-    def get_user_saved_playlist(self):
-        try:
-            playlists = []  # Initialize a list to store playlist information
-            results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
-
-            # Process each playlist from the retrieved results
-            for result in results:
-                item = result["items"][0]  # Access the first item in the list
-                playlists.append({
-                    'playlist_name': item['name'],  # Extract playlist name
-                    'playlist_id': item['id'],  # Extract playlist ID
-                    'playlist_uri': item['uri'],  # Extract playlist URI
-                    'owner_name': item['owner']['display_name'],  # Extract owner's display name
-                    'owner_id': item['owner']['id'],  # Extract owner's ID
-                    'is_public': item['public'],  # Check if the playlist is public
-                    'is_collaborative': item['collaborative'],  # Check if the playlist is collaborative
-                    'total_tracks': item['tracks']['total'],  # Get total number of tracks
-                    'description': item['description']  # Extract description of the playlist
-                })
+        # Where each column is found in a raw record, compiled once into a fast extractor.
+        # Each raw record holds a single playlist as its first item.
+        self.spec = {
+            'playlist_name': ('items', 0, 'name'),  # Playlist name
+            'playlist_id': ('items', 0, 'id'),  # Playlist ID
+            'playlist_uri': ('items', 0, 'uri'),  # Playlist URI
+            'owner_name': ('items', 0, 'owner', 'display_name'),  # Owner's display name
+            'owner_id': ('items', 0, 'owner', 'id'),  # Owner's ID
+            'is_public': ('items', 0, 'public'),  # Whether the playlist is public
+            'is_collaborative': ('items', 0, 'collaborative'),  # Whether the playlist is collaborative
+            'total_tracks': ('items', 0, 'tracks', 'total'),  # Total number of tracks
+            'description': ('items', 0, 'description')  # Description of the playlist
+        }
 
-            # Convert the list of playlists into a DataFrame for further processing
-            df_playlist = pd.DataFrame(playlists)
-            df_playlist['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add ingestion timestamp
+    # Type a chunk of saved playlists
+    def prepare(self, df_playlist):
+        df_playlist['ingested_on'] = self.ingested_on  # Add ingestion timestamp
 
-            # Convert the DataFrame to the expected data types as defined in dtype_dict
-            df_playlist = df_playlist.astype(self.dtype_dict)
-            df_playlist.drop_duplicates(['playlist_id'], inplace=True)  # Remove duplicate playlist entries
-            df_playlist = df_playlist.reset_index(drop=True)  # Reset index after deduplication
+        # Convert the DataFrame to the expected data types as defined in dtype_dict
+        return df_playlist.astype(self.dtype_dict)
 
-            # Validate the DataFrame using Great Expectations for data quality checks
-            validate_expectations(df_playlist, self.expectations_suite_name)
+    # Method to retrieve, process, validate, and upload saved playlist data
+    def get_user_saved_playlist(self, full_refresh=False):
+        try:
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
 
-            # Upload the validated data back to MinIO
-            self.uploader.upload_files(data=df_playlist)
-            print(f"Successfully uploaded to '{self.processed}' container!!")  # Confirmation message
+            # Stream the playlists of new raw objects chunk by chunk, removing playlists that are already stored,
+            # validating with Great Expectations and merging into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['playlist_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")  # Confirmation message
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")  # Error handling for exceptions encountered
 
 # Function to initialize and run the saved playlist retrieval process
-def run_retrieve_saved_playlist():
+def run_retrieve_saved_playlist(full_refresh=False):
     ob = RetrieveSavedPlaylist(os.getenv('USER_NAME'), \
                                 TOPIC_CONFIG["saved_playlists"]["topic"], \
                                 "raw", \
                                 "processed")  # Create an instance of RetrieveSavedPlaylist
-    ob.get_user_saved_playlist()  # Call the method to get saved playlists
+    ob.get_user_saved_playlist(full_refresh)  # Call the method to get saved playlists
 
 if __name__ == "__main__":
-    run_retrieve_saved_playlist()  # Execute the function if the script is run directly
+    run_retrieve_saved_playlist('--full-refresh' in sys.argv)  # Execute the function if the script is run directly
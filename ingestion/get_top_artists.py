@@ -4,10 +4,10 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 import pandas as pd
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
 
@@ -33,56 +33,58 @@ class RetrieveTopArtists():
             'ingested_on': str  # Timestamp for when the data was ingested
         }
 
+        # Where each column is found in a raw record, compiled once into a fast extractor.
+        # Each raw record holds a single artist as its first item.
+        self.spec = {
+            'artist_id': ('items', 0, 'id'),  # Artist ID
+            'artist_name': ('items', 0, 'name'),  # Artist name
+            'artist_uri': ('items', 0, 'uri'),  # Artist URI
+            'popularity': ('items', 0, 'popularity'),  # Artist popularity
+            'followers': ('items', 0, 'followers', 'total'),  # Total number of followers
+            'genres': lambda result: ', '.join(result['items'][0]['genres']),  # Genres combined into a single string
+            'image_url': lambda result: result['items'][0]['images'][0]['url'] if result['items'][0]['images'] else None,  # Image URL, if available
+            'spotify_url': ('items', 0, 'external_urls', 'spotify'),  # External Spotify URL
+        }
+
+    # Type a chunk of top artists
+    def prepare(self, df_artists):
+        df_artists['ingested_on'] = self.ingested_on  # Add a timestamp for ingestion
+
+        # Convert the DataFrame to the expected data types as defined in dtype_dict
+        return df_artists.astype(self.dtype_dict)
+
     # Method to retrieve and process the user's top artists
-    def get_user_top_artists(self):
+    def get_user_top_artists(self, full_refresh=False):
         
         try:
-            artists = []  # Initialize a list to hold artist data
-            results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
-            
-            # Process each artist's information from the retrieved results
-            for result in results:
-                item = result["items"][0]  # Access the first item in the result
-                artists.append({
-                    'artist_id': item['id'],  # Extract artist ID
-                    'artist_name': item['name'],  # Extract artist name
-                    'artist_uri': item['uri'],  # Extract artist URI
-                    'popularity': item['popularity'],  # Extract artist popularity
-                    'followers': item['followers']['total'],  # Extract total number of followers
-                    'genres': ', '.join(item['genres']),  # Combine genres into a single string
-                    'image_url': item['images'][0]['url'] if item['images'] else None,  # Get image URL, if available
-                    'spotify_url': item['external_urls']['spotify'],  # Get external Spotify URL
-                })
-
-            # Convert the list of artists into a DataFrame for further processing
-            df_artists = pd.DataFrame(artists)
-            df_artists['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add a timestamp for ingestion
-            
-            # Convert the DataFrame to the expected data types as defined in dtype_dict
-            df_artists = df_artists.astype(self.dtype_dict)
-            df_artists.drop_duplicates(['artist_id'], inplace=True)  # Remove duplicate entries based on artist ID
-            df_artists = df_artists.reset_index(drop=True)  # Reset index after deduplication
-
-            # Validate the DataFrame using Great Expectations for data quality checks
-            validate_expectations(df_artists, self.expectations_suite_name)
-
-            # Upload the validated data back to MinIO
-            self.uploader.upload_files(data=df_artists)
-            print(f"Successfully uploaded to '{self.processed}' container!!")  # Confirmation message
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
+
+            # Stream the artists of new raw objects chunk by chunk, removing artist IDs that are already stored,
+            # validating with Great Expectations and merging into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['artist_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")  # Confirmation message
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")  # Handle any exceptions encountered
 
 # Function to initialize and run the retrieval process for top artists
-def run_retrieve_top_artists():
+def run_retrieve_top_artists(full_refresh=False):
     ob = RetrieveTopArtists(os.getenv('USER_NAME'), \
                             TOPIC_CONFIG["top_artists"]["topic"], \
                             "raw", \
                             "processed")  # Create an instance of RetrieveTopArtists
-    ob.get_user_top_artists()  # Call the method to retrieve top artists
+    ob.get_user_top_artists(full_refresh)  # Call the method to retrieve top artists
 
 if __name__ == "__main__":
-    run_retrieve_top_artists()  # Execute the function if the script is run directly
+    run_retrieve_top_artists('--full-refresh' in sys.argv)  # Execute the function if the script is run directly
 
 
 
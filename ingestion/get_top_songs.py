@@ -4,10 +4,10 @@ import site
 sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_checks.validate_expectations import validate_expectations
 import pandas as pd
 from datetime import datetime
 from ingestion.retrieve_objects import MinioRetriever,MinioUploader
+from ingestion.streaming import ingest_raw
 from ingestion.utils import TOPIC_CONFIG
 from dotenv import load_dotenv
 
@@ -22,56 +22,58 @@ class RetrieveTopSongs():
         self.processed = processed  # Path for storing processed data
         self.expectations_suite_name = 'top_songs_suite'  # Suite name for data quality checks
 
+        # Where each column is found in a raw record, compiled once into a fast extractor.
+        # Each raw record holds a single track as its first item.
+        self.spec = {
+            'track_name': ('items', 0, 'name'),  # Track name
+            'track_id': ('items', 0, 'id'),  # Track ID
+            'track_uri': ('items', 0, 'uri'),  # Track URI
+            'artist_name': ('items', 0, 'artists', 0, 'name'),  # First artist's name
+            'artist_id': ('items', 0, 'artists', 0, 'id'),  # First artist's ID
+            'album_name': ('items', 0, 'album', 'name'),  # Album name
+            'album_id': ('items', 0, 'album', 'id'),  # Album ID
+            'album_release_date': ('items', 0, 'album', 'release_date'),  # Album release date
+            'duration_ms': ('items', 0, 'duration_ms'),  # Duration of the track in milliseconds
+            'popularity': ('items', 0, 'popularity'),  # Track popularity score
+            'explicit': ('items', 0, 'explicit'),  # Whether the track is explicit
+            'external_url': ('items', 0, 'external_urls', 'spotify'),  # External Spotify URL
+        }
+
+    # Add the ingestion timestamp to a chunk of top songs
+    def prepare(self, df_songs):
+        df_songs['ingested_on'] = self.ingested_on  # Add a timestamp for ingestion
+        return df_songs
+
     # Method to retrieve and process the user's top songs
-    def get_user_top_songs(self):
+    def get_user_top_songs(self, full_refresh=False):
         
         try:
-            tracks = []  # Initialize a list to hold song data
-            results = self.retriever.retrieve_object()  # Retrieve raw data from MinIO
-            
-            # Process each track's information from the retrieved results
-            for result in results:
-                item = result["items"][0]  # Access the first item in the result
-                tracks.append({
-                    'track_name': item['name'],  # Extract track name
-                    'track_id': item['id'],  # Extract track ID
-                    'track_uri': item['uri'],  # Extract track URI
-                    'artist_name': item['artists'][0]['name'],  # Extract first artist's name
-                    'artist_id': item['artists'][0]['id'],  # Extract first artist's ID
-                    'album_name': item['album']['name'],  # Extract album name
-                    'album_id': item['album']['id'],  # Extract album ID
-                    'album_release_date': item['album']['release_date'],  # Extract album release date
-                    'duration_ms': item['duration_ms'],  # Extract duration of the track in milliseconds
-                    'popularity': item['popularity'],  # Extract track popularity score
-                    'explicit': item['explicit'],  # Check if the track is explicit
-                    'external_url': item['external_urls']['spotify'],  # Get external Spotify URL
-                })
-
-            # Convert the list of tracks into a DataFrame for further processing
-            df_songs = pd.DataFrame(tracks)
-            df_songs['ingested_on'] = datetime.now().strftime("%Y%m%d%H%M%S")  # Add a timestamp for ingestion
-            
-            df_songs.drop_duplicates(['track_id'], inplace=True)  # Remove duplicate entries based on track ID
-            df_songs = df_songs.reset_index(drop=True)  # Reset index after deduplication
-
-            # Validate the DataFrame using Great Expectations for data quality checks
-            validate_expectations(df_songs, self.expectations_suite_name)
+            self.ingested_on = datetime.now().strftime("%Y%m%d%H%M%S")  # One ingestion timestamp for every chunk
 
-            # Upload the validated data back to MinIO
-            self.uploader.upload_files(data=df_songs)
-            print(f"Successfully uploaded to '{self.processed}' container!!")  # Confirmation message
+            # Stream the songs of new raw objects chunk by chunk, removing track IDs that are already stored,
+            # validating with Great Expectations and merging into the table
+            rows = ingest_raw(
+                self.retriever,
+                self.uploader,
+                spec=self.spec,
+                prepare=self.prepare,
+                full_refresh=full_refresh,
+                dedup_subsets=[['track_id']],
+                expectations_suite_name=self.expectations_suite_name,
+            )
+            print(f"Successfully uploaded {rows} rows to '{self.processed}' container!!")  # Confirmation message
 
         except Exception as e:
             print(f"Encountered an exception here!!: {e}")  # Handle any exceptions encountered
 
 # Function to initialize and run the retrieval process for top songs
-def run_retrieve_top_songs():
+def run_retrieve_top_songs(full_refresh=False):
     obj = RetrieveTopSongs(os.getenv('USER_NAME'), \
                     TOPIC_CONFIG["top_songs"]["topic"], \
                     "raw", \
                     "processed")  # Create an instance of RetrieveTopSongs
-    obj.get_user_top_songs()  # Call the method to retrieve top songs
+    obj.get_user_top_songs(full_refresh)  # Call the method to retrieve top songs
 
 if __name__ == "__main__":
-    run_retrieve_top_songs()  # Execute the function if the script is run directly
+    run_retrieve_top_songs('--full-refresh' in sys.argv)  # Execute the function if the script is run directly
 
@@ -5,67 +5,106 @@ sys.path.extend(site.getsitepackages())
 import io
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import s3fs
 from dotenv import load_dotenv
 from minio import Minio
 
+from common_utility_functions.avro_codec import read_container
+
 load_dotenv(override=True)
 
 
 class MinioRetriever:
+    # Number of objects fetched concurrently, also bounds how many fetched objects are held in memory
+    FETCH_WORKERS = 16
+
     def __init__(self, user, topic, container) -> None:
         self.ret_container = container #raw
         self.user = user
         self.topic = topic.replace("_","-")
-        
-    def retrieve_object(self):
+        self.stats = {}  # Objects and bytes read by the last retrieval, with their rates
+        self.objects = []  # Paths of the objects read by the last completed retrieval
+
+    def filesystem(self):
+        # Set up S3 filesystem (MinIO uses S3 protocol)
+        return s3fs.S3FileSystem(
+            endpoint_url=f"http://{os.getenv('HOST')}:9000",
+            key="minioadmin",
+            secret="minioadmin",
+            client_kwargs={
+                'endpoint_url': f"http://{os.getenv('HOST')}:9000"
+            },
+            config_kwargs={'max_pool_connections': MinioRetriever.FETCH_WORKERS}
+        )
+
+    @staticmethod
+    def parse_object(path, content):
+        # The consumers write JSON documents or Avro container files, each holding a batch of records
+        if path.endswith('.avro'):
+            return read_container(content)
+        return json.loads(content)
+
+    def iter_records(self, skip=()):
+        """
+        Streams the records of every object under the user's prefix. Objects are fetched and parsed
+        concurrently by a bounded pool and their records are yielded in object name order.
+        The throughput of the retrieval is kept in `stats` and printed once it is done.
+
+        Args:
+            skip (set): Paths of objects to leave out, e.g. the ones an earlier run already processed.
+
+        Yields:
+            dict: The raw records.
+        """
+        fs = self.filesystem()
+        prefix = f"{self.ret_container}/{self.topic}/{self.user}"
+        # A missing prefix simply has no objects, no need for existence probes
         try:
-            # Set up S3 filesystem (MinIO uses S3 protocol)
-            fs = s3fs.S3FileSystem(
-                endpoint_url=f"http://{os.getenv('HOST')}:9000",
-                key="minioadmin",
-                secret="minioadmin",
-                client_kwargs={
-                    'endpoint_url': f"http://{os.getenv('HOST')}:9000"
-    }
-                
-            )
+            object_list = sorted(path for path in fs.ls(prefix, detail=False) if path not in skip)
+        except FileNotFoundError:
+            object_list = []
+
+        def fetch(path):
+            content = fs.cat_file(path)
+            return len(content), self.parse_object(path, content)
 
-            print(self.topic)
-
-            print(os.getenv('HOST'))
-            # List all objects in the specified subfolder
-            if fs.exists(f"{self.ret_container}"):
-                print(f"Folder Path :{self.ret_container} exists")
-            else:
-                print(f"Folder Path :{self.ret_container} does not exists")
-
-            if fs.exists(f"{self.ret_container}/{self.topic}"):
-                print(f" Folder Path: {self.ret_container}/{self.topic} exists")
-            else:
-                print(f" Folder Path: {self.ret_container}/{self.topic} exists")
-
-            if fs.exists(f"{self.ret_container}/{self.topic}/{self.user}"):
-                print(f" Folder Path: {self.ret_container}/{self.topic}/{self.user} exists")
-            else:
-                print(f"Folder Path : {self.ret_container}/{self.topic}/{self.user} does not exists")
-
-            object_list = fs.ls(f"{self.ret_container}/{self.topic}/{self.user}")
-            # Initialize an empty list to store all JSON data
-            all_data = []
-
-            # Iterate through each object and read its content
-            for obj in object_list:
-                with fs.open(obj, 'r') as f:
-                    json_data = json.load(f)
-                    for record in json_data: # unpacking batched data if any
-                        all_data.append(record)
-            return all_data
-            
-            # print(f"Successfully retrieved and converted {len(all_data[0])} objects from {self.topic}/{self.user}")
-            # # return df
+        start, objects, total_bytes = time.perf_counter(), 0, 0
+        object_iter = iter(object_list)
+        with ThreadPoolExecutor(max_workers=MinioRetriever.FETCH_WORKERS) as pool:
+            while True:
+                # Fetch a window at a time so a large prefix is never held in memory at once
+                window = list(islice(object_iter, MinioRetriever.FETCH_WORKERS * 2))
+                if not window:
+                    break
+                for size, records in pool.map(fetch, window):
+                    objects += 1
+                    total_bytes += size
+                    yield from records
+
+        seconds = max(time.perf_counter() - start, 1e-9)
+        self.stats = {
+            'objects': objects,
+            'bytes': total_bytes,
+            'seconds': round(seconds, 2),
+            'objects_per_sec': round(objects / seconds, 1),
+            'bytes_per_sec': round(total_bytes / seconds),
+        }
+        self.objects = object_list
+        print(f"Retrieved {prefix}: {self.stats}")
+
+    def retrieve_object(self):
+        try:
+            # Collect the records of all objects of the user
+            return list(self.iter_records())
 
         except Exception as e:
             print(f"Error in retrieve_and_convert_to_dataframe function: {e}")
@@ -110,6 +149,128 @@ class MinioUploader:
                     data.to_parquet(f, engine='pyarrow', compression='snappy')
             except Exception as e:
                 print(f"\nError occured while uploading file to bucket : {e}")
-            
-        
-        
\ No newline at end of file
+
+
+    def filesystem(self):
+        return s3fs.S3FileSystem(
+                key="minioadmin",
+                secret="minioadmin",
+                endpoint_url=f"http://{os.getenv('HOST')}:9000",  # Explicitly set the endpoint URL
+                client_kwargs={'endpoint_url': f"http://{os.getenv('HOST')}:9000"},
+                use_ssl=False  # Set to False for localhost without HTTPS
+            )
+
+    def table_path(self):
+        return f"{self.container}/{self.topic}/{self.user}/{self.container}-{self.topic}.parquet"
+
+    def manifest_path(self):
+        # The manifest lives next to the table it describes
+        return f"{self.container}/{self.topic}/{self.user}/_manifest.json"
+
+    def read_manifest(self):
+        """
+        Returns:
+            dict: The manifest of the table, `raw_objects` lists the raw objects already merged into it.
+                Empty if the table was never written incrementally.
+        """
+        try:
+            return json.loads(self.filesystem().cat_file(self.manifest_path()))
+        except FileNotFoundError:
+            return {'raw_objects': []}
+
+    def write_manifest(self, manifest):
+        self.filesystem().pipe_file(self.manifest_path(), json.dumps(manifest).encode("utf-8"))
+
+    def read_columns(self, columns):
+        """
+        Reads only the given columns of the current table.
+
+        Returns:
+            pyarrow.Table: The columns, or None if the table does not exist yet.
+        """
+        try:
+            with self.filesystem().open(self.table_path(), 'rb') as f:
+                return pq.read_table(f, columns=columns)
+        except FileNotFoundError:
+            return None
+
+    def upload_chunks(self, chunks, merge=False):
+        """
+        Writes DataFrame chunks one after another as row groups of a single Parquet object, so only
+        one chunk is held in memory at a time. The Parquet schema is taken from the first chunk and
+        later chunks are converted to it. If anything fails the partial upload is discarded and the
+        previous object is left untouched.
+
+        Args:
+            chunks (iterable): DataFrames with the same columns.
+            merge (bool): Keep the rows of the current table and append the chunks after them. Its row
+                groups are copied one at a time and its schema is kept. Nothing is written if there are
+                no chunks.
+
+        Returns:
+            int: Number of rows written, not counting the rows kept from the current table.
+        """
+        minio_client = Minio(
+            f"{os.environ.get('HOST')}:9000",
+            access_key="minioadmin",
+            secret_key="minioadmin",
+            secure=False  # Keep this False for localhost without HTTPS
+        )
+        fs = self.filesystem()
+        path = self.table_path()
+
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            if merge:
+                return 0  # The current table is already up to date
+            raise ValueError("No rows to upload")
+
+        self.ensure_bucket_exists(minio_client, self.container)
+        source = current = None
+        if merge:
+            try:
+                source = fs.open(path, 'rb')
+                current = pq.ParquetFile(source)
+            except FileNotFoundError:
+                pass
+
+        # The new object only replaces the current one once it is complete, so it can be read meanwhile
+        f = fs.open(path, 'wb')
+        writer, rows = None, 0
+        try:
+            if current is not None:
+                writer = pq.ParquetWriter(f, current.schema_arrow, compression='snappy')
+                for i in range(current.num_row_groups):
+                    writer.write_table(current.read_row_group(i))
+
+            for df in chain([first], chunks):
+                if writer is None:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    table = table.cast(self.concrete_schema(table.schema))
+                    writer = pq.ParquetWriter(f, table.schema, compression='snappy')
+                else:
+                    table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+                writer.write_table(table)  # One row group per chunk
+                rows += len(df)
+
+            writer.close()
+            f.close()
+            return rows
+        except Exception:
+            f.discard()  # Abort the upload instead of replacing the object with a partial file
+            raise
+        finally:
+            if source is not None:
+                source.close()
+
+    @staticmethod
+    def concrete_schema(schema):
+        # Columns that were entirely empty in the first chunk have no type yet, store them as strings
+        def concrete(data_type):
+            if pa.types.is_null(data_type):
+                return pa.string()
+            if pa.types.is_list(data_type):
+                return pa.list_(concrete(data_type.value_type))
+            return data_type
+        return pa.schema([field.with_type(concrete(field.type)) for field in schema], metadata=schema.metadata)
@@ -0,0 +1,188 @@
+import site
+import sys, os
+
+sys.path.extend(site.getsitepackages())
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itertools import islice
+from operator import itemgetter
+
+import pandas as pd
+import pyarrow.compute as pc
+
+from data_checks.validate_expectations import validate_expectations
+
+# Number of flattened rows per chunk, i.e. per Parquet row group
+CHUNK_SIZE = 10000
+
+
+def compile_extractor(spec):
+    """
+    Compiles a flattening spec into a function that appends the fields of each record straight to
+    per-column buffers, without building a dictionary per row. Lookups run a chunk at a time with
+    `operator.itemgetter` mapped over all records, and a path prefix shared by several columns, such as
+    `('track',)`, is looked up only once per record.
+
+    Args:
+        spec (dict): Column name -> path into a record. A path is a tuple of dictionary keys and list
+            indices, e.g. `('track', 'artists', 0, 'id')`, or a callable that receives the record.
+
+    Returns:
+        callable: `extract(records, buffers, limit)` that consumes at most `limit` records from the
+            iterator `records`, appends one value per column to the lists in `buffers` (in spec order)
+            and returns the number of records consumed.
+    """
+    # Every column reads its value with one last step from the values at its parent prefix
+    columns = [((), path) if callable(path) else (tuple(path[:-1]), itemgetter(path[-1])) for path in spec.values()]
+    # Each prefix is looked up from its own parent, shorter prefixes first
+    prefixes = sorted({parent[:i] for parent, _ in columns for i in range(1, len(parent) + 1)}, key=len)
+    steps = [(prefix, prefix[:-1], itemgetter(prefix[-1])) for prefix in prefixes]
+
+    def extract(records, buffers, limit):
+        values = {(): list(islice(records, limit))}
+        for prefix, parent, step in steps:
+            values[prefix] = list(map(step, values[parent]))
+        for buffer, (parent, step) in zip(buffers, columns):
+            buffer.extend(map(step, values[parent]))
+        return len(values[()])
+
+    return extract
+
+
+def iter_column_chunks(records, spec, chunk_size=CHUNK_SIZE):
+    """
+    Flattens records with a compiled spec into column buffers, handed out every `chunk_size` records.
+
+    Args:
+        records (iterable): Records to flatten, usually a generator over the raw objects.
+        spec (dict): The flattening spec, see `compile_extractor`.
+        chunk_size (int): Number of rows per chunk.
+
+    Yields:
+        dict: Column name -> list of values, for at most `chunk_size` rows.
+    """
+    extract = compile_extractor(spec)
+    records = iter(records)
+    while True:
+        buffers = [[] for _ in spec]
+        if not extract(records, buffers, chunk_size):
+            return
+        yield dict(zip(spec, buffers))
+
+
+class ChunkDeduplicator:
+    """
+    Drops rows whose key was already seen in this chunk or an earlier one. Only the keys are kept
+    between chunks, so deduplication across the whole table stays cheap in memory.
+    """
+
+    def __init__(self, subsets):
+        """
+        Args:
+            subsets (list): Column lists, a row is dropped if its key for any of them was seen before.
+                Subsets are applied in order, like consecutive `drop_duplicates` calls.
+        """
+        self.subsets = [list(subset) for subset in subsets]
+        self.seen = [set() for _ in self.subsets]
+
+    def columns(self):
+        return list(dict.fromkeys(column for subset in self.subsets for column in subset))
+
+    def add_existing(self, table):
+        """
+        Marks the keys of rows that are already stored as seen.
+
+        Args:
+            table (pyarrow.Table): At least the key columns of the stored rows.
+        """
+        for subset, seen in zip(self.subsets, self.seen):
+            seen.update(zip(*(table.column(column).to_pylist() for column in subset)))
+
+    def __call__(self, df):
+        for subset, seen in zip(self.subsets, self.seen):
+            keys = zip(*(df[column] for column in subset))
+            keep = [not (key in seen or seen.add(key)) for key in keys]
+            df = df[keep]
+        return df.reset_index(drop=True)
+
+
+def ingest_stream(records, spec, prepare, uploader, dedup_subsets=(), expectations_suite_name=None, chunk_size=CHUNK_SIZE,
+                  merge=False, sequence_columns=None):
+    """
+    Streams records into the processed table chunk by chunk: each chunk is flattened by `spec`,
+    turned into a DataFrame, typed by `prepare`, deduplicated against all earlier rows, validated and
+    written as one Parquet row group. Peak memory depends on the chunk size, not on the size of the library.
+
+    Args:
+        records (iterable): Records to flatten, usually a generator over the raw objects.
+        spec (dict): Column name -> path into a record, see `compile_extractor`.
+        prepare (callable): Turns the DataFrame of a chunk into its final form, e.g. adds `ingested_on`
+            and applies the dtypes.
+        uploader (MinioUploader): Uploads the processed table.
+        dedup_subsets (list): Column lists to deduplicate on, see `ChunkDeduplicator`.
+        expectations_suite_name (str): Great Expectations suite every chunk is validated against.
+        chunk_size (int): Number of rows per chunk.
+        merge (bool): Merge the rows into the current table by key instead of replacing it. Rows whose
+            key is already stored are dropped and the rest is appended, see `MinioUploader.upload_chunks`.
+        sequence_columns (dict): Generated ID columns and the number each run counts them from. When
+            merging they are shifted to continue after the highest stored ID, so they stay unique.
+
+    Returns:
+        int: Number of rows written.
+    """
+    deduplicate = ChunkDeduplicator(dedup_subsets)
+    sequence_columns = sequence_columns or {}
+    offsets = {}
+    if merge:
+        # Only the key and ID columns of the current table are read
+        existing = uploader.read_columns(list(dict.fromkeys(deduplicate.columns() + list(sequence_columns))))
+        if existing is not None and existing.num_rows:
+            deduplicate.add_existing(existing)
+            offsets = {column: pc.max(existing.column(column)).as_py() + 1 - start for column, start in sequence_columns.items()}
+
+    def chunks():
+        for buffers in iter_column_chunks(records, spec, chunk_size):
+            df = prepare(pd.DataFrame(buffers, columns=list(spec)))
+            for column, offset in offsets.items():
+                df[column] += offset
+            df = deduplicate(df)
+            if df.empty:
+                continue
+            if expectations_suite_name:
+                validate_expectations(df, expectations_suite_name)
+            yield df
+
+    return uploader.upload_chunks(chunks(), merge=merge)
+
+
+def ingest_raw(retriever, uploader, spec, prepare, flatten=None, full_refresh=False, **kwargs):
+    """
+    Ingests the raw objects of a user into a processed table. By default only the raw objects that are
+    not in the table's manifest yet are read, and their rows are merged into the table by key. Cost thus
+    grows with what changed since the previous run, not with the user's whole history. The manifest is
+    updated once the table is written, so objects of a failed run are simply read again next time.
+
+    Args:
+        retriever (MinioRetriever): Reads the raw objects.
+        uploader (MinioUploader): Writes the processed table and its manifest.
+        spec (dict): The flattening spec, see `compile_extractor`.
+        prepare (callable): Turns the DataFrame of a chunk into its final form.
+        flatten (callable): Turns the stream of raw records into the records `spec` applies to,
+            e.g. the items of every page. The raw records are used as they are when omitted.
+        full_refresh (bool): Read every raw object and rebuild the table from scratch.
+        **kwargs: Passed on to `ingest_stream`, e.g. `dedup_subsets` and `expectations_suite_name`.
+
+    Returns:
+        int: Number of rows written.
+    """
+    manifest = {'raw_objects': []} if full_refresh else uploader.read_manifest()
+    processed_objects = set(manifest['raw_objects'])
+
+    records = retriever.iter_records(skip=processed_objects)
+    rows = ingest_stream(flatten(records) if flatten else records, spec, prepare, uploader, merge=not full_refresh, **kwargs)
+
+    if retriever.objects:
+        manifest['raw_objects'] = sorted(processed_objects.union(retriever.objects))
+        uploader.write_manifest(manifest)
+    print(f"Merged {len(retriever.objects)} new raw objects into {uploader.table_path()}")
+    return rows
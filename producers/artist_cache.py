@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Default location of the cache database, shared by every producer process on the host
+DEFAULT_CACHE_PATH = os.getenv(
+    'ARTIST_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artist_cache.sqlite')
+)
+
+
+class ArtistMetadataCache:
+    """
+    ArtistMetadataCache stores Spotify responses that depend only on the artist, such as related
+    artists and artist albums, so they are fetched once and reused for every user.
+
+    Entries live in a local SQLite database that several producer processes can share. They expire
+    after `ttl_seconds`, and once the cache holds more than `max_entries` the oldest entries are
+    evicted. Hit and miss counters are kept per process.
+    """
+
+    # Run expiry and size eviction after this many writes rather than on every write
+    EVICT_EVERY = 100
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=7 * 24 * 3600, max_entries=200000):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+            ttl_seconds (int): How long an entry stays valid after being fetched.
+            max_entries (int): Maximum number of entries kept in the cache.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers and a writer from other processes can work concurrently
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artist_cache ("
+                "kind TEXT NOT NULL, artist_id TEXT NOT NULL, payload TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (kind, artist_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS artist_cache_fetched_at ON artist_cache (fetched_at)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, kind, artist_id):
+        """
+        Looks up a cached response.
+
+        Args:
+            kind (str): The type of response, e.g. 'related_artists' or 'artist_albums'.
+            artist_id (str): The Spotify artist ID.
+
+        Returns:
+            The cached response, or None if it is missing or expired.
+        """
+        row = self._connection().execute(
+            "SELECT payload FROM artist_cache WHERE kind = ? AND artist_id = ? AND fetched_at >= ?",
+            (kind, artist_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, kind, artist_id, payload):
+        """
+        Stores a response in the cache, replacing any previous entry.
+
+        Args:
+            kind (str): The type of response, e.g. 'related_artists' or 'artist_albums'.
+            artist_id (str): The Spotify artist ID.
+            payload: A JSON serializable response.
+        """
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO artist_cache (kind, artist_id, payload, fetched_at) VALUES (?, ?, ?, ?)",
+            (kind, artist_id, json.dumps(payload), time.time())
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def get_or_fetch(self, kind, artist_id, fetch):
+        """
+        Returns the cached response, calling `fetch` and caching its result on a miss.
+
+        Args:
+            kind (str): The type of response, e.g. 'related_artists' or 'artist_albums'.
+            artist_id (str): The Spotify artist ID.
+            fetch (callable): Called without arguments to retrieve the response from Spotify.
+
+        Returns:
+            The cached or freshly fetched response.
+        """
+        payload = self.get(kind, artist_id)
+        if payload is None:
+            payload = fetch()
+            self.put(kind, artist_id, payload)
+        return payload
+
+    def evict(self):
+        """
+        Removes expired entries and, if the cache is still over its size bound, the oldest ones.
+        """
+        conn = self._connection()
+        conn.execute("DELETE FROM artist_cache WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM artist_cache WHERE rowid IN ("
+            "SELECT rowid FROM artist_cache ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Cache hits, misses and hit ratio of this process.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 2) if lookups else 0.0,
+            }
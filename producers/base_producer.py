@@ -1,60 +1,147 @@
 from kafka import KafkaProducer
-from utils import TOPIC_CONFIG
+from utils import TOPIC_CONFIG, TOPIC_CODECS
 import json
-import io
-import avro.schema
-from avro.io import DatumWriter
 from concurrent.futures import ThreadPoolExecutor
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
 from utils import scope
+from rate_limiter import AdaptiveRateLimiter, RateLimitedSpotify
+from artist_cache import ArtistMetadataCache
 
 import os 
+import copy
+import threading
 from dotenv import load_dotenv
 load_dotenv(override=True)
 # Kafka broker address
 KAFKA_BOOTSTRAP_SERVERS = ['localhost:9093']
 
-class SpotifyKafkaProducer:
+def create_spotify_client(user_id=None):
     """
-    SpotifyKafkaProducer is a producer class that sends serialized Avro-encoded messages to various Kafka topics.
-    It supports multi-threaded message production using a ThreadPoolExecutor.
+    Creates a Spotify client whose requests are paced by the shared adaptive rate limiter.
+
+    Args:
+        user_id (str): The user to authenticate as. Their OAuth token is cached in `.cache-<user_id>`,
+            which must have been authorized once before the user can be served unattended.
+            When omitted the default token cache is used.
+
+    Returns:
+        RateLimitedSpotify: The Spotify client.
+    """
+    auth_manager = SpotifyOAuth(client_id = os.getenv('SPOTIPY_CLIENT_ID'), client_secret = os.getenv('SPOTIPY_CLIENT_SECRET'), redirect_uri = os.getenv('SPOTIPY_REDIRECT_URI'), scope=scope, username=user_id)
+    return RateLimitedSpotify(SpotifyKafkaProducer.RATE_LIMITER, auth_manager=auth_manager)
+
+
+class ProducerSession:
+    """
+    ProducerSession owns the connections a producer needs: one Kafka producer, one authenticated
+    Spotify client and one worker pool. Producers created with the same session share them, so a
+    fan-out such as liked songs -> artist albums -> related artists sets them up only once.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=8, producer=None, spotify_factory=None):
         """
-        Initializes the Kafka producer and sets up a thread pool executor for asynchronous message production.
+        Opens the Kafka connection, the Spotify client and the worker pool.
+
+        Args:
+            max_workers (int): Number of worker threads for Kafka sends and concurrent Spotify requests.
+            producer (KafkaProducer): An existing Kafka producer to use instead of opening a new one.
+            spotify_factory (callable): Called with a user ID (or None for the default user) to create
+                a Spotify client, defaults to `create_spotify_client`.
         """
         # Create a Kafka producer with string key serialization and Gzip compression for message payloads
-        self.producer = KafkaProducer(
+        self.producer = producer or KafkaProducer(
             bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
             key_serializer=str.encode,  # Serialize keys as strings
             compression_type='gzip'  # Compress messages using gzip to save bandwidth
         )
         
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(client_id = os.getenv('SPOTIPY_CLIENT_ID'), client_secret = os.getenv('SPOTIPY_CLIENT_SECRET'), redirect_uri = os.getenv('SPOTIPY_REDIRECT_URI'), scope=scope))
+        # Spotify client whose requests are paced by the shared adaptive rate limiter
+        self.spotify_factory = spotify_factory or create_spotify_client
+        self.sp = self.spotify_factory(None)
 
-        # Set up a thread pool executor for asynchronous processing with a maximum of 5 worker threads
-        self.executor = ThreadPoolExecutor(max_workers=5)  # Adjust based on your concurrency needs
+        # Set up a thread pool executor shared by every producer of the session
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)  # Adjust based on your concurrency needs
 
-    def avro_serializer(self, data, schema):
+    def for_user(self, user_id):
         """
-        Serializes a Python dictionary into Avro format using the provided schema.
+        Returns a view of the session that shares its Kafka producer and worker pool but calls
+        Spotify with the token of the given user. Closing the view is not needed.
+
+        Args:
+            user_id (str): The Spotify user ID.
+
+        Returns:
+            ProducerSession: The session for the user.
+        """
+        user_session = copy.copy(self)
+        user_session.sp = self.spotify_factory(user_id)
+        return user_session
+
+    def close(self):
+        """
+        Gracefully shuts down the worker pool and the Kafka producer.
+        Ensures that all pending messages are sent and resources are cleaned up.
+        """
+        self.executor.shutdown()  # Shut down the executor, waiting for all tasks to complete
+        self.producer.flush()  # Ensure all buffered records are sent to Kafka
+        self.producer.close()  # Close the Kafka producer to release resources
+        print(f"Spotify API rate limiter: {SpotifyKafkaProducer.RATE_LIMITER.metrics()}")
+        print(f"Artist metadata cache: {SpotifyKafkaProducer.ARTIST_CACHE.metrics()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SpotifyKafkaProducer:
+    """
+    SpotifyKafkaProducer is a producer class that sends serialized Avro-encoded messages to various Kafka topics.
+    It supports multi-threaded message production using the ThreadPoolExecutor of its ProducerSession.
+    All Spotify API calls made by producers in the same process are paced by one shared rate limiter.
+    """
+
+    # Token bucket shared by every producer so the process as a whole stays under Spotify's rate limit
+    RATE_LIMITER = AdaptiveRateLimiter()
+    # Cache of artist-level responses (related artists, albums) shared across users and producer processes
+    ARTIST_CACHE = ArtistMetadataCache()
+
+    def __init__(self, session=None):
+        """
+        Initializes the producer on top of a ProducerSession.
+
+        Args:
+            session (ProducerSession): A session shared with other producers. When omitted the producer
+                opens its own session and closes it in `close()`.
+        """
+        self.owns_session = session is None
+        self.session = session or ProducerSession()
+
+        # Kafka producer, Spotify client and thread pool all come from the (possibly shared) session
+        self.producer = self.session.producer
+        self.sp = self.session.sp
+        self.executor = self.session.executor
+
+        # Number of messages handed to Kafka by this producer, reported by the producer runner
+        self.message_count = 0
+        self.message_count_lock = threading.Lock()
+
+    def avro_serializer(self, data, topic_key):
+        """
+        Serializes a Python dictionary into Avro format using the precompiled codec of the topic.
 
         Args:
             data (dict): The data to be serialized.
-            schema (avro.schema.Schema): The Avro schema to use for serialization.
+            topic_key (str): The key of the topic in `TOPIC_CONFIG` whose schema is used for serialization.
 
         Returns:
             bytes: The serialized data in Avro format.
     
         """
         try:
-            writer = DatumWriter(schema)  # Create an Avro DatumWriter for the provided schema
-            bytes_writer = io.BytesIO()  # Create a BytesIO buffer to store serialized data
-            encoder = avro.io.BinaryEncoder(bytes_writer)  # Create a BinaryEncoder to write to the buffer
-            writer.write(data, encoder)  # Write the data using the writer
-            return bytes_writer.getvalue()  # Return the serialized data as bytes
+            return TOPIC_CODECS[topic_key].encode(data)  # Encode with the schema compiled once per topic
         except Exception as e:
             print(f"schema mismatch: {e}")
 
@@ -77,13 +164,14 @@ class SpotifyKafkaProducer:
         # Retrieve the topic name and schema for the specified topic_key from TOPIC_CONFIG
         topic = TOPIC_CONFIG[topic_key]['topic']
         # print(f"producer: {topic}")
-        schema = TOPIC_CONFIG[topic_key]['schema']
         
         # Serialize the data using Avro format
-        avro_data = self.avro_serializer(data, schema)
+        avro_data = self.avro_serializer(data, topic_key)
         
         # Send the message to the Kafka topic asynchronously
         future = self.producer.send(topic=topic, key=user_id, value=avro_data)
+        with self.message_count_lock:
+            self.message_count += 1
         return future
 
     # Methods to produce messages to specific Kafka topics related to Spotify data
@@ -207,9 +295,10 @@ class SpotifyKafkaProducer:
 
     def close(self):
         """
-        Gracefully shuts down the producer and the thread pool executor.
-        Ensures that all pending messages are sent and resources are cleaned up.
+        Gracefully shuts down the producer.
+        A session opened by this producer is closed; a shared session is only flushed and stays open for the other producers.
         """
-        self.executor.shutdown()  # Shut down the executor, waiting for all tasks to complete
-        self.producer.flush()  # Ensure all buffered records are sent to Kafka
-        self.producer.close()  # Close the Kafka producer to release resources
+        if self.owns_session:
+            self.session.close()  # Shut down the executor and the Kafka producer
+        else:
+            self.producer.flush()  # Ensure all buffered records are sent to Kafka
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Default location of the watermark database, shared by every producer process on the host
+DEFAULT_WATERMARK_PATH = os.getenv(
+    'PLAY_WATERMARK_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'play_watermarks.sqlite')
+)
+
+
+class PlayWatermarkStore:
+    """
+    PlayWatermarkStore remembers, per user, the `played_at` time (in Unix milliseconds) of the newest
+    recently played track that has been delivered to Kafka.
+
+    The recent plays producer passes the watermark as Spotify's `after` cursor so only newer plays are
+    requested. Watermarks only ever move forward, so a stale or repeated update never causes plays
+    to be fetched again.
+    """
+
+    def __init__(self, path=DEFAULT_WATERMARK_PATH):
+        """
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # Several producer processes may read and update watermarks
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS play_watermarks ("
+                "user_id TEXT PRIMARY KEY, played_at_ms INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id):
+        """
+        Looks up the watermark of a user.
+
+        Args:
+            user_id (str): The Spotify user ID.
+
+        Returns:
+            int: The `played_at` time of the newest delivered play in Unix milliseconds, or None if
+                 nothing has been delivered for the user yet.
+        """
+        row = self._connection().execute(
+            "SELECT played_at_ms FROM play_watermarks WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def advance(self, user_id, played_at_ms):
+        """
+        Moves the watermark of a user forward. Older values than the stored one are ignored.
+
+        Args:
+            user_id (str): The Spotify user ID.
+            played_at_ms (int): The `played_at` time of the newest delivered play in Unix milliseconds.
+        """
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO play_watermarks (user_id, played_at_ms, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            "played_at_ms = MAX(played_at_ms, excluded.played_at_ms), updated_at = excluded.updated_at",
+            (user_id, played_at_ms, time.time())
+        )
+        conn.commit()
@@ -1,6 +1,5 @@
 import os
 from spotipy import Spotify
-import time
 import spotipy
 from dotenv import load_dotenv
 from base_producer import SpotifyKafkaProducer
@@ -18,13 +17,13 @@ class ArtistAlbumsProducer(SpotifyKafkaProducer):
     and sending this data to a Kafka topic for further processing.
     """
 
-    def __init__(self):
+    def __init__(self, session=None):
         """
         Initialize the ArtistAlbumsProducer class.
         Calls the parent class's constructor to set up the Spotify client 
         and Kafka producer components required for API calls and data streaming.
         """
-        super().__init__()
+        super().__init__(session)
 
     def get_artist_ids(self, user_id, artist_ids):
         """
@@ -55,6 +54,33 @@ class ArtistAlbumsProducer(SpotifyKafkaProducer):
         
         return albums
 
+    def get_artist_albums(self, artist_id, max_albums=10):
+        """
+        Fetches up to `max_albums` albums, singles and compilations for an artist.
+        Album listings are the same for every user, so they are served from the cross-user
+        artist cache when possible, keyed by the artist and `max_albums`.
+
+        :param artist_id: The Spotify ID of the artist to fetch albums for.
+        :param max_albums: The maximum number of albums to return.
+        :return: A list of albums for the artist.
+        """
+        def fetch():
+            albums = []
+            # Fetch the first batch of albums for the artist.
+            result = self.sp.artist_albums(artist_id, album_type='album,single,compilation', limit=max_albums)
+
+            # Continue fetching until either enough albums are retrieved or there are no more results.
+            while result['items'] and len(albums) < max_albums:
+                albums.extend(result['items'])
+                if len(albums) < max_albums and result['next']:
+                    result = self.sp.next(result)
+                else:
+                    break
+            return albums
+
+        # The listing depends on the limit, so each limit is cached on its own
+        return self.ARTIST_CACHE.get_or_fetch(f'artist_albums:{max_albums}', artist_id, fetch)
+
     def process_spotify_data(self, user_id, artist_ids=None):
         """
         Processes artist data, retrieves albums for each artist, and sends this data to Kafka.
@@ -80,18 +106,7 @@ class ArtistAlbumsProducer(SpotifyKafkaProducer):
             # Loop through each artist ID and fetch up to 10 albums for each artist.
             for artist_id in artist_ids:
                 print(f"Processing artist: {artist_id}")
-                albums = []
-                # Fetch the first batch of albums for the artist.
-                result = self.sp.artist_albums(artist_id, album_type='album,single,compilation', limit=10)
-                time.sleep(0.2)  # Slight delay to avoid API rate limits.
-                
-                # Continue fetching until either 10 albums are retrieved or there are no more results.
-                while result['items'] and len(albums) < 10:
-                    albums.extend(result['items'])
-                    if len(albums) < 10 and result['next']:
-                        result = self.sp.next(result)
-                    else:
-                        break
+                albums = self.get_artist_albums(artist_id)
 
                 # Send each album's data to the Kafka topic asynchronously.
                 for album in albums:
@@ -4,7 +4,6 @@ import os
 from datetime import datetime
 from utils import scope
 import pandas as pd
-import time
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
@@ -12,8 +11,8 @@ from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
 
 load_dotenv()
 class FollowingArtistsProducer(SpotifyKafkaProducer):
-    def __init__(self, ):
-        super().__init__()
+    def __init__(self, session=None):
+        super().__init__(session)
 
 
     def process_spotify_data(self, user_id):
@@ -34,7 +33,6 @@ class FollowingArtistsProducer(SpotifyKafkaProducer):
                 print("Sending data to Kafka\n")
                 # Fetch the current user's followed artists with pagination support
                 result = self.sp.current_user_followed_artists(limit=limit, after=after)
-                time.sleep(0.2)
                 # Send the data to Kafka as soon as it is retrieved
                 future = self.produce_following_artists(user_id, result)
                 futures.append(future)
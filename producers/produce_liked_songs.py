@@ -2,7 +2,6 @@ import os
 from datetime import datetime
 import pandas as pd
 from spotipy import Spotify
-import time
 import spotipy
 from dotenv import load_dotenv
 from kafka import KafkaProducer
@@ -22,11 +21,11 @@ class SavedTracksProducer(SpotifyKafkaProducer):
     A producer class for sending a user's saved Spotify tracks to a Kafka topic.
     """
 
-    def __init__(self):
+    def __init__(self, session=None):
         """
         Initialize the SavedTracksProducer with a Spotify client and Kafka producer.
         """
-        super().__init__()
+        super().__init__(session)
         # Initialize Kafka producer from base class
 
     def send_ids_to_related_artists_producer(self, user_id, artist_ids):
@@ -37,7 +36,7 @@ class SavedTracksProducer(SpotifyKafkaProducer):
             artist_ids (list): List of artist IDs.
             album_ids (list): List of album IDs.
         """
-        RelatedArtistsProducer().get_artist_ids(user_id, artist_ids)
+        RelatedArtistsProducer(session=self.session).get_artist_ids(user_id, artist_ids)
 
     def send_ids_to_artist_albums_producer(self, user_id, artist_ids):
         """
@@ -48,23 +47,34 @@ class SavedTracksProducer(SpotifyKafkaProducer):
             album_ids (list): List of album IDs.
         """
         print(artist_ids)
-        ArtistAlbumsProducer().get_artist_ids(user_id, artist_ids)
+        ArtistAlbumsProducer(session=self.session).get_artist_ids(user_id, artist_ids)
 
 
-    def process_spotify_data(self, user_id):
+    def process_spotify_data(self, user_id, page_size=50, chunk_size=None, fan_out=True):
         """
         Processes Spotify data for the given user by retrieving their saved tracks 
         and sending this data to Kafka for downstream processing.
 
+        Saved tracks are fetched in pages of up to `page_size` items (50 is the Spotify API maximum)
+        and each page is sent to Kafka as one record, or split into records of `chunk_size` items.
+
         Args:
             user_id (str): The Spotify user ID.
+            page_size (int): Number of saved tracks to request per API call.
+            chunk_size (int): Number of saved tracks per Kafka record, defaults to the whole page.
+            fan_out (bool): Run the artist albums and related artists producers for the collected artists.
+                The producer runner turns this off and schedules them itself.
+
+        Returns:
+            set: The IDs of the first artist of every saved track.
         """
         futures = []  # List to keep track of future objects for asynchronous Kafka sends
         max = 300
 
         try:
             offset = 0  # Offset for pagination in Spotify API
-            limit = 1  # Limit for the number of items to fetch per request (can be adjusted)
+            limit = min(page_size, 50)  # Spotify returns at most 50 saved tracks per request
+            chunk_size = chunk_size or limit
             artist_ids = set()
             print("Sending data to Kafka")
 
@@ -73,21 +83,28 @@ class SavedTracksProducer(SpotifyKafkaProducer):
                 
                 # Fetch the current user's saved tracks with pagination support
                 result = self.sp.current_user_saved_tracks(limit=limit, offset=offset)
-                time.sleep(0.2)
                 
-                print('Retrived songs')
+                print(f"Retrived {len(result['items'])} songs")
                 
                 # Break the loop if no items are returned
                 if not result['items']:
                     break
 
-                # Send the data to Kafka as soon as it is retrieved
-                future = self.produce_liked_songs(user_id, result)
-                futures.append(future)
-                artist_ids.add(result['items'][0]['track']['artists'][0]['id'])
+                # Send the page to Kafka as soon as it is retrieved, one record per chunk of items
+                for start in range(0, len(result['items']), chunk_size):
+                    chunk = dict(result, items=result['items'][start:start + chunk_size])
+                    future = self.produce_liked_songs(user_id, chunk)
+                    futures.append(future)
+
+                # Collect artist IDs as pages stream in
+                for item in result['items']:
+                    if item['track'] and item['track']['artists']:
+                        artist_ids.add(item['track']['artists'][0]['id'])
                 
-                # Increment offset for the next batch of items
-                offset += limit
+                # Stop when Spotify reports no further pages, otherwise move to the next one
+                if not result['next']:
+                    break
+                offset += len(result['items'])
 
             print("Sent all the data") 
             # After the while loop
@@ -102,10 +119,12 @@ class SavedTracksProducer(SpotifyKafkaProducer):
                 except Exception as e:
                     print(f"Failed to send message: {e}")
 
-            if artist_ids:   # artist_ids is a list
+            if artist_ids and fan_out:   # artist_ids is a set
                 self.send_ids_to_artist_albums_producer(user_id, artist_ids)
                 self.send_ids_to_related_artists_producer(user_id, artist_ids)
 
+            return artist_ids
+
         finally:
             # Close the producer to release resources
             self.close()
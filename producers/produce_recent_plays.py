@@ -1,7 +1,8 @@
 from kafka import KafkaProducer
 from base_producer import SpotifyKafkaProducer
+from play_watermarks import PlayWatermarkStore
 import os
-import time
+import sys
 from datetime import datetime
 from utils import scope
 import pandas as pd
@@ -14,60 +15,112 @@ import calendar
 load_dotenv()
 
 class RecentlyPlayedProducer(SpotifyKafkaProducer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, session=None):
+        super().__init__(session)
+
+    # Number of plays Spotify returns per request at most
+    PAGE_SIZE = 50
+    # Upper bound on the number of requests made by one catch-up run
+    MAX_CATCH_UP_PAGES = 20
+    # Watermarks of the newest play delivered to Kafka, shared by every recent plays producer
+    WATERMARKS = PlayWatermarkStore()
 
     def convert_to_unix_timestamp(self, played_at):
+        """
+        Converts a Spotify `played_at` timestamp into Unix milliseconds, the unit of the `after` cursor.
+        Since `after` is exclusive, passing the result of the newest delivered play requests only newer plays.
+
+        Args:
+            played_at (str): ISO 8601 timestamp such as '2024-05-01T12:34:56.789Z'.
 
-        # Parse the timestamp string to a datetime object
-        dt = datetime.strptime(played_at, "%Y-%m-%dT%H:%M:%S.%fZ")
+        Returns:
+            int: The timestamp in milliseconds since the epoch.
+        """
+        # Parse the timestamp string to a datetime object, Spotify omits the fraction for whole seconds
+        try:
+            dt = datetime.strptime(played_at, "%Y-%m-%dT%H:%M:%S.%fZ")
+        except ValueError:
+            dt = datetime.strptime(played_at, "%Y-%m-%dT%H:%M:%SZ")
 
         # Convert to UTC timestamp in seconds
         utc_timestamp = calendar.timegm(dt.utctimetuple())
 
         # Convert to milliseconds
-        milliseconds = int(utc_timestamp * 1000 + dt.microsecond / 1000) - 1
+        milliseconds = int(utc_timestamp * 1000 + dt.microsecond // 1000)
 
         return milliseconds
 
+    def send_page(self, user_id, result):
+        """
+        Sends one page of recent plays to Kafka and waits for the broker to acknowledge it.
+
+        Args:
+            user_id (str): The Spotify user ID.
+            result (dict): The response of `current_user_recently_played`.
+
+        Returns:
+            bool: True if the page was written to Kafka.
+        """
+        if result.get('next') is None:
+            result = dict(result, next='')  # The last page has no next URL, the schema expects a string
 
-    def process_spotify_data(self, user_id):
+        try:
+            kafka_future = self.produce_recent_plays(user_id, result).result()
+            record_metadata = kafka_future.get(timeout=10)
+            print(f"Message sent to {record_metadata.topic} partition {record_metadata.partition} offset {record_metadata.offset}")
+            return True
+        except Exception as e:
+            print(f"Failed to send message: {e}")
+            return False
+
+    def process_spotify_data(self, user_id, catch_up=False):
         """
-        Processes Spotify data for the given user by retrieving their recently played tracks
+        Processes Spotify data for the given user by retrieving the tracks played since the last run
         and sending this data to Kafka for downstream processing.
 
+        The user's watermark is passed as the `after` cursor, so plays that were already delivered are
+        not fetched again. It is advanced only after Kafka has acknowledged a page, so a failed send is
+        retried by the next run. Without a watermark the latest plays are fetched.
+
         Args:
             user_id (str): The Spotify user ID.
+            catch_up (bool): Keep requesting pages until no newer plays are left, instead of making a single request.
         """
-        futures = []
         try:
             print("Sending data to Kafka\n")
-            limit = 50
+            max_pages = self.MAX_CATCH_UP_PAGES if catch_up else 1
+
+            for _ in range(max_pages):
+                watermark = self.WATERMARKS.get(user_id)
+                if watermark is None:
+                    result = self.sp.current_user_recently_played(limit=self.PAGE_SIZE)
+                else:
+                    result = self.sp.current_user_recently_played(limit=self.PAGE_SIZE, after=watermark)
+
+                items = (result.get('items') or []) if result else []
+                if not items:
+                    print(f"No new plays for {user_id}")
+                    break
 
-            result = self.sp.current_user_recently_played(limit=limit)
-            time.sleep(0.2)
+                # Only move the watermark once the page is safely in Kafka
+                if not self.send_page(user_id, result):
+                    break
 
-            # Send to Kafka as soon as we have the data
-            future = self.produce_recent_plays(user_id, result)
-            futures.append(future)
+                newest = max(self.convert_to_unix_timestamp(item['played_at']) for item in items)
+                self.WATERMARKS.advance(user_id, newest)
 
-            # Wait for all messages to be sent
-            for future in futures:
-                try:
-                    kafka_future = future.result()
-                    record_metadata = kafka_future.get(timeout=10)
-                    print(f"Message sent to {record_metadata.topic} partition {record_metadata.partition} offset {record_metadata.offset}")
-                except Exception as e:
-                    print(f"Failed to send message: {e}")
+                # A short page means every newer play has been fetched
+                if len(items) < self.PAGE_SIZE or (watermark is not None and newest <= watermark):
+                    break
 
         finally:
             self.close()
 
-def run_producer_recent_plays():
+def run_producer_recent_plays(catch_up=False):
     recent_plays = RecentlyPlayedProducer()
-    recent_plays.process_spotify_data(os.getenv('USER_NAME'))
+    recent_plays.process_spotify_data(os.getenv('USER_NAME'), catch_up=catch_up)
 
 
 if __name__ == "__main__":
-    run_producer_recent_plays()
+    run_producer_recent_plays(catch_up='--catch-up' in sys.argv)
 
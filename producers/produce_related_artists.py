@@ -1,5 +1,5 @@
 import os
-import time
+from itertools import islice
 import spotipy
 from dotenv import load_dotenv
 
@@ -14,11 +14,15 @@ class RelatedArtistsProducer(SpotifyKafkaProducer):
     It uses Spotify's API to fetch related artists for a user's followed artists and streams this data.
     """
 
-    def __init__(self):
+    # Number of related-artist requests submitted at a time while expanding one BFS level,
+    # the shared rate limiter still decides how fast they actually go out.
+    FETCH_WINDOW = 16
+
+    def __init__(self, session=None):
         """
         Initialize the RelatedArtistsProducer with a Spotify client and Kafka producer.
         """
-        super().__init__()
+        super().__init__(session)
 
     def get_artist_ids(self, user_id, artist_ids):
         """
@@ -39,10 +43,9 @@ class RelatedArtistsProducer(SpotifyKafkaProducer):
         :return: A list of related artists.
         """
         try:
-            # Retrieve related artists from Spotify.
-            related = self.sp.artist_related_artists(artist_id)
-            time.sleep(0.2)  # Add a small delay to avoid hitting rate limits.
-            return related['artists']
+            # Retrieve related artists from the cross-user cache, falling back to Spotify.
+            return self.ARTIST_CACHE.get_or_fetch(
+                'related_artists', artist_id, lambda: self.sp.artist_related_artists(artist_id)['artists'])
         except spotipy.SpotifyException as e:
             # Handle any errors encountered while fetching related artists.
             print(f"Error getting related artists for {artist_id}: {e}")
@@ -67,11 +70,31 @@ class RelatedArtistsProducer(SpotifyKafkaProducer):
         print(f"Sent record to Kafka: {result['name']}")
         return future
 
+    def fetch_related_artists(self, artist_ids):
+        """
+        Fetches related artists for many artists concurrently on the session's worker pool.
+        Requests are submitted in windows so that the caller can stop early, and results are
+        yielded in the same order as `artist_ids` regardless of which request finishes first.
+
+        :param artist_ids: An ordered list of artist IDs.
+        :return: A generator of (artist_id, related artists) tuples.
+        """
+        artist_ids = iter(artist_ids)
+        while True:
+            window = list(islice(artist_ids, self.FETCH_WINDOW))
+            if not window:
+                return
+            yield from zip(window, self.executor.map(self.get_related_artists, window))
+
     def process_spotify_data(self, user_id, artist_ids=None, depth=2, max_artists=1000):
         """
         Processes Spotify data by retrieving related artists for each artist followed by the user.
-        The related artists are sent to a Kafka topic. It works recursively up to a specified depth
-        to fetch related artists for a specified number of iterations.
+        The related artists are sent to a Kafka topic. It works as a breadth-first traversal up to a
+        specified depth, fetching the related artists of one whole level concurrently.
+
+        Artists of a level are visited in sorted order and their results are consumed in that order,
+        so the set of artists sent and the point where `max_artists` stops the traversal are the same
+        on every run.
 
         :param user_id: The Spotify user ID.
         :param artist_ids: A set of artist IDs followed by the user.
@@ -83,48 +106,45 @@ class RelatedArtistsProducer(SpotifyKafkaProducer):
         try:
             print("Sending data to Kafka\n")
             artist_set = set()  # Keep track of processed artists.
-            to_process = set(artist_ids)  # Artists to process in the current depth level.
+            to_process = sorted(set(artist_ids))  # Artists to process in the current depth level.
             processed = set()  # Keep track of already processed artists.
             c = 0  # Counter for processed artists.
 
             # Traverse the related artist tree up to the specified depth.
             for _ in range(depth):
                 current_level = set()  # Track artists to process at the next level.
+                frontier = [artist_id for artist_id in to_process if artist_id not in processed]
                 
-                for artist_id in to_process:
-                    if artist_id not in processed:
-                        # Fetch related artists for the current artist.
-                        related = self.get_related_artists(artist_id)
-                        
-                        for artist in related:
-                            if len(artist_set) < max_artists:
-                                c += 1
-                                # Collect the necessary artist details.
-                                id = artist['id']
-                                name = artist['name']
-                                number_of_followers = artist['followers']['total']
-                                genres = tuple(artist['genres'])
-                                popularity = artist['popularity']
-                                image = artist['images'][0]['url'] if artist['images'] else ''
-                                type = artist['type']
-                                uri = artist['uri']
-                                
-                                artist_data = (id, name, number_of_followers, genres, popularity, image, type, uri)
-                                
-                                # Add artist data to the set and send to Kafka if not already processed.
-                                if artist_data not in artist_set:
-                                    artist_set.add(artist_data)
-                                    future = self.send_to_kafka(user_id, artist_data)
-                                    futures.append(future)
-                                
-                                current_level.add(artist['id'])  # Add to next-level processing.
-                        
-                        processed.add(artist_id)  # Mark the artist as processed.
+                # Fetch related artists for the whole level concurrently.
+                for artist_id, related in self.fetch_related_artists(frontier):
+                    for artist in related:
+                        if len(artist_set) < max_artists:
+                            c += 1
+                            # Collect the necessary artist details.
+                            id = artist['id']
+                            name = artist['name']
+                            number_of_followers = artist['followers']['total']
+                            genres = tuple(artist['genres'])
+                            popularity = artist['popularity']
+                            image = artist['images'][0]['url'] if artist['images'] else ''
+                            type = artist['type']
+                            uri = artist['uri']
+                            
+                            artist_data = (id, name, number_of_followers, genres, popularity, image, type, uri)
+                            
+                            # Add artist data to the set and send to Kafka if not already processed.
+                            if artist_data not in artist_set:
+                                artist_set.add(artist_data)
+                                future = self.send_to_kafka(user_id, artist_data)
+                                futures.append(future)
+                            
+                            current_level.add(artist['id'])  # Add to next-level processing.
+                    
+                    processed.add(artist_id)  # Mark the artist as processed.
                     if len(artist_set) >= max_artists:
                         break
-                    time.sleep(0.1)  # Add a slight delay to avoid hitting API rate limits.
                 
-                to_process = current_level  # Move to the next level of artists to process.
+                to_process = sorted(current_level)  # Move to the next level of artists to process.
                 if len(artist_set) >= max_artists:
                     break
 
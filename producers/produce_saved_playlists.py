@@ -1,6 +1,5 @@
 from base_producer import SpotifyKafkaProducer
 import os
-import time
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
@@ -9,8 +8,8 @@ from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
 load_dotenv()
 
 class SavedTracksProducer(SpotifyKafkaProducer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, session=None):
+        super().__init__(session)
 
     def process_spotify_data(self, user_id):
         """
@@ -30,7 +29,6 @@ class SavedTracksProducer(SpotifyKafkaProducer):
                 
                 # Fetch the current user's saved tracks with pagination support
                 result = self.sp.current_user_playlists(limit=limit, offset=offset)
-                time.sleep(0.2)
 
                 # Break the loop if no items are returned
                 if not result['items']:
@@ -2,12 +2,11 @@ from base_producer import SpotifyKafkaProducer
 import os
 
 from dotenv import load_dotenv
-import time
 
 load_dotenv()
 class TopArtistsProducer(SpotifyKafkaProducer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, session=None):
+        super().__init__(session)
 
     def process_spotify_data(self, user_id):
         """
@@ -27,7 +26,6 @@ class TopArtistsProducer(SpotifyKafkaProducer):
             while True:
                 
                 result = self.sp.current_user_top_artists(time_range=time_range, limit=limit, offset=offset)
-                time.sleep(0.2)
 
                 if not result['items']:
                     break
@@ -1,13 +1,12 @@
 from base_producer import SpotifyKafkaProducer
 import os
-import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class TopTracksProducer(SpotifyKafkaProducer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, session=None):
+        super().__init__(session)
 
     def process_spotify_data(self, user_id):
         """
@@ -27,7 +26,6 @@ class TopTracksProducer(SpotifyKafkaProducer):
             while True:
                 
                 result = self.sp.current_user_top_tracks(time_range=time_range, limit=limit, offset=offset)
-                time.sleep(0.2)
                 if not result['items']:
                     break
                 
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from base_producer import ProducerSession
+from produce_artist_albums import ArtistAlbumsProducer
+from produce_following_artists import FollowingArtistsProducer
+from produce_liked_songs import SavedTracksProducer
+from produce_recent_plays import RecentlyPlayedProducer
+from produce_related_artists import RelatedArtistsProducer
+from produce_saved_playlists import SavedTracksProducer as SavedPlaylistsProducer
+from produce_top_artists import TopArtistsProducer
+from produce_top_songs import TopTracksProducer
+
+
+def run_endpoint(producer, user_id, upstream):
+    return producer.process_spotify_data(user_id)
+
+
+def run_liked_songs(producer, user_id, upstream):
+    # The artist producers are scheduled by the graph, so liked songs only collects their artist IDs
+    return producer.process_spotify_data(user_id, fan_out=False)
+
+
+def run_for_liked_artists(producer, user_id, upstream):
+    return producer.process_spotify_data(user_id, artist_ids=upstream['liked_songs'] or set())
+
+
+# Producer dependency graph: name -> (producer class, function running it, producers it depends on).
+# A producer receives the results of its dependencies, e.g. the artist IDs collected from liked songs.
+PRODUCER_DAG = {
+    'following_artists': (FollowingArtistsProducer, run_endpoint, []),
+    'saved_playlists': (SavedPlaylistsProducer, run_endpoint, []),
+    'top_artists': (TopArtistsProducer, run_endpoint, []),
+    'top_songs': (TopTracksProducer, run_endpoint, []),
+    'recent_plays': (RecentlyPlayedProducer, run_endpoint, []),
+    'liked_songs': (SavedTracksProducer, run_liked_songs, []),
+    'artist_albums': (ArtistAlbumsProducer, run_for_liked_artists, ['liked_songs']),
+    'related_artists': (RelatedArtistsProducer, run_for_liked_artists, ['liked_songs']),
+}
+
+
+def run_producer_dag(user_id, session=None, max_parallel=4, dag=PRODUCER_DAG):
+    """
+    Runs every producer of the graph once for a user. A producer starts as soon as all of its
+    dependencies have finished, and producers without pending dependencies run concurrently on one
+    shared session.
+
+    Args:
+        user_id (str): The Spotify user ID.
+        session (ProducerSession): The session shared by the producers. When omitted one is opened and
+            closed for this run.
+        max_parallel (int): Number of producers running at the same time.
+        dag (dict): The producer dependency graph, see `PRODUCER_DAG`.
+
+    Returns:
+        dict: Per producer its wall time in seconds, number of messages sent and error if it failed.
+    """
+    own_session = session is None
+    session = session or ProducerSession()
+
+    def run_node(name):
+        producer_class, run, _ = dag[name]
+        producer = producer_class(session=session)
+        start = time.perf_counter()
+        try:
+            return run(producer, user_id, results), None, time.perf_counter() - start, producer.message_count
+        except Exception as e:
+            return None, e, time.perf_counter() - start, producer.message_count
+
+    results = {}  # Result of every finished producer, passed on to the producers depending on it
+    report = {}
+    pending = dict(dag)
+    try:
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            running = {}
+            while pending or running:
+                # Start every producer whose dependencies are done, each one is started exactly once
+                for name in [n for n, (_, _, deps) in pending.items() if all(d in results for d in deps)]:
+                    del pending[name]
+                    running[pool.submit(run_node, name)] = name
+
+                if not running:
+                    raise ValueError(f"Unsatisfiable producer dependencies: {sorted(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name], error, seconds, messages = future.result()
+                    report[name] = {'seconds': round(seconds, 2), 'messages': messages}
+                    if error is not None:
+                        print(f"Producer {name} failed for {user_id}: {error}")
+                        report[name]['error'] = str(error)
+    finally:
+        if own_session:
+            session.close()
+    return report
+
+
+def print_report(report):
+    """
+    Prints the wall time and message count of every producer of a run.
+    """
+    print(f"{'producer':<20}{'seconds':>10}{'messages':>10}")
+    for name, stats in report.items():
+        status = f"  failed: {stats['error']}" if 'error' in stats else ''
+        print(f"{name:<20}{stats['seconds']:>10.2f}{stats['messages']:>10}{status}")
+    print(f"{'total':<20}{'':>10}{sum(stats['messages'] for stats in report.values()):>10}")
@@ -0,0 +1,161 @@
+import bisect
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from base_producer import ProducerSession, SpotifyKafkaProducer
+from producer_dag import run_producer_dag
+from rate_limiter import AdaptiveRateLimiter
+
+
+class ConsistentHashRing:
+    """
+    ConsistentHashRing maps users to workers so that adding or removing a worker only moves the users
+    of that worker. Each worker is placed on the ring `replicas` times to even out the shard sizes.
+    """
+
+    def __init__(self, workers, replicas=100):
+        """
+        Args:
+            workers (list): Names of the workers.
+            replicas (int): Number of points per worker on the ring.
+        """
+        self.ring = sorted((self._hash(f"{worker}#{i}"), worker) for worker in workers for i in range(replicas))
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16)
+
+    def worker_for(self, user_id):
+        """
+        Returns:
+            str: The worker that owns the user, i.e. the first ring point clockwise of the user's hash.
+        """
+        index = bisect.bisect(self.points, self._hash(user_id)) % len(self.points)
+        return self.ring[index][1]
+
+
+def load_roster(path=None):
+    """
+    Loads the users to produce data for.
+
+    Args:
+        path (str): File with one Spotify user ID per line, blank lines and lines starting with '#' are ignored.
+            Defaults to `USER_ROSTER` from the environment; without a roster the single `USER_NAME` is used.
+
+    Returns:
+        list: The user IDs without duplicates, in roster order.
+    """
+    path = path or os.getenv('USER_ROSTER')
+    if not path:
+        return [os.getenv('USER_NAME')]
+    with open(path) as f:
+        users = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return list(dict.fromkeys(users))
+
+
+def shard_users(users, workers):
+    """
+    Splits users over workers with consistent hashing.
+
+    Args:
+        users (list): The user IDs.
+        workers (int): Number of workers.
+
+    Returns:
+        list: One list of user IDs per worker.
+    """
+    ring = ConsistentHashRing([f"worker-{i}" for i in range(workers)])
+    shards = {f"worker-{i}": [] for i in range(workers)}
+    for user_id in users:
+        shards[ring.worker_for(user_id)].append(user_id)
+    return list(shards.values())
+
+
+def produce_for_user(session, user_id):
+    """
+    Runs the producer graph for one user on the user's view of the shared session.
+
+    Returns:
+        str: The user ID.
+    """
+    run_producer_dag(user_id, session=session.for_user(user_id))
+    return user_id
+
+
+def limit_worker_rate(workers):
+    """
+    Gives a worker process its share of the Spotify rate budget. Spotify limits requests per app, not
+    per process, so the rates and the burst of the process limiter are divided by the number of workers.
+
+    Args:
+        workers (int): Number of worker processes sharing the budget.
+    """
+    limiter = SpotifyKafkaProducer.RATE_LIMITER
+    SpotifyKafkaProducer.RATE_LIMITER = AdaptiveRateLimiter(
+        rate=limiter.rate / workers,
+        max_rate=limiter.max_rate / workers,
+        min_rate=limiter.min_rate / workers,
+        capacity=max(1, limiter.capacity // workers),
+        increase_step=limiter.increase_step / workers,
+    )
+
+
+def run_worker(users, user_concurrency=4, session_factory=ProducerSession):
+    """
+    Produces data for a shard of users over one Kafka producer, one worker pool and one rate limiter.
+
+    Args:
+        users (list): The user IDs of the shard.
+        user_concurrency (int): Number of users served at the same time.
+        session_factory (callable): Creates the ProducerSession shared by the shard.
+
+    Returns:
+        dict: Number of users served and the elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    with session_factory() as session:
+        # Users get their own pool, the session pool also serves Kafka sends and artist lookups of these users
+        with ThreadPoolExecutor(max_workers=user_concurrency) as users_pool:
+            served = sum(1 for _ in users_pool.map(lambda user_id: produce_for_user(session, user_id), users))
+    return {'users': served, 'seconds': time.perf_counter() - start}
+
+
+def run_fleet(users, workers=None, user_concurrency=4, session_factory=ProducerSession):
+    """
+    Shards users across worker processes with consistent hashing and runs every endpoint producer
+    for each user. Each process opens a single session for all of its users.
+
+    The fleet shares one Spotify rate budget, the rates of `SpotifyKafkaProducer.RATE_LIMITER`. Each of
+    the N processes paces its calls at 1/N of the rate, maximum rate and burst, so the fleet as a whole
+    never sends more requests per second than a single process would.
+
+    Args:
+        users (list): The user IDs to serve.
+        workers (int): Number of worker processes, defaults to the number of CPU cores.
+        user_concurrency (int): Number of users each worker serves at the same time.
+        session_factory (callable): Creates the ProducerSession of a worker, must be picklable.
+
+    Returns:
+        dict: Users served, worker processes, elapsed time and throughput in users per hour.
+    """
+    workers = workers or os.cpu_count()
+    shards = [shard for shard in shard_users(users, workers) if shard]
+    if not shards:
+        return {'users': 0, 'workers': 0, 'seconds': 0.0, 'users_per_hour': 0}
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=len(shards), initializer=limit_worker_rate, initargs=(len(shards),)) as pool:
+        results = pool.starmap(run_worker, [(shard, user_concurrency, session_factory) for shard in shards])
+    elapsed = time.perf_counter() - start
+
+    served = sum(result['users'] for result in results)
+    return {
+        'users': served,
+        'workers': len(shards),
+        'seconds': round(elapsed, 2),
+        'users_per_hour': round(served / elapsed * 3600) if elapsed else 0,
+    }
@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+import spotipy
+from spotipy.exceptions import SpotifyException
+
+
+class AdaptiveRateLimiter:
+    """
+    AdaptiveRateLimiter is a thread-safe token bucket used to pace Spotify API calls.
+
+    The refill rate grows additively after every successful request and is halved whenever
+    Spotify answers with 429 Too Many Requests, in which case every caller is paused for the
+    duration given by the `Retry-After` header. This keeps the producers close to the highest
+    rate Spotify accepts instead of sleeping a fixed amount between calls.
+    """
+
+    def __init__(self, rate=10.0, max_rate=30.0, min_rate=0.5, capacity=10, increase_step=0.1):
+        """
+        Initializes the limiter with a full bucket.
+
+        Args:
+            rate (float): Initial number of requests allowed per second.
+            max_rate (float): Upper bound for the adaptive request rate.
+            min_rate (float): Lower bound for the adaptive request rate.
+            capacity (int): Maximum number of tokens, i.e. the largest allowed burst.
+            increase_step (float): Requests per second added to the rate after each success.
+        """
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.increase_step = increase_step
+
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0  # Set from Retry-After when Spotify throttles us
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.started_at = time.monotonic()
+        self.request_count = 0
+        self.throttle_count = 0
+        self.total_wait_time = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+
+        Returns:
+            float: The number of seconds the caller waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.request_count += 1
+                    self.total_wait_time += waited
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        """
+        Additively increases the request rate after a successful call.
+        """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after=None):
+        """
+        Halves the request rate and pauses all callers after a 429 response.
+
+        Args:
+            retry_after (float): Seconds to wait as given by the Retry-After header, if any.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.last_refill = now
+            self.paused_until = max(self.paused_until, now + (retry_after if retry_after is not None else 1.0))
+
+    def metrics(self):
+        """
+        Returns a snapshot of the limiter metrics.
+
+        Returns:
+            dict: Requests sent, observed request rate, current allowed rate,
+                  number of 429 responses and total time spent waiting for a token.
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                'requests': self.request_count,
+                'observed_rate': round(self.request_count / elapsed, 2),
+                'current_rate': round(self.rate, 2),
+                'throttled': self.throttle_count,
+                'throttle_wait_seconds': round(self.total_wait_time, 2),
+            }
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header, given either as seconds or as an HTTP date.
+
+    Args:
+        value (str): The header value, if any.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+        return max(seconds, 0.0) if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedSpotify(spotipy.Spotify):
+    """
+    A spotipy client that paces every API call through an AdaptiveRateLimiter.
+
+    429 responses are not retried by the underlying HTTP session; instead they are reported to the
+    limiter with their Retry-After value and the call is retried once the limiter allows it.
+    """
+
+    # Status codes the HTTP session still retries on its own, 429 is handled by the limiter
+    STATUS_FORCELIST = (500, 502, 503, 504)
+    MAX_THROTTLED_ATTEMPTS = 5
+
+    def __init__(self, rate_limiter, *args, **kwargs):
+        """
+        Args:
+            rate_limiter (AdaptiveRateLimiter): The limiter shared by all producers.
+            *args, **kwargs: Passed on to spotipy.Spotify.
+        """
+        self.rate_limiter = rate_limiter
+        kwargs.setdefault('status_forcelist', self.STATUS_FORCELIST)
+        super().__init__(*args, **kwargs)
+
+    def _build_session(self):
+        super()._build_session()
+        # urllib3 retries every status in Retry.RETRY_AFTER_STATUS_CODES that carries a Retry-After header,
+        # 429 included, whatever the status forcelist says. Not honouring the header on the session lets
+        # 429 responses reach `_internal_call` with their headers.
+        retry = self._session.get_adapter('https://').max_retries.new(
+            status_forcelist=[status for status in self.status_forcelist or () if status != 429],
+            respect_retry_after_header=False,
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _internal_call(self, method, url, payload, params):
+        for attempt in range(self.MAX_THROTTLED_ATTEMPTS):
+            self.rate_limiter.acquire()
+            try:
+                result = super()._internal_call(method, url, payload, dict(params))
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == self.MAX_THROTTLED_ATTEMPTS - 1:
+                    raise
+                retry_after = parse_retry_after((e.headers or {}).get('Retry-After'))
+                print(f"Rate limited by Spotify, retrying after {retry_after if retry_after is not None else 1} seconds")
+                self.rate_limiter.on_throttle(retry_after)
+                continue
+            self.rate_limiter.on_success()
+            return result
@@ -1,15 +1,43 @@
+import argparse
 import os
-import subprocess
 import sys
-def run_python_files(directory):
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                print(f"Running {file_path}")
-                subprocess.run([sys.executable, file_path])
-                # subprocess.run(["python", file_path])
-
-# Specify the directory containing your Python scripts
-script_directory = "producers/"
-run_python_files(script_directory)
\ No newline at end of file
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The producer modules import each other by file name, as when they are run from the producers directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'producers'))
+
+def run_producers(user_id):
+    from producer_dag import print_report, run_producer_dag
+
+    # Independent producers run concurrently in this process, each one exactly once
+    print_report(run_producer_dag(user_id))
+
+def run_producer_fleet(roster, workers, user_concurrency):
+    from producer_fleet import load_roster, run_fleet
+
+    print(run_fleet(load_roster(roster), workers=workers, user_concurrency=user_concurrency))
+
+def run_user_details():
+    from user_details import processed_to_presentation_user_details
+
+    # Not a Kafka producer: writes the presentation user details table of the authenticated user directly
+    try:
+        processed_to_presentation_user_details()
+    except Exception as e:
+        print(f"Failed to refresh the user details table: {e}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Spotify producers")
+    parser.add_argument('--fleet', action='store_true', help="Serve every user of a roster with a fleet of worker processes")
+    parser.add_argument('--roster', help="File with one user ID per line, defaults to USER_ROSTER or USER_NAME")
+    parser.add_argument('--workers', type=int, help="Number of worker processes, defaults to the number of CPU cores")
+    parser.add_argument('--user-concurrency', type=int, default=4, help="Users served at the same time by each worker")
+    args = parser.parse_args()
+
+    if args.fleet:
+        run_producer_fleet(args.roster, args.workers, args.user_concurrency)
+    else:
+        run_producers(os.getenv('USER_NAME'))
+    run_user_details()
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'producers'))
+
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, RateLimitedSpotify, parse_retry_after
+
+
+class RecordingRateLimiter(AdaptiveRateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.retry_afters = []
+
+    def on_throttle(self, retry_after=None):
+        self.retry_afters.append(retry_after)
+        super().on_throttle(0)  # Do not actually pause the test
+
+
+def serve(responses):
+    """
+    Serves the given (status, headers) responses in order, the last one is repeated.
+
+    Returns:
+        tuple: The server and the list of request paths it received.
+    """
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, headers = responses[min(len(requests), len(responses) - 1)]
+            requests.append(self.path)
+            body = json.dumps({'ok': True} if status == 200 else {'error': {'status': status, 'message': 'slow down'}}).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests
+
+
+def test_429_reaches_the_limiter_with_its_retry_after():
+    server, requests = serve([(429, {'Retry-After': '7'}), (200, {})])
+    try:
+        limiter = RecordingRateLimiter()
+        client = RateLimitedSpotify(limiter, auth='token')
+        client.prefix = f"http://127.0.0.1:{server.server_port}/v1/"
+
+        assert client._get('me') == {'ok': True}
+        # The session sent the 429 on instead of retrying it, the limiter retried the call once
+        assert len(requests) == 2
+        assert limiter.retry_afters == [7.0]
+        assert limiter.metrics()['throttled'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_retry_after_as_seconds_or_http_date():
+    assert parse_retry_after('7') == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('inf') is None
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0  # Already passed
@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip('great_expectations')  # ingestion.streaming validates every chunk with it
+
+from ingestion.streaming import compile_extractor, iter_column_chunks
+
+
+SPEC = {
+    'recents_id': (0,),
+    'track_id': (1, 'track', 'id'),
+    'track_name': (1, 'track', 'name'),
+    'artist_id': (1, 'track', 'artists', 0, 'id'),
+    'album_id': (1, 'track', 'album', 'id'),
+    'played_at': (1, 'played_at'),
+    'artist_count': lambda record: len(record[1]['track']['artists']),
+}
+
+
+def play(i):
+    artists = [{'id': f"artist{i}", 'name': f"Artist {i}"}, {'id': f"artist{i + 1}", 'name': f"Artist {i + 1}"}][:i % 2 + 1]
+    track = {'id': f"track{i}", 'name': f"Track {i}", 'artists': artists, 'album': {'id': f"album{i % 3}"}}
+    return i % 5 + 1, {'played_at': f"2024-01-01T00:00:{i:02d}Z", 'track': track}
+
+
+def hand_written(records):
+    # The loop the spec replaces
+    rows = []
+    for position, item in records:
+        track = item['track']
+        rows.append({
+            'recents_id': position,
+            'track_id': track['id'],
+            'track_name': track['name'],
+            'artist_id': track['artists'][0]['id'],
+            'album_id': track['album']['id'],
+            'played_at': item['played_at'],
+            'artist_count': len(track['artists']),
+        })
+    return {column: [row[column] for row in rows] for column in SPEC}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 23, 100])
+def test_chunks_match_the_hand_written_extraction(chunk_size):
+    records = [play(i) for i in range(23)]
+    chunks = list(iter_column_chunks(iter(records), SPEC, chunk_size))
+
+    assert [len(chunk['track_id']) for chunk in chunks[:-1]] == [chunk_size] * (len(chunks) - 1)
+    assert {column: [value for chunk in chunks for value in chunk[column]] for column in SPEC} == hand_written(records)
+
+
+def test_extract_stops_at_the_limit_and_leaves_the_rest():
+    records = iter([play(i) for i in range(5)])
+    buffers = [[] for _ in SPEC]
+    extract = compile_extractor(SPEC)
+
+    assert extract(records, buffers, 3) == 3
+    assert buffers[1] == ['track0', 'track1', 'track2']
+    assert extract(records, buffers, 3) == 2
+    assert extract(records, buffers, 3) == 0
+    assert buffers[1] == [f"track{i}" for i in range(5)]
@@ -16,6 +16,10 @@ class RecentPlaysAnalysis:
     PROCESSED: str = 'processed'
     PRESENTATION: str = 'presentation'
 
+    # Columns the analyses use, the other columns are never downloaded
+    RECENT_PLAYS_COLUMNS = ['track_id', 'track_name', 'artist_id', 'artist_name', 'album_id', 'played_at', 'duration_ms', 'popularity']
+    RELATED_ARTIST_COLUMNS = ['artist_id', 'artist_name', 'artist_popularity', 'genres']
+
     def __init__(self, user, table_1_topic, table_2_topic, table_3_topic, host=os.getenv('HOST')) -> None:
         self.user = user
         self.retriever_1 = MinioRetriever(user=user, topic=table_1_topic, container=self.PROCESSED, host=host)
@@ -23,14 +27,34 @@ class RecentPlaysAnalysis:
         self.uploader = MinioUploader(user=user, topic=table_3_topic, container = self.PRESENTATION, host=host)
     
     def retriever(self):
-        recent_plays = self.retriever_1.retrieve_object()
-        related_artist=self.retriever_2.retrieve_object()
+        recent_plays = self.retriever_1.retrieve_object(columns=self.RECENT_PLAYS_COLUMNS)
+        related_artist=self.retriever_2.retrieve_object(columns=self.RELATED_ARTIST_COLUMNS)
         return recent_plays,related_artist
     
 
     
-    def analyze_recent_plays(self, recent_plays):
-        recent_plays['played_at'] = pd.to_datetime(recent_plays['played_at'])
+    def enrich_recent_plays(self, recent_plays, related_artist):
+        """
+        Builds the frames every analysis is emitted from, each derived once.
+
+        Args:
+            recent_plays (pd.DataFrame): The recent plays table.
+            related_artist (pd.DataFrame): The related artists table.
+
+        Returns:
+            tuple: The recent plays with `played_at` parsed and its `hour` and `date` precomputed, the plays
+                joined with their related artists on `artist_id`, and the genres of the joined plays
+                exploded to one row per genre.
+        """
+        played_at = pd.to_datetime(recent_plays['played_at'])
+        plays = recent_plays.assign(played_at=played_at, hour=played_at.dt.hour, date=played_at.dt.date)
+
+        plays_with_related = plays.merge(related_artist, on='artist_id', how='inner').rename(columns={'artist_name_x': 'artist_name'})
+
+        genres = plays_with_related['genres'].explode()
+        return plays, plays_with_related, genres
+
+    def analyze_recent_plays(self, plays):
         
         # Recent Plays Summary
         recent_summary = pd.DataFrame({
@@ -43,22 +67,20 @@ class RecentPlaysAnalysis:
                 'avg recent track popularity'
             ],
             'value': [
-                recent_plays['duration_ms'].sum() / (1000 * 60 * 60),
-                recent_plays['duration_ms'].mean() / (1000 * 60),
-                recent_plays['track_id'].nunique(),
-                recent_plays['album_id'].nunique(),
-                recent_plays['artist_name'].nunique(),
-                recent_plays['popularity'].mean()
+                plays['duration_ms'].sum() / (1000 * 60 * 60),
+                plays['duration_ms'].mean() / (1000 * 60),
+                plays['track_id'].nunique(),
+                plays['album_id'].nunique(),
+                plays['artist_name'].nunique(),
+                plays['popularity'].mean()
             ]
         })
     
         return recent_summary
 
-    def analyze_top_recent_artists(self, recent_plays, related_artist):
-
-        recent_with_related = recent_plays.merge(related_artist, on='artist_id', how='inner').rename(columns={'artist_name_x': 'artist_name'})
+    def analyze_top_recent_artists(self, plays_with_related):
         
-        top_recent_artists = recent_with_related.groupby('artist_name').agg({
+        top_recent_artists = plays_with_related.groupby('artist_name').agg({
             'track_id': 'count',
             'artist_popularity': 'first'
         }).reset_index().sort_values('track_id', ascending=False)
@@ -67,19 +89,17 @@ class RecentPlaysAnalysis:
         
         return top_recent_artists
 
-    def analyze_recent_genres(self, recent_plays, related_artist):
+    def analyze_recent_genres(self, genres):
         
-        recent_with_related = recent_plays.merge(related_artist, on='artist_name', how='left')
-        
-        genre_counts = recent_with_related.explode('genres').groupby('genres').size().reset_index(name='count')
+        genre_counts = genres.groupby(genres).size().reset_index(name='count')
         
         genre_counts = genre_counts.sort_values('count', ascending=False)
         
         return genre_counts
 
-    def analyze_listening_hours(self, recent_plays):
+    def analyze_listening_hours(self, plays):
         
-        listening_hours = recent_plays['played_at'].dt.hour.value_counts().sort_index().reset_index()
+        listening_hours = plays['hour'].value_counts().sort_index().reset_index()
         
         listening_hours.columns = ['hour', 'count']
         
@@ -94,9 +114,9 @@ class RecentPlaysAnalysis:
         
         return related_artist_summary
 
-    def analyze_recent_plays_daily(self, recent_plays):
+    def analyze_recent_plays_daily(self, plays):
         
-        daily_plays = recent_plays.groupby(recent_plays['played_at'].dt.date).size().reset_index(name='play_count')
+        daily_plays = plays.groupby('date').size().reset_index(name='play_count')
         
         daily_plays.columns = ['date', 'play_count']
 
@@ -104,30 +124,36 @@ class RecentPlaysAnalysis:
         
         return daily_plays
 
-    def analyze_track_popularity(self, recent_plays):
+    def analyze_track_popularity(self, plays):
         
-        track_popularity = recent_plays[['track_name', 'artist_name', 'popularity']].drop_duplicates()
+        track_popularity = plays[['track_name', 'artist_name', 'popularity']].drop_duplicates()
         
         track_popularity = track_popularity.sort_values('popularity', ascending=False)
         
         return track_popularity
 
     def analyze_recent_plays_with_related(self, recent_plays, related_artist):
+        # Every table is emitted from the same enriched frames, the join and the genre explode happen once
+        plays, plays_with_related, genres = self.enrich_recent_plays(recent_plays, related_artist)
         
         return {
-            'recent-summary': self.analyze_recent_plays(recent_plays),
-            'top-artists': self.analyze_top_recent_artists(recent_plays, related_artist),
-            'genre-analysis': self.analyze_recent_genres(recent_plays, related_artist),
-            'listening-hours': self.analyze_listening_hours(recent_plays),
+            'recent-summary': self.analyze_recent_plays(plays),
+            'top-artists': self.analyze_top_recent_artists(plays_with_related),
+            'genre-analysis': self.analyze_recent_genres(genres),
+            'listening-hours': self.analyze_listening_hours(plays),
             'related-artists-summary': self.analyze_related_artists(related_artist),
-            'daily-plays': self.analyze_recent_plays_daily(recent_plays),
-            'track-popularity': self.analyze_track_popularity(recent_plays)
+            'daily-plays': self.analyze_recent_plays_daily(plays),
+            'track-popularity': self.analyze_track_popularity(plays)
         }
     
     def write_to_parquet(self,df,key):
         
         self.uploader.upload_files(df,key)
 
+    def write_tables(self, tables):
+        # The tables are independent, so they are uploaded concurrently
+        self.uploader.upload_tables(tables)
+
 
 def recent_plays_analysis():
     transformed = RecentPlaysAnalysis(user=os.getenv('USER_NAME'),table_1_topic=TOPIC_CONFIG['recent_plays']['topic'], \
@@ -136,8 +162,7 @@ def recent_plays_analysis():
     
     recent_plays, related_artists = transformed.retriever()
     recent_plays_analysis = transformed.analyze_recent_plays_with_related(recent_plays, related_artists)
-    for key in recent_plays_analysis:
-        transformed.write_to_parquet(recent_plays_analysis[key], key)
+    transformed.write_tables(recent_plays_analysis)
 
 
 if __name__ == "__main__":
@@ -8,6 +8,7 @@ sys.path.extend(site.getsitepackages())
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
 import pandas as pd
+import pyarrow as pa
 from transformations.utils import MinioRetriever,MinioUploader
 from common_utility_functions.utils import TOPIC_CONFIG, scope
 
@@ -22,11 +23,12 @@ class SourceTables:
         self.presentation = presentation
         
     def retrieve(self):
-        result = self.retriever.retrieve_object()
-        return result
+        # The presentation copy is written from the Arrow table itself, it is never converted to pandas
+        result = self.retriever.retrieve_table()
+        return result.replace_schema_metadata(None) if result is not None else None
 
-    def upload(self, result):
-        self.uploader.upload_files(result)
+    def upload(self, result, partition_by=None):
+        self.uploader.upload_files(result, partition_by=partition_by)
 
 
 def processed_to_presentation_liked_songs():
@@ -35,7 +37,8 @@ def processed_to_presentation_liked_songs():
                             )
     
     results = liked_songs.retrieve()
-    liked_songs.upload(results)
+    # Partitioned by month, so loads and analyses of a period only read that period
+    liked_songs.upload(results, partition_by='added_at')
 
 def processed_to_presentation_related_artists():
     related_artists = SourceTables(os.getenv('USER_NAME'), \
@@ -43,7 +46,7 @@ def processed_to_presentation_related_artists():
                             )
     
     results = related_artists.retrieve()
-    results = results[[col for col in results.columns if col != 'genres']]
+    results = results.select([col for col in results.column_names if col != 'genres'])
     related_artists.upload(results)
 
 def processed_to_presentation_recent_plays():
@@ -52,7 +55,8 @@ def processed_to_presentation_recent_plays():
                             )
     
     results = recent_plays.retrieve()
-    recent_plays.upload(results)
+    # Partitioned by month, so loads and analyses of a period only read that period
+    recent_plays.upload(results, partition_by='played_at')
     
 
 def processed_to_presentation_all_tracks():
@@ -74,8 +78,7 @@ def processed_to_presentation_top_songs():
                             TOPIC_CONFIG["top_songs"]["topic"]
                             )
     results = top_songs.retrieve()
-    results.index = pd.RangeIndex(start=1, stop=len(results)+1)
-    results.reset_index(names='rank', inplace =True)
+    results = results.add_column(0, 'rank', pa.array(range(1, results.num_rows + 1), pa.int64()))
     top_songs.upload(results)
 
 def processed_to_presentation_genres_table():
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow as pa
+
+
+class TableCache:
+    """
+    TableCache keeps the Arrow tables read during a run, so each table is fetched and decoded once no
+    matter how many tasks read it. Entries are keyed by `(container, topic, user, table, version, ...)`
+    where the version identifies the stored object, so a rewritten table is never served stale.
+
+    Tables are held in memory up to `max_memory_bytes`, least recently used ones are dropped beyond that.
+    With a spill directory every table is also written there as an Arrow IPC file and memory-mapped back
+    when it is needed again, which lets the other task processes of the run on the same machine reuse it.
+    """
+
+    def __init__(self, max_memory_bytes=1024 * 1024 * 1024, spill_dir=None, spill_root=None):
+        """
+        Args:
+            max_memory_bytes (int): Memory held by cached tables before the least recently used are dropped.
+            spill_dir (str): Directory for the Arrow IPC copies of the tables, none are written when omitted.
+            spill_root (str): Spill into a subdirectory per Airflow DAG run of this directory instead. The
+                run is looked up whenever the cache is used, see `current_run_id`.
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.spill_root = spill_root
+        self.entries = OrderedDict()  # key -> table, least recently used first
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # key -> lock held while the table is loaded, so concurrent readers wait for one load
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def get(self, key, loader=None):
+        """
+        Returns the cached table for a key, loading and caching it if needed.
+
+        Args:
+            key (tuple): The cache key.
+            loader (callable): Reads the table when it is not cached. Without a loader a missing table
+                gives None.
+
+        Returns:
+            pyarrow.Table: The table. Tables are immutable, so callers can share it.
+        """
+        table = self.from_memory(key)
+        if table is not None or (loader is None and not self.run_spill_dir()):
+            return table
+
+        with self.lock:
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Another thread may have loaded the table meanwhile
+                table = self.from_memory(key)
+                if table is not None:
+                    return table
+
+                table = self.from_disk(key)
+                if table is not None:
+                    self.stats['disk_hits'] += 1
+                elif loader is not None:
+                    table = loader()
+                    self.stats['misses'] += 1
+                    self.spill(key, table)
+                if table is not None:
+                    self.put(key, table)
+                return table
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+
+    def from_memory(self, key):
+        with self.lock:
+            table = self.entries.get(key)
+            if table is not None:
+                self.entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+            return table
+
+    def put(self, key, table):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = table
+            self.memory_bytes += table.nbytes
+            # Drop the least recently used tables, spilled ones can still be mapped back from disk
+            while self.memory_bytes > self.max_memory_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.memory_bytes -= evicted.nbytes
+
+    def run_spill_dir(self):
+        # Resolved on every use, the Airflow run context is only exported after the modules are imported
+        if self.spill_root:
+            return os.path.join(self.spill_root, current_run_id())
+        return self.spill_dir
+
+    def spill_path(self, key):
+        return os.path.join(self.run_spill_dir(), hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + '.arrow')
+
+    def spill(self, key, table):
+        spill_dir = self.run_spill_dir()
+        if not spill_dir:
+            return
+        try:
+            os.makedirs(spill_dir, exist_ok=True)
+            path = self.spill_path(key)
+            # Write under a temporary name first, so other processes never map a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not spill table {key} to disk: {e}")
+
+    def from_disk(self, key):
+        if not self.run_spill_dir():
+            return None
+        try:
+            # Memory-mapped, the pages are only read as the table is used
+            return pa.ipc.open_file(pa.memory_map(self.spill_path(key), 'r')).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+
+    def clear(self):
+        """
+        Drops all cached tables from memory and removes their spilled copies of the current run.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.memory_bytes = 0
+        spill_dir = self.run_spill_dir()
+        if self.spill_root:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        elif spill_dir and os.path.isdir(spill_dir):
+            for name in os.listdir(spill_dir):
+                if name.endswith('.arrow'):
+                    os.remove(os.path.join(spill_dir, name))
+
+    def remove_stale_runs(self, max_age_seconds):
+        """
+        Removes the spill directories of other runs that have not been written to for `max_age_seconds`,
+        e.g. of runs that failed before cleaning up after themselves. Runs still in progress are kept.
+
+        Returns:
+            list: The removed run directories.
+        """
+        if not self.spill_root or not os.path.isdir(self.spill_root):
+            return []
+        removed = []
+        current = self.run_spill_dir()
+        for name in os.listdir(self.spill_root):
+            run_dir = os.path.join(self.spill_root, name)
+            if run_dir == current or not os.path.isdir(run_dir):
+                continue
+            if time.time() - os.path.getmtime(run_dir) >= max_age_seconds:
+                shutil.rmtree(run_dir, ignore_errors=True)
+                removed.append(run_dir)
+        return removed
+
+
+def current_run_id():
+    """
+    Returns:
+        str: The ID of the Airflow DAG run the process works for, usable as a directory name. 'local'
+            outside of Airflow.
+    """
+    return os.getenv('AIRFLOW_CTX_DAG_RUN_ID', 'local').replace(os.sep, '_').replace(':', '_')
+
+
+def create_run_cache():
+    """
+    Creates the table cache of the process. Spilling is enabled by setting `TABLE_CACHE_DIR`, the
+    tables of each Airflow DAG run are spilled into their own subdirectory.
+    """
+    return TableCache(
+        max_memory_bytes=int(os.getenv('TABLE_CACHE_MEMORY_MB', 1024)) * 1024 * 1024,
+        spill_root=os.getenv('TABLE_CACHE_DIR'),
+    )
+
+
+# The cache shared by all MinioRetrievers of the process
+TABLE_CACHE = create_run_cache()
+
+# Spill directories of other runs older than this are removed at the end of a run, longer than any run takes
+STALE_RUN_SECONDS = 24 * 3600
+
+
+def cleanup_table_cache():
+    """
+    Removes the spilled tables of the current run once it is done, together with those left behind
+    by runs that ended without cleaning up. Run as the last task of the DAG.
+    """
+    TABLE_CACHE.clear()
+    removed = TABLE_CACHE.remove_stale_runs(STALE_RUN_SECONDS)
+    print(f"Removed the table cache of run {current_run_id()} and {len(removed)} stale runs")
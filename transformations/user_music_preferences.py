@@ -2,6 +2,8 @@
 import os
 import site
 import sys
+import time
+import tracemalloc
 
 import numpy as np
 
@@ -15,6 +17,161 @@ from transformations.utils import  MinioRetriever, MinioUploader
 from common_utility_functions.utils import TOPIC_CONFIG, scope
 load_dotenv()
 
+
+# Shared intermediates of the liked songs tables
+
+def unique_liked_songs(liked_songs):
+    # Each liked track once, with the month it was liked parsed a single time for every table
+    liked_songs = liked_songs.drop_duplicates(subset=['track_id'])
+    return liked_songs.assign(month_year=pd.to_datetime(liked_songs['added_at']).dt.to_period('M'))
+
+
+def join_liked_tracks(liked_songs, all_tracks):
+    return liked_songs.merge(all_tracks, on='track_id', how='inner')
+
+
+def join_related_artists(liked_tracks, related_artists):
+    return liked_tracks.merge(related_artists, on='artist_id', how='left')
+
+
+def explode_genres(liked_tracks_artists):
+    # One row per liked track and genre of its artist, the index stays that of the joined rows
+    return liked_tracks_artists[['artist_name_x', 'month_year', 'genres']].explode('genres')
+
+
+# Output tables
+
+def genre_analysis(track_genres, liked_songs, all_tracks, related_artists):
+    # Genres of every liked song whose artist is a related artist. The liked songs missing from all tracks
+    # have no rows in the shared joins, so only those few are joined and exploded here.
+    missing_tracks = liked_songs.loc[~liked_songs['track_id'].isin(all_tracks['track_id']), ['artist_id']]
+    missing_genres = missing_tracks.merge(related_artists[['artist_id', 'genres']], on='artist_id', how='inner')['genres'].explode()
+    genres = pd.concat([track_genres['genres'], missing_genres])
+    return (
+        genres.groupby(genres)
+        .size()
+        .sort_values(ascending=False)
+        .reset_index(name='genre_count')
+    )
+
+
+def artist_discovery(liked_songs, related_artists):
+    new_artists_df = related_artists[~related_artists['artist_id'].isin(set(liked_songs['artist_id']))]
+    new_artists_df = new_artists_df.sort_values('artist_popularity', ascending=False)
+    return new_artists_df.drop(columns=['genres'])
+
+
+def popularity_analysis(liked_tracks_artists):
+    popularity_df = liked_tracks_artists[['artist_name_x', 'artist_popularity']].drop_duplicates()
+    return popularity_df.rename(columns={'artist_name_x': 'artist_name'})
+
+
+def monthly_likes(liked_songs):
+    monthly_likes_df = liked_songs.groupby('month_year').size().reset_index(name='monthly_like_count')
+    monthly_likes_df['month_year'] = monthly_likes_df['month_year'].astype(str)
+    return monthly_likes_df
+
+
+def artist_frequency(liked_songs, related_artists):
+    # Every liked song counts for its artist under the name of the artist's first related artists row,
+    # looked up by hash instead of joining and deduplicating the liked songs again
+    artist_names = related_artists.drop_duplicates(subset='artist_id').set_index('artist_id')['artist_name']
+    artist_frequency_df = (
+        liked_songs.groupby([liked_songs['artist_id'], liked_songs['artist_id'].map(artist_names).rename('artist_name')])
+        .size()
+        .reset_index(name='like_count')
+    )
+    # Sort by song count in descending order
+    artist_frequency_df = artist_frequency_df.sort_values('like_count', ascending=False)
+    return artist_frequency_df.drop(columns=['artist_id'])
+
+
+def song_details(liked_tracks_artists):
+    song_details_df = liked_tracks_artists[['track_name', 'artist_name_x', 'album_name', 'duration_ms', 'artist_popularity', 'added_at']]
+    return song_details_df.rename(columns={'artist_name_x': 'artist_name'})
+
+
+def artist_genre_mapping(track_genres):
+    artist_genre_df = track_genres[['artist_name_x', 'genres']].drop_duplicates()
+    return artist_genre_df.rename(columns={'artist_name_x': 'artist_name'})
+
+
+def monthly_genre_trends(track_genres):
+    monthly_genre_df = track_genres.groupby(['month_year', 'genres']).size().reset_index(name='genre_count')
+    monthly_genre_df['month_year'] = monthly_genre_df['month_year'].astype(str)
+    return monthly_genre_df
+
+
+# Computation plan of the liked songs tables: step -> (function computing it, steps or inputs it uses).
+# Steps are listed after the steps they use and each one is computed once.
+LIKED_SONGS_PLAN = {
+    'liked_songs': (unique_liked_songs, ['liked_songs_input']),
+    'liked_tracks': (join_liked_tracks, ['liked_songs', 'all_tracks']),
+    'liked_tracks_artists': (join_related_artists, ['liked_tracks', 'related_artists']),
+    'track_genres': (explode_genres, ['liked_tracks_artists']),
+    'genre_analysis': (genre_analysis, ['track_genres', 'liked_songs', 'all_tracks', 'related_artists']),
+    'artist_discovery': (artist_discovery, ['liked_songs', 'related_artists']),
+    'popularity_analysis': (popularity_analysis, ['liked_tracks_artists']),
+    'monthly_likes': (monthly_likes, ['liked_songs']),
+    'artist_frequency': (artist_frequency, ['liked_songs', 'related_artists']),
+    'song_details': (song_details, ['liked_tracks_artists']),
+    'artist_genre_mapping': (artist_genre_mapping, ['track_genres']),
+    'monthly_genre_trends': (monthly_genre_trends, ['track_genres']),
+}
+
+# Peak memory of the plan steps is only traced on request, tracemalloc slows every allocation down
+TRACE_PLAN_MEMORY = os.getenv('TRACE_PLAN_MEMORY') == '1'
+
+# Steps of the plan that are uploaded as tables
+OUTPUT_TABLES = ['genre_analysis', 'artist_discovery', 'popularity_analysis', 'monthly_likes',
+                 'artist_frequency', 'song_details', 'artist_genre_mapping', 'monthly_genre_trends']
+
+
+def run_plan(plan, inputs, trace_memory=False):
+    """
+    Runs every step of a computation plan once, in plan order.
+
+    Args:
+        plan (dict): Step name -> (function, names of the steps or inputs passed to it).
+        inputs (dict): Input name -> value.
+        trace_memory (bool): Whether to trace the peak memory of every step with tracemalloc, which
+            slows the run down noticeably.
+
+    Returns:
+        tuple: Step or input name -> result, and per step its wall time in seconds and, when traced,
+            the peak memory it allocated in MB.
+    """
+    results = dict(inputs)
+    report = {}
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        for name, (func, uses) in plan.items():
+            if trace_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            results[name] = func(*(results[use] for use in uses))
+            report[name] = {'seconds': round(time.perf_counter() - start, 4)}
+            if trace_memory:
+                report[name]['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - baseline) / (1024 * 1024), 2)
+    finally:
+        if tracing:
+            tracemalloc.stop()
+    return results, report
+
+
+def print_report(report):
+    """
+    Prints the wall time and peak memory of every step of a plan run.
+    """
+    traced = any('peak_mb' in stats for stats in report.values())
+    print(f"{'step':<24}{'seconds':>10}" + (f"{'peak MB':>10}" if traced else ''))
+    for name, stats in report.items():
+        print(f"{name:<24}{stats['seconds']:>10.4f}" + (f"{stats['peak_mb']:>10.2f}" if traced else ''))
+    print(f"{'total':<24}{sum(stats['seconds'] for stats in report.values()):>10.4f}")
+
 class ProcessTopAritstBasedOnGenres:
 
     PROCESSED: str = 'processed'
@@ -34,79 +191,28 @@ class ProcessTopAritstBasedOnGenres:
         return liked_songs,related_artists, all_tracks
 
 
-    def transform_liked_songs_related_artists(self, liked_songs, related_artists, all_tracks):
-    # Merge dataframes
-        
-        liked_songs.drop_duplicates(subset=['track_id'],inplace =True)
-
-        all_tracks_merged = liked_songs.merge(all_tracks, on='track_id', how='inner')
-
-        merged_df = all_tracks_merged.merge(related_artists, on='artist_id', how='left')
-
-
-        # Genre Analysis
-        genre_all_tracks_merged = liked_songs.merge(all_tracks, on='track_id',how='left')
-        genre_merged_df = genre_all_tracks_merged.merge(related_artists, on='artist_id',how='inner')
-        genre_df = (
-            genre_merged_df.explode('genres')
-            .groupby('genres')
-            .size()
-            .sort_values(ascending=False)
-            .reset_index(name='genre_count')
+    def transform_liked_songs_related_artists(self, liked_songs, related_artists, all_tracks, trace_memory=TRACE_PLAN_MEMORY):
+        """
+        Derives the eight liked songs tables by running `LIKED_SONGS_PLAN`. The joins, the genre explode
+        and the date parsing are each done once and shared by the tables that use them.
+
+        Args:
+            liked_songs (pd.DataFrame): The liked songs table.
+            related_artists (pd.DataFrame): The related artists table.
+            all_tracks (pd.DataFrame): The all tracks table.
+            trace_memory (bool): Whether to trace the peak memory of every step, off unless
+                `TRACE_PLAN_MEMORY=1` is set since tracing slows the run down.
+
+        Returns:
+            dict: Table name -> DataFrame of every output table. The seconds and peak memory of every
+                step are kept in `self.report`.
+        """
+        results, self.report = run_plan(
+            LIKED_SONGS_PLAN,
+            {'liked_songs_input': liked_songs, 'related_artists': related_artists, 'all_tracks': all_tracks},
+            trace_memory=trace_memory
         )
-        
-
-        # Artist Discovery
-        liked_artists = set(liked_songs['artist_id'])
-        new_artists_df = related_artists[~related_artists['artist_id'].isin(liked_artists)]
-        new_artists_df = new_artists_df.sort_values('artist_popularity', ascending=False)
-        new_artists_df.drop(columns=['genres'], inplace=True)
-
-        # Popularity Analysis
-        popularity_df = merged_df[['artist_name_x', 'artist_popularity']].drop_duplicates()
-        popularity_df = popularity_df.rename(columns={'artist_name_x': 'artist_name'})
-
-        # Time-based Analysis
-        liked_songs['month_year'] = pd.to_datetime(liked_songs['added_at']).dt.to_period('M')
-        monthly_likes_df = liked_songs.groupby('month_year').size().reset_index(name='monthly_like_count')
-        monthly_likes_df['month_year'] = monthly_likes_df['month_year'].astype(str)
-
-
-        # Artist Frequency Analysis
-        # Merge likedsongs with related_artists to get artist names
-        artist_frequency_merged_df = liked_songs.merge(related_artists[['artist_id', 'artist_name']], on='artist_id', how='left')
-        artist_frequency_merged_df=artist_frequency_merged_df.drop_duplicates(subset='track_id', keep='first')
-        # Count songs for each artist
-        artist_frequency_df = artist_frequency_merged_df.groupby(['artist_id', 'artist_name']).size().reset_index(name='like_count')
-        # Sort by song count in descending order
-        artist_frequency_df = artist_frequency_df.sort_values('like_count', ascending=False)
-        artist_frequency_df.drop(columns=['artist_id'], inplace=True)
-
-
-        # Song Details
-        song_details_df = merged_df[['track_name', 'artist_name_x', 'album_name', 'duration_ms', 'artist_popularity', 'added_at']]
-        song_details_df = song_details_df.rename(columns={'artist_name_x': 'artist_name'})
-
-        # Artist Genre Mapping
-        artist_genre_df = merged_df[['artist_name_x', 'genres']].explode('genres').drop_duplicates()
-        artist_genre_df = artist_genre_df.rename(columns={'artist_name_x': 'artist_name'})
-
-        # Monthly Genre Trends
-        monthly_genre_df = merged_df.explode('genres')
-        monthly_genre_df['month_year'] = pd.to_datetime(monthly_genre_df['added_at']).dt.to_period('M')
-        monthly_genre_df = monthly_genre_df.groupby(['month_year', 'genres']).size().reset_index(name='genre_count')
-        monthly_genre_df['month_year'] = monthly_genre_df['month_year'].astype(str)
-
-        return {
-            'genre_analysis': genre_df,
-            'artist_discovery': new_artists_df,
-            'popularity_analysis': popularity_df,
-            'monthly_likes': monthly_likes_df,
-            'artist_frequency': artist_frequency_df,
-            'song_details': song_details_df,
-            'artist_genre_mapping': artist_genre_df,
-            'monthly_genre_trends': monthly_genre_df
-        }
+        return {name: results[name] for name in OUTPUT_TABLES}
     
 
     def write_to_parquet(self,df,key):
@@ -120,6 +226,7 @@ def user_music_preferences():
         
     liked_songs, related_artists, all_tracks= transformed.retriever()
     user_music_preferences = transformed.transform_liked_songs_related_artists(liked_songs, related_artists, all_tracks)
+    print_report(transformed.report)
     for key in user_music_preferences:
         transformed.write_to_parquet(user_music_preferences[key], key)
 
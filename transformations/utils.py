@@ -1,11 +1,38 @@
-import io
+import hashlib
 import os
 import sys
-import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import s3fs
 from minio import Minio
 
+from transformations.table_cache import TABLE_CACHE
+
+# Hive partition key of partitioned tables, the month of the partitioning timestamp column
+PARTITION_COLUMN = 'month'
+# Rows per Parquet row group of partitioned tables. Smaller row groups give filters finer statistics
+# to skip by, larger ones compress better.
+ROW_GROUP_ROWS = 64 * 1024
+# Partitioned tables read their fragments like single files, with coalesced range requests
+PARQUET_FORMAT = ds.ParquetFileFormat(default_fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=True))
+
+
+def create_filesystem(host):
+    # Set up S3 filesystem (MinIO uses S3 protocol). s3fs caches the instance per host, so all readers
+    # and writers of a process share one HTTP connection pool.
+    return s3fs.S3FileSystem(
+        endpoint_url=f"http://{host}:9000",
+        key="minioadmin",
+        secret="minioadmin",
+        client_kwargs={'endpoint_url': f"http://{host}:9000"},
+        use_ssl=False  # Set to False for localhost without HTTPS
+    )
+
+
 class MinioRetriever:
     def __init__(self, user, topic, container, host) -> None:
         self.container = container #raw
@@ -14,77 +41,130 @@ class MinioRetriever:
         self.host = host
 
 
-    def retrieve_object(self,key=None):
+    def retrieve_object(self, key=None, columns=None, filters=None, dtype_backend=None):
+        """
+        Reads a table of the user as a DataFrame. Only the requested columns are read, and row groups
+        (and partitions of partitioned tables) whose statistics rule out the filters are skipped.
+        Rows of partitioned tables come back sorted by their partitioning timestamp, not in the order
+        they were written.
+
+        Args:
+            key (str): Name of the table within the topic, the topic's own table when omitted.
+            columns (list): Columns to read, all columns when omitted.
+            filters (list): Row filters in the `pyarrow.parquet` form, e.g. `[('played_at', '>=', '2024-05')]`.
+                Partitioned tables can also be filtered on their `month` partition, e.g. `[('month', '=', '2024-05')]`.
+            dtype_backend (str): 'pyarrow' to get Arrow-backed columns that share the memory of the read
+                Arrow table. Opt-in: pandas cannot read back Parquet files written from Arrow-backed list
+                columns, and the analyses and loads rely on NumPy semantics. By default columns are
+                converted to NumPy ones. Callers that only pass a table on use `retrieve_table` instead.
+
+        Returns:
+            pd.DataFrame: The table, or None if it could not be read.
+        """
         try:
-            # Set up S3 filesystem (MinIO uses S3 protocol)
-            fs = s3fs.S3FileSystem(
-                endpoint_url=f"http://{self.host}:9000",
-                key="minioadmin",
-                secret="minioadmin"
-            )
             # print(f"topic:{self.topic}")
+            name = self.topic if not key else str(key).replace("_","-")
+
+            # Construct the path to the parquet file, a missing table is reported by read_object
+            parquet_path = f"{self.topic}/{self.user}/{self.container}-{name}.parquet"
+
+            df = self.read_object(parquet_path, self.container, columns=columns, filters=filters, dtype_backend=dtype_backend)
 
-            # List all objects in the specified subfolder
-            if not key:
-                paths = [
-                    self.container,
-                    f"{self.container}/{self.topic}",
-                    f"{self.container}/{self.topic}/{self.user}",
-                    f"{self.container}/{self.topic}/{self.user}/{self.container}-{self.topic}.parquet"
-                ]
-                
-                for path in paths:
-                    print("True" if fs.exists(path) else "False")
-
-                # Construct the path to the parquet file
-                parquet_path = f"{self.topic}/{self.user}/{self.container}-{self.topic}.parquet"
-
-                df = self.read_object(parquet_path, self.container)
-            else:
-                str(key).replace("_","-")
-                paths = [
-                    self.container,
-                    f"{self.container}/{self.topic}",
-                    f"{self.container}/{self.topic}/{self.user}",
-                    f"{self.container}/{self.topic}/{self.user}/{self.container}-{key}.parquet"
-                ]
-                
-                for path in paths:
-                    print("True" if fs.exists(path) else "False")
-
-                # Construct the path to the parquet file
-                parquet_path = f"{self.topic}/{self.user}/{self.container}-{key}.parquet"
-
-                df = self.read_object(parquet_path, self.container)
-
-            
             return df
 
         except Exception as e:
             print(f"Error in retrieve_and_convert_to_dataframe function: {e}")
             return None
-        
-    def read_object(self, prefix, bucket):
-        try:
-            client = Minio(
-            f"{self.host}:9000",
-            access_key="minioadmin",
-            secret_key="minioadmin",
-            secure=False  # Set to True if using HTTPS
-            )
 
-            data = client.get_object(bucket, prefix)
+    def retrieve_table(self, key=None, columns=None, filters=None):
+        """
+        Reads a table of the user as the Arrow table itself, without converting it to pandas. Takes the
+        same arguments as `retrieve_object`.
 
-            with io.BytesIO(data.read()) as parquet_buffer:
-                df = pd.read_parquet(parquet_buffer)
-
-            return df
+        Returns:
+            pyarrow.Table: The table, shared with the table cache, or None if it could not be read.
+        """
+        name = self.topic if not key else str(key).replace("_","-")
+        try:
+            return self.read_arrow(f"{self.topic}/{self.user}/{self.container}-{name}.parquet", self.container, columns, filters)
+        except Exception as e:
+            print(f"Error in retrieve_table function: {e}")
+            return None
+        
+    def read_object(self, prefix, bucket, columns=None, filters=None, dtype_backend=None):
+        try:
+            return self.to_dataframe(self.read_arrow(prefix, bucket, columns, filters), dtype_backend)
 
         except Exception as e:
             print(f"Error in read_object function: {e}")  # More detailed error message
             return None
 
+    def read_arrow(self, prefix, bucket, columns=None, filters=None):
+        fs = create_filesystem(self.host)
+        path = f"{bucket}/{prefix}"
+        fs.invalidate_cache(path)  # The version must come from the stored object, not a cached listing
+        partitioned = fs.isdir(path)
+
+        # Tables are cached per run by their stored version, so every reader of the run shares one fetch
+        table_key = (bucket, self.topic, self.user, prefix.rsplit('/', 1)[-1], self.table_version(fs, path, partitioned))
+        table = TABLE_CACHE.get(table_key + (None, None))
+        if table is not None and self.covers(table, columns, filters):
+            # The whole table is cached already, project and filter it in memory
+            if filters:
+                table = table.filter(pq.filters_to_expression(filters))
+            if columns:
+                table = table.select(columns)
+        else:
+            shape = (tuple(columns) if columns else None, repr(filters) if filters else None)
+            table = TABLE_CACHE.get(table_key + shape, lambda: self.read_table(fs, path, partitioned, columns, filters))
+        return table
+
+    @staticmethod
+    def read_table(fs, path, partitioned, columns=None, filters=None):
+        if partitioned:
+            # A partitioned table, partitions that cannot match the filters are never listed or read
+            dataset = ds.dataset(path, filesystem=fs, format=PARQUET_FORMAT, partitioning='hive')
+            table = dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters) if filters else None)
+            if columns is None and PARTITION_COLUMN in table.column_names:
+                table = table.drop_columns([PARTITION_COLUMN])  # Callers get the columns that were written
+            return table
+
+        # Read through a seekable handle doing plain range requests without read-ahead, so only the
+        # footer and the needed column chunks are fetched. Arrow coalesces nearby chunks into few
+        # requests and each response is fully read, returning its connection to the pool.
+        with fs.open(path, 'rb', cache_type='none') as f:
+            return pq.read_table(f, columns=columns, filters=filters, pre_buffer=True)
+
+    @staticmethod
+    def table_version(fs, path, partitioned):
+        # The ETags of the stored objects change whenever the table is rewritten
+        if partitioned:
+            parts = fs.find(path, detail=True)
+            listing = sorted((name, info.get('ETag'), info.get('size')) for name, info in parts.items())
+            return hashlib.sha1(repr(listing).encode("utf-8")).hexdigest()
+        info = fs.info(path)
+        return info.get('ETag') or f"{info.get('size')}-{info.get('LastModified', info.get('mtime'))}"
+
+    @staticmethod
+    def covers(table, columns, filters):
+        # Whether a read can be answered from the table, i.e. it has every column the read refers to
+        referenced = set(columns or [])
+        for conjunction in (filters if filters and isinstance(filters[0], list) else [filters or []]):
+            referenced.update(column for column, _, _ in conjunction)
+        return referenced.issubset(table.column_names)
+
+    @staticmethod
+    def to_dataframe(table, dtype_backend=None):
+        if dtype_backend == 'pyarrow':
+            # The columns wrap the Arrow arrays, nothing is copied
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        # Every caller gets its own DataFrame, so in-place changes never reach the cached table.
+        # Columns are converted one by one without consolidating them into blocks.
+        return table.to_pandas(split_blocks=True)
+
 class MinioUploader:
+    UPLOAD_WORKERS = 8  # Tables written at the same time by `upload_tables`, within s3fs's default connection pool
+
     def __init__(self, user, topic, container,host) -> None:
         self.container = container
         self.user = user
@@ -100,40 +180,114 @@ class MinioUploader:
             print(f"Bucket '{bucket_name}' already exists")
 
 
-    def upload_files(self, data, key=None):
-            minio_client = Minio(
-                f"{self.host}:9000", 
-                access_key="minioadmin",
-                secret_key="minioadmin",
-                secure=False  # Keep this False for localhost without HTTPS
-            )
-            fs = s3fs.S3FileSystem(
-                    key="minioadmin",
-                    secret="minioadmin",
-                    endpoint_url=f"http://{self.host}:9000",  # Explicitly set the endpoint URL
-                    client_kwargs={'endpoint_url': f"http://{self.host}:9000"},
-                    use_ssl=False  # Set to False for localhost without HTTPS
-                )
-            bucket_name = f'{self.container}'
-            self.ensure_bucket_exists(minio_client,bucket_name)
-            if not key:
-                path = f"{self.container}/{self.topic}/{self.user}/{self.container}-{self.topic}.parquet"
-                try:
-                    with fs.open(path, 'wb') as f:
-                        data.to_parquet(f, engine='pyarrow', compression='snappy')
-                except Exception as e:
-                    print(f"\nError occured while uploading file to bucket : {e}")
-            else:
+    def create_client(self):
+        return Minio(
+            f"{self.host}:9000", 
+            access_key="minioadmin",
+            secret_key="minioadmin",
+            secure=False  # Keep this False for localhost without HTTPS
+        )
+
+    def upload_files(self, data, key=None, partition_by=None, ensure_bucket=True):
+            """
+            Writes a table of the user. The previous version of the table stays readable until the new
+            one is written, and a failed write leaves it in place and raises.
+
+            Args:
+                data (pd.DataFrame or pyarrow.Table): The table. Arrow tables are written as they are.
+                key (str): Name of the table within the topic, the topic's own table when omitted.
+                partition_by (str): Timestamp column to partition the table by month. The table is then
+                    written as a directory of `month=YYYY-MM` partitions under the usual path, each sorted
+                    by the column so row group statistics can prune time ranges. Readers get the rows back
+                    sorted by the column, i.e. grouped by month.
+                ensure_bucket (bool): Whether to create the bucket if it is missing, callers that already
+                    made sure it exists can skip the check.
+            """
+            fs = create_filesystem(self.host)
+            if ensure_bucket:
+                self.ensure_bucket_exists(self.create_client(), f'{self.container}')
+            if key:
                 key=str(key).replace("_","-")
                 print(key)
-                path = f"{self.container}/{self.topic}/{self.user}/{self.container}-{key}.parquet"
-                try:
-                    with fs.open(path, 'wb') as f:
-                        data.to_parquet(f, engine='pyarrow', compression='snappy')
-                    print("Uploaded file sucessfully !!")
-                except Exception as e:
-                    print(f"\nError occured while uploading file to bucket : {e}")
-
-            
-        
+            path = f"{self.container}/{self.topic}/{self.user}/{self.container}-{key or self.topic}.parquet"
+            if partition_by:
+                self.write_partitioned(fs, path, data, partition_by)
+            else:
+                self.write_file(fs, path, data)
+            if key:
+                print("Uploaded file sucessfully !!")
+
+    def upload_tables(self, tables):
+        """
+        Writes several tables of the user at the same time. The bucket is checked once, then every table
+        is written on its own thread over the shared filesystem.
+
+        Args:
+            tables (dict): Table name -> DataFrame, each written like `upload_files(data, key)`.
+        """
+        self.ensure_bucket_exists(self.create_client(), f'{self.container}')
+        with ThreadPoolExecutor(max_workers=MinioUploader.UPLOAD_WORKERS) as pool:
+            list(pool.map(lambda key: self.upload_files(tables[key], key, ensure_bucket=False), tables))
+
+    @staticmethod
+    def write_file(fs, path, data):
+        # Serialized before anything is stored, a single put then replaces the previous object at once
+        if isinstance(data, pa.Table):
+            buffer = pa.BufferOutputStream()
+            pq.write_table(data, buffer, compression='snappy')
+            content = buffer.getvalue().to_pybytes()
+        else:
+            content = data.to_parquet(engine='pyarrow', compression='snappy')
+        if not fs.isdir(path):
+            fs.pipe_file(path, content)
+            return
+
+        # The table was partitioned before, its directory is only removed once the new table is stored aside
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        fs.pipe_file(tmp_path, content)
+        fs.rm(path, recursive=True)
+        fs.mv(tmp_path, path)
+
+    @staticmethod
+    def write_partitioned(fs, path, data, partition_by):
+        # Everything that can fail on the data happens before the stored table is touched
+        table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+        # Spotify leaves out the fraction of some timestamps, so the strings are parsed as ISO 8601 one by one
+        timestamps = pd.to_datetime(table.column(partition_by).to_pandas(), utc=True, format='ISO8601')
+        timestamps = timestamps.sort_values(kind='stable')  # Missing timestamps go last
+        order = timestamps.index.to_numpy()
+        months = timestamps.dt.strftime('%Y-%m')
+        table = table.take(order).append_column(PARTITION_COLUMN, pa.array(months.to_numpy(), pa.string(), from_pandas=True))
+
+        # The files of this write are told apart from the previous ones by their name. The previous files,
+        # including months missing from the new data, are removed only once every new file is written, so
+        # the table is never missing. A failed write removes its own files.
+        write_prefix = f"part-{uuid.uuid4().hex}-"
+        # A table stored as a single file before is only replaced once its partitions are written aside
+        target = f"{path}.{write_prefix}tmp" if fs.isfile(path) else path
+        try:
+            pq.write_to_dataset(
+                table,
+                target,
+                partition_cols=[PARTITION_COLUMN],
+                filesystem=fs,
+                basename_template=write_prefix + '{i}.parquet',
+                existing_data_behavior='overwrite_or_ignore',  # Names are unique, nothing is overwritten
+                max_rows_per_group=ROW_GROUP_ROWS,
+                compression='snappy',
+            )
+        except Exception:
+            fs.invalidate_cache(target)
+            written = [name for name in fs.find(target) if name.rsplit('/', 1)[-1].startswith(write_prefix)]
+            if written:
+                fs.rm(written)
+            raise
 
+        if target != path:
+            fs.rm(path)
+            fs.mv(target, path, recursive=True)
+            return
+        fs.invalidate_cache(path)
+        previous = [name for name in fs.find(path) if not name.rsplit('/', 1)[-1].startswith(write_prefix)]
+        if previous:
+            fs.rm(previous)